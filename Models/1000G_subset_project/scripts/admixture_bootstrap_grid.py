@@ -0,0 +1,383 @@
+#!/usr/bin/env python3
+"""
+Purpose
+-------
+Parametric bootstrap LRT for ADMIXTURE K0 vs K0+1 on a thinned PLINK set, run as
+several small-thread replicates at once within a total core budget. Replaces the
+serial loop of admixture_bootstrap_grid.sh (which now just calls this script).
+
+Usage
+-----
+python scripts/admixture_bootstrap_grid.py \
+  --plink_prefix results/structure_ppp_sampled/ppp_sampled.thin \
+  --outroot results/admixture_bootstrap_grid \
+  --k_min 2 --k_max 3 --B 100 --cores 8 --threads 2
+
+Every option defaults to the environment variable the shell script read
+(PLINK_PREFIX, OUTROOT, K_MIN, K_MAX, B, CORES, THREADS, SEED, SEQUENTIAL, ALPHA,
+BC_H, FIT_CACHE, FIT_CACHE_MB).
+
+Outputs
+-------
+- OUTROOT/K{K0}_vs_K{K1}/obs.K{K}.{P,Q,log}, Tobs.txt, pvalue.txt
+- OUTROOT/K{K0}_vs_K{K1}/bootstrap.tsv   # rep, LL_K0, LL_K1, T (every finished rep, in rep order)
+- OUTROOT/K{K0}_vs_K{K1}/bootstrap.key   # seed and Tobs bootstrap.tsv belongs to
+- OUTROOT/K{K0}_vs_K{K1}/rep{NNNN}/      # sim.{bed,bim,fam}, K{K}.{P,Q,log}
+- OUTROOT/summary.tsv                    # K0 K1 Tobs LL_obs_K0 LL_obs_K1 B p_value dir
+- OUTROOT/run.log                        # progress, replicates/hour and ETA
+
+Notes
+-----
+- Observed fits use all --cores threads. Replicates run --cores // --threads at a
+  time with ADMIXTURE -j--threads each; ADMIXTURE scales poorly beyond a few threads.
+- Replicates are simulated from the observed K0 fit (p = Q P, A1 dosage ~ Binomial(2, p))
+  with genotype_sim.py and written straight to .bed with plink_bed.py, so PLINK is
+  no longer needed. Replicate r of K0 always uses the same random stream, and
+  ADMIXTURE is seeded with SEED + r, so results do not depend on scheduling.
+- Only one run per OUTROOT: a second run exits while OUTROOT/.bootstrap.lock is held.
+- With SEQUENTIAL=1 a transition stops once its p-value is decided at ALPHA
+  (Besag-Clifford / curtailment on the replicates in rep order, see
+  sequential_pvalue.py); exceedance is T >= Tobs, as in the shell script.
+- Fits go through the fit cache (fit_cache.py) unless FIT_CACHE=none.
+- Finished replicates are appended to bootstrap.tsv as they complete, and a rerun
+  with the same seed and Tobs resumes from it, running only the missing reps.
+- A replicate that fails is logged and skipped; the others still run. The p-value
+  uses the finished reps (B in summary.tsv is their number); with SEQUENTIAL=1 it is
+  NA unless the rule already stopped before the failed rep. The run then exits
+  non-zero, so rerunning retries only the failed reps.
+"""
+
+import argparse, fcntl, os, re, shutil, subprocess, sys, time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from datetime import datetime
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, os.pardir))
+from genotype_sim import iter_genotype_chunks
+from plink_bed import write_bed_chunks
+from sequential_pvalue import besag_clifford_h, sequential_pvalue
+from fit_cache import FitCache, export_fit, fit_key, hash_bed
+
+
+class RunLog:
+    """Appends timestamped lines to run.log."""
+
+    def __init__(self, path):
+        self.path = path
+
+    def __call__(self, msg, stamp=False):
+        with open(self.path, "a") as fh:
+            fh.write(f"[{datetime.now():%c}] {msg}\n" if stamp else f"{msg}\n")
+
+
+def get_ll(log_path):
+    """Last 'Loglikelihood: X' value in an ADMIXTURE log."""
+    ll = None
+    with open(log_path) as fh:
+        for line in fh:
+            m = re.search(r"Loglikelihood:\s*([-+\d.eE]+)", line)
+            if m:
+                ll = float(m.group(1))
+    if ll is None:
+        raise RuntimeError(f"Loglikelihood not found in {log_path}")
+    return ll
+
+
+def fit_admixture(bfile, K, seed, out, threads, cache):
+    """
+    Fits ADMIXTURE to bfile.{bed,bim,fam} (or reuses a cached fit of the same data,
+    K and seed) and leaves out.P, out.Q and out.log. Returns the log-likelihood.
+    """
+    key = None
+    if cache is not None:
+        key = fit_key(hash_bed(bfile), K, seed=seed, backend="admixture")
+        entry = cache.get(key)
+        if entry is not None:
+            export_fit(entry, out, key)
+            return entry["loglik"]
+
+    workdir, base = os.path.split(bfile)
+    with open(f"{out}.log", "w") as log:
+        subprocess.run(["admixture", f"-j{threads}", "--seed", str(seed), f"{base}.bed", str(K)],
+                       cwd=workdir or ".", stdout=log, stderr=subprocess.STDOUT, check=True)
+    shutil.move(f"{bfile}.{K}.P", f"{out}.P")
+    shutil.move(f"{bfile}.{K}.Q", f"{out}.Q")
+    ll = get_ll(f"{out}.log")
+    if cache is not None:
+        cache.put(key, ll, np.loadtxt(f"{out}.P", ndmin=2), np.loadtxt(f"{out}.Q", ndmin=2))
+    return ll
+
+
+def simulate_replicate(bfile, Q, P, seed, rep, out):
+    """
+    Writes replicate rep simulated under (Q, P) as out.{bed,bim,fam}, reusing the
+    observed .bim/.fam. P is the ADMIXTURE .P (L x K) A1 frequency.
+    """
+    # genotype_sim counts allele-1 copies, which plink_bed writes as A2
+    freqs = np.stack([P.T, 1 - P.T], axis=2)
+    chunks = (block[0] for _, _, block in
+              iter_genotype_chunks(Q, freqs, 1, seed=seed, chunk_loci=4096, first_replicate=rep))
+    write_bed_chunks(chunks, out)
+    shutil.copyfile(f"{bfile}.bim", f"{out}.bim")
+    shutil.copyfile(f"{bfile}.fam", f"{out}.fam")
+
+
+def run_replicate(cfg, cache, DIR, K0, Q, P, rep):
+    """Simulates and fits one replicate. Returns (rep, LL_K0, LL_K1, T)."""
+    RDIR = os.path.join(DIR, f"rep{rep:04d}")
+    os.makedirs(RDIR, exist_ok=True)
+    sim = os.path.join(RDIR, "sim")
+    simulate_replicate(cfg.plink_prefix, Q, P, np.random.SeedSequence([cfg.seed, K0]), rep, sim)
+    rep_seed = cfg.seed + rep
+    ll0 = fit_admixture(sim, K0, rep_seed, os.path.join(RDIR, f"K{K0}"), cfg.threads, cache)
+    ll1 = fit_admixture(sim, K0 + 1, rep_seed, os.path.join(RDIR, f"K{K0 + 1}"), cfg.threads, cache)
+    return rep, ll0, ll1, -2.0 * (ll0 - ll1)
+
+
+TSV_HEADER = "rep\tLL_K0\tLL_K1\tT\n"
+
+
+def load_replicates(tsv, key_path, seed, Tobs, log):
+    """
+    {rep: (LL_K0, LL_K1, T)} of a previous run's bootstrap.tsv. key_path records the
+    seed and Tobs the table was made with; if they differ (new data or seed), the
+    table is discarded and {} returned. Truncated or malformed lines are ignored.
+    """
+    key = f"seed={seed}\tTobs={Tobs!r}\n"
+    old_key = None
+    if os.path.exists(key_path):
+        with open(key_path) as fh:
+            old_key = fh.read()
+    done = {}
+    if old_key == key and os.path.exists(tsv):
+        with open(tsv) as fh:
+            for line in fh:
+                parts = line.rstrip("\n").split("\t")
+                try:
+                    done[int(parts[0])] = tuple(float(x) for x in parts[1:4])
+                except (ValueError, IndexError):
+                    continue
+    elif os.path.exists(tsv):
+        log(f"  [resume] {tsv} was made with another seed or Tobs; starting it over")
+    # Rewritten clean, so rows appended by this run never follow a truncated line
+    write_replicates(tsv, done)
+    if old_key != key:
+        with open(key_path, "w") as fh:
+            fh.write(key)
+    return done
+
+
+def write_replicates(tsv, done):
+    """Rewrites bootstrap.tsv with every finished replicate in rep order."""
+    tmp = f"{tsv}.tmp"
+    with open(tmp, "w") as fh:
+        fh.write(TSV_HEADER)
+        for rep in sorted(done):
+            ll0, ll1, Tb = done[rep]
+            fh.write(f"{rep}\t{ll0!r}\t{ll1!r}\t{Tb!r}\n")
+    os.replace(tmp, tsv)
+
+
+def fmt_duration(seconds):
+    seconds = int(max(0, seconds))
+    h, rem = divmod(seconds, 3600)
+    return f"{h}h{rem // 60:02d}m"
+
+
+class Progress:
+    """Replicate throughput over the whole grid, for the run.log ETA lines."""
+
+    def __init__(self, total):
+        self.total = total
+        self.done = 0
+        self.start = time.time()
+
+    def tick(self):
+        self.done += 1
+        elapsed = time.time() - self.start
+        rate = self.done / elapsed * 3600 if elapsed > 0 else float("inf")
+        eta = (self.total - self.done) / rate * 3600 if rate > 0 else 0
+        return f"{rate:.1f} reps/h, ETA {fmt_duration(eta)}"
+
+    def skip(self, n):
+        # Replicates not run because a transition stopped early
+        self.total -= n
+
+
+def run_transition(cfg, cache, log, progress, K0, summary):
+    K1 = K0 + 1
+    DIR = os.path.join(cfg.outroot, f"K{K0}_vs_K{K1}")
+    os.makedirs(DIR, exist_ok=True)
+    log(f"Observed fits: K={K0}, {K1}", stamp=True)
+
+    # The K1 fit is reused from the cache as the next transition's K0 fit
+    LL0 = fit_admixture(cfg.plink_prefix, K0, cfg.seed, os.path.join(DIR, f"obs.K{K0}"), cfg.cores, cache)
+    LL1 = fit_admixture(cfg.plink_prefix, K1, cfg.seed, os.path.join(DIR, f"obs.K{K1}"), cfg.cores, cache)
+    Tobs = -2.0 * (LL0 - LL1)
+    log(f"  [obs] K{K0}: {LL0!r}  K{K1}: {LL1!r}  => Tobs={Tobs!r}")
+    with open(os.path.join(DIR, "Tobs.txt"), "w") as fh:
+        fh.write(f"{Tobs!r}\n")
+
+    Q = np.loadtxt(os.path.join(DIR, f"obs.K{K0}.Q"), ndmin=2)
+    P = np.loadtxt(os.path.join(DIR, f"obs.K{K0}.P"), ndmin=2)
+
+    TSV = os.path.join(DIR, "bootstrap.tsv")
+    done = load_replicates(TSV, os.path.join(DIR, "bootstrap.key"), cfg.seed, Tobs, log)
+    resumed = sum(1 for rep in done if rep <= cfg.B)
+    if resumed:
+        log(f"  [resume] {resumed} replicates from {TSV}")
+        progress.skip(resumed)
+    todo = iter([rep for rep in range(1, cfg.B + 1) if rep not in done])
+    n_prefix = 0       # reps 1..n_prefix have all finished
+    ran = 0
+    decision = None
+
+    def advance():
+        # Sequential stopping needs the replicates in rep order: 1..n without gaps
+        nonlocal n_prefix, decision
+        while decision is None and n_prefix < cfg.B and n_prefix + 1 in done:
+            n_prefix += 1
+            if cfg.sequential:
+                flags = [done[rep][2] >= Tobs for rep in range(1, n_prefix + 1)]
+                decided, n, p = sequential_pvalue(flags, cfg.B, cfg.alpha, cfg.bc_h)
+                if decided is not None and n < cfg.B:
+                    decision = (decided, n, p)
+                    log(f"    [sequential] stop after {n_prefix} reps: {decided}")
+
+    advance()
+    with open(TSV, "a") as tsv, ThreadPoolExecutor(max_workers=cfg.jobs) as pool:
+        if tsv.tell() == 0:
+            tsv.write(TSV_HEADER)
+            tsv.flush()
+        running = {}
+        next_rep = next(todo, None)
+        while decision is None and (running or next_rep is not None):
+            while next_rep is not None and len(running) < cfg.jobs:
+                running[pool.submit(run_replicate, cfg, cache, DIR, K0, Q, P, next_rep)] = next_rep
+                next_rep = next(todo, None)
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for fut in finished:
+                rep = running.pop(fut)
+                ran += 1
+                try:
+                    _, ll0, ll1, Tb = fut.result()
+                except Exception as e:
+                    # The other replicates keep running; this one is left for the next run
+                    log(f"    [rep {rep}/{cfg.B}] FAILED: {e} | {progress.tick()}")
+                    continue
+                # Every finished rep is kept (in finishing order) so a rerun resumes from it
+                done[rep] = (ll0, ll1, Tb)
+                tsv.write(f"{rep}\t{ll0!r}\t{ll1!r}\t{Tb!r}\n")
+                tsv.flush()
+                log(f"    [rep {rep}/{cfg.B}] T={Tb!r} | {progress.tick()}")
+            advance()
+        for fut in running:
+            fut.cancel()
+    if decision is not None:
+        progress.skip(cfg.B - resumed - ran)
+    write_replicates(TSV, done)
+
+    reps = [rep for rep in range(1, cfg.B + 1) if rep in done]
+    missing = [rep for rep in range(1, cfg.B + 1) if rep not in done]
+    incomplete = decision is None and bool(missing)
+    if decision is not None:
+        B_used, pval = decision[1], f"{decision[2]:.6f}"
+    elif incomplete and cfg.sequential:
+        # The sequential p-value needs reps 1..n in order; it waits for the missing reps
+        B_used, pval = n_prefix, "NA"
+    elif reps:
+        B_used, pval = len(reps), f"{np.mean(np.array([done[r][2] for r in reps]) >= Tobs):.6f}"
+    else:
+        B_used, pval = 0, "NA"
+    with open(os.path.join(DIR, "pvalue.txt"), "w") as fh:
+        fh.write(f"{pval}\n")
+    # B column holds the number of replicates actually used (< B when stopped early)
+    with open(summary, "a") as fh:
+        fh.write(f"{K0}\t{K1}\t{Tobs!r}\t{LL0!r}\t{LL1!r}\t{B_used}\t{pval}\t{DIR}\n")
+    if incomplete:
+        log(f"  [incomplete] K{K0}->K{K1}: p={pval} (B={B_used}); reps {' '.join(map(str, missing))} "
+            f"failed; rerun to run only those")
+    else:
+        log(f"  [done] K{K0}->K{K1}: p={pval} (B={B_used})")
+    return not incomplete
+
+
+def parse_args():
+    env = os.environ.get
+    p = argparse.ArgumentParser(description="Parallel ADMIXTURE parametric bootstrap over K0 -> K0+1")
+    p.add_argument("--plink_prefix", default=env("PLINK_PREFIX", "results/structure_ppp_sampled/ppp_sampled.thin"))
+    p.add_argument("--outroot", default=env("OUTROOT", "results/admixture_bootstrap_grid"))
+    p.add_argument("--k_min", type=int, default=int(env("K_MIN", 2)))
+    p.add_argument("--k_max", type=int, default=int(env("K_MAX", 3)),
+                   help="Inclusive upper bound; transitions run K0=k_min..k_max-1")
+    p.add_argument("--B", type=int, default=int(env("B", 100)), help="Bootstrap replicates")
+    p.add_argument("--cores", type=int, default=int(env("CORES", 8)), help="Total core budget")
+    p.add_argument("--threads", type=int, default=int(env("THREADS", 2)),
+                   help="ADMIXTURE threads per replicate; cores // threads replicates run at once")
+    p.add_argument("--seed", type=int, default=int(env("SEED", 12345)))
+    p.add_argument("--sequential", action="store_true", default=env("SEQUENTIAL", "0") == "1")
+    p.add_argument("--alpha", type=float, default=float(env("ALPHA", 0.05)))
+    p.add_argument("--bc_h", type=int, default=int(env("BC_H")) if env("BC_H") else None,
+                   help="Besag-Clifford exceedance count (default floor(alpha*B)+1)")
+    p.add_argument("--fit_cache", default=env("FIT_CACHE") or None,
+                   help="Fit cache dir (default OUTROOT/fit_cache; 'none' disables)")
+    p.add_argument("--fit_cache_mb", type=float, default=float(env("FIT_CACHE_MB", 2048)))
+    args = p.parse_args()
+    args.threads = max(1, min(args.threads, args.cores))
+    args.jobs = max(1, args.cores // args.threads)
+    if args.bc_h is None:
+        args.bc_h = besag_clifford_h(args.alpha, args.B)
+    return args
+
+
+def main():
+    cfg = parse_args()
+    if shutil.which("admixture") is None:
+        sys.exit("Missing: admixture")
+    prefix = cfg.plink_prefix
+    if not all(os.path.isfile(f"{prefix}.{ext}") for ext in ("bed", "bim", "fam")):
+        sys.exit(f"Missing PLINK files: {prefix}.{{bed,bim,fam}}")
+    cfg.plink_prefix = os.path.abspath(prefix)
+
+    os.makedirs(cfg.outroot, exist_ok=True)
+    cfg.outroot = os.path.abspath(cfg.outroot)
+    log = RunLog(os.path.join(cfg.outroot, "run.log"))
+
+    # Lock (avoid duplicate runs)
+    lock_path = os.path.join(cfg.outroot, ".bootstrap.lock")
+    lock = open(lock_path, "w")
+    try:
+        fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        log(f"[lock] Another bootstrap run is already in progress: {lock_path}", stamp=True)
+        sys.exit(1)
+
+    try:
+        cache = None
+        if cfg.fit_cache != "none":
+            cache = FitCache(cfg.fit_cache or os.path.join(cfg.outroot, "fit_cache"),
+                             max_bytes=cfg.fit_cache_mb * 2**20)
+
+        log(f"Bootstrap grid: K_MIN={cfg.k_min} K_MAX={cfg.k_max} B={cfg.B} CORES={cfg.cores} "
+            f"THREADS={cfg.threads} JOBS={cfg.jobs} SEQUENTIAL={int(cfg.sequential)} "
+            f"ALPHA={cfg.alpha} BC_H={cfg.bc_h}", stamp=True)
+
+        summary = os.path.join(cfg.outroot, "summary.tsv")
+        with open(summary, "w") as fh:
+            fh.write("K0\tK1\tTobs\tLL_obs_K0\tLL_obs_K1\tB\tp_value\tdir\n")
+
+        k0_values = range(cfg.k_min, cfg.k_max)
+        progress = Progress(len(k0_values) * cfg.B)
+        incomplete = [K0 for K0 in k0_values
+                      if not run_transition(cfg, cache, log, progress, K0, summary)]
+
+        log(f"[summary] {summary}", stamp=True)
+        if incomplete:
+            sys.exit(f"Failed replicates in K0={', '.join(map(str, incomplete))}; see {log.path}")
+    finally:
+        os.remove(lock_path)
+        lock.close()
+
+if __name__ == "__main__":
+    main()
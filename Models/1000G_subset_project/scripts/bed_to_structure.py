@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+"""
+Purpose
+-------
+Convert a PLINK .bed/.bim/.fam set straight to STRUCTURE input, with matching
+mainparams/extraparams, for one or several thinning levels or locus subsets from a
+single decode. Replaces `plink --thin-count` + `plink --recode structure` and the
+`wc -l` NUMINDS/NUMLOCI lookups in run_structure_ppp_sampled.pbs.
+
+Usage
+-----
+python scripts/bed_to_structure.py \
+  --bfile results/structure_ppp_sampled/ppp_sampled.pruned \
+  --out   results/structure_ppp_sampled/ppp_sampled.thin \
+  --thin_count 30000 --seed 12345 --write_bed
+
+# several levels in one pass; {n} in --out is replaced by the level name
+python scripts/bed_to_structure.py --bfile ppp_sampled.pruned \
+  --out ppp_sampled.thin{n} --thin_count 30000 10000 5000 --subset chr1_snps.txt
+
+# first level as ppp_sampled.thin.*, the others as ppp_sampled.thin{n}.*
+python scripts/bed_to_structure.py --bfile ppp_sampled.pruned \
+  --main_out ppp_sampled.thin --out ppp_sampled.thin{n} --thin_count 30000 10000 5000
+
+Outputs (per level, PREFIX = --out with {n} filled in, or --main_out for the first)
+-------
+- PREFIX.str           # STRUCTURE input: marker names, map distances, one row per sample
+- PREFIX.mainparams    # NUMINDS/NUMLOCI/INFILE filled in
+- PREFIX.extraparams
+- PREFIX.{bed,bim,fam} # with --write_bed: the same loci as a PLINK set (for ADMIXTURE)
+
+Notes
+-----
+- The .bed is memory-mapped and only the rows of selected loci are decoded, in
+  blocks of --block_loci, using genotype_store.unpack_rows().
+- Thinning draws one random permutation (--seed), and level N keeps its first N
+  loci in genome order, so smaller levels are nested in larger ones.
+- --subset FILE keeps the SNP IDs listed in FILE (one per line); the level is
+  named after the file stem.
+- Genotypes are written as 1 = A1 and 2 = A2 (missing 0 0), with label = IID and
+  one extra column (EXTRACOLS 1), the layout the PBS mainparams expect. Map
+  distances are -1 at the first locus of a chromosome, else the bp gap.
+- --updatefreq N adds UPDATEFREQ N to extraparams so the chains print Ln Like
+  every N iterations for convergence monitoring (MONITOR=1 in the PBS script).
+"""
+
+import argparse, os, sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, os.pardir,
+                                os.pardir, "tests_of_ghost_introgression_pipeline", "scripts"))
+from genotype_store import row_bytes, unpack_rows
+
+BED_MAGIC = bytes([0x6C, 0x1B, 0x01])
+
+# Allele-2 count (3 = missing) -> STRUCTURE allele pair (A1 = 1, A2 = 2)
+_PAIRS = np.array(["1 1", "1 2", "2 2", "0 0"])
+
+
+def read_plink(bfile):
+    with open(f"{bfile}.fam") as fh:
+        fam = [line.split() for line in fh if line.strip()]
+    with open(f"{bfile}.bim") as fh:
+        bim = [line.split() for line in fh if line.strip()]
+    bed = np.memmap(f"{bfile}.bed", dtype=np.uint8, mode="r")
+    if bytes(bed[:3]) != BED_MAGIC:
+        sys.exit(f"{bfile}.bed is not a SNP-major PLINK .bed")
+    n_bytes = row_bytes(len(fam))
+    body = bed[3:3 + len(bim) * n_bytes].reshape(len(bim), n_bytes)
+    return fam, bim, body
+
+
+def select_levels(bim, thin_counts, subsets, seed):
+    """Returns [(name, sorted locus indices)] for every thin count and subset file."""
+    L = len(bim)
+    levels = []
+    if thin_counts:
+        order = np.random.default_rng(seed).permutation(L)
+        for n in thin_counts:
+            if n > L:
+                print(f"[warn] thin count {n} > {L} loci; keeping all loci")
+            levels.append((str(n), np.sort(order[:min(n, L)])))
+    index = {row[1]: i for i, row in enumerate(bim)}
+    for path in subsets:
+        with open(path) as fh:
+            ids = [line.strip() for line in fh if line.strip()]
+        missing = [snp for snp in ids if snp not in index]
+        if missing:
+            print(f"[warn] {path}: {len(missing)} IDs not in .bim (e.g. {missing[0]})")
+        idx = np.unique([index[snp] for snp in ids if snp in index]).astype(np.int64)
+        levels.append((os.path.splitext(os.path.basename(path))[0], idx))
+    if not levels:
+        levels.append(("all", np.arange(L)))
+    return levels
+
+
+def decode_loci(body, n_individuals, loci, block_loci):
+    """(I, len(loci)) allele-2 counts for sorted locus indices, decoded block by block."""
+    G = np.empty((n_individuals, len(loci)), dtype=np.uint8)
+    for start in range(0, len(loci), block_loci):
+        idx = loci[start:start + block_loci]
+        G[:, start:start + len(idx)] = unpack_rows(body[idx], n_individuals)
+    return G
+
+
+def map_distances(bim_rows):
+    chrom = np.array([r[0] for r in bim_rows])
+    bp = np.array([int(r[3]) for r in bim_rows], dtype=np.int64)
+    dist = np.diff(bp, prepend=0)
+    new_chrom = np.ones(len(chrom), dtype=bool)
+    new_chrom[1:] = chrom[1:] != chrom[:-1]
+    dist[new_chrom] = -1
+    return dist
+
+
+def write_structure(path, fam, bim_rows, G):
+    with open(path, "w") as out:
+        out.write(" ".join(r[1] for r in bim_rows) + "\n")
+        out.write(" ".join(map(str, map_distances(bim_rows))) + "\n")
+        for i, row in enumerate(fam):
+            out.write(f"{row[1]} 1 " + " ".join(_PAIRS[G[i]]) + "\n")
+
+
+def write_mainparams(path, infile, outfile, n_inds, n_loci, burnin, numreps, maxpops):
+    with open(path, "w") as f:
+        f.write(f"""#define MAXPOPS     {maxpops}
+#define BURNIN      {burnin}
+#define NUMREPS     {numreps}
+#define INFILE      {infile}
+#define OUTFILE     {outfile}
+#define NUMINDS     {n_inds}
+#define NUMLOCI     {n_loci}
+#define PLOIDY      2
+#define MISSING     0
+#define ONEROWPERIND 1
+#define LABEL       1
+#define EXTRACOLS   1
+#define POPDATA     0
+#define POPFLAG     0
+#define LOCDATA     0
+#define PHENOTYPE   0
+#define MARKERNAMES 1
+#define MAPDISTANCES 1
+""")
+
+
+def write_extraparams(path, updatefreq=None):
+    with open(path, "w") as f:
+        if updatefreq:
+            f.write(f"#define UPDATEFREQ  {updatefreq}\n")
+        f.write("""#define NOADMIX     0
+#define LINKAGE     0
+#define USEPOPINFO  0
+#define LOCPRIOR    0
+#define INFERALPHA  1
+#define ALPHA       1.0
+#define POPALPHAS   0
+#define FREQSCORR   1
+#define ONEFST      0
+#define COMPUTEPROB 1
+#define PRINTQHAT   1
+#define PRINTLIKES  1
+#define ECHODATA    0
+#define RANDOMIZE   0
+""")
+
+
+def write_plink_subset(prefix, bfile, body, bim, loci):
+    with open(f"{prefix}.bed", "wb") as out:
+        out.write(BED_MAGIC)
+        out.write(np.ascontiguousarray(body[loci]).tobytes())
+    with open(f"{prefix}.bim", "w") as out:
+        out.writelines("\t".join(bim[l]) + "\n" for l in loci)
+    with open(f"{bfile}.fam") as src, open(f"{prefix}.fam", "w") as out:
+        out.write(src.read())
+
+
+def main():
+    p = argparse.ArgumentParser(description="Streaming PLINK .bed -> STRUCTURE input converter")
+    p.add_argument("--bfile", required=True, help="PLINK prefix (.bed/.bim/.fam)")
+    p.add_argument("--out", required=True, help="Output prefix; must contain {n} for several levels")
+    p.add_argument("--main_out", default=None,
+                   help="Output prefix of the first level (first --thin_count) instead of --out")
+    p.add_argument("--thin_count", type=int, nargs="*", default=[], help="Random thinning level(s)")
+    p.add_argument("--subset", nargs="*", default=[], help="SNP ID list file(s), one level each")
+    p.add_argument("--seed", type=int, default=12345, help="Seed of the thinning permutation")
+    p.add_argument("--burnin", type=int, default=50000)
+    p.add_argument("--numreps", type=int, default=200000)
+    p.add_argument("--maxpops", type=int, default=10)
+    p.add_argument("--structure_out", default=None,
+                   help="OUTFILE in mainparams (default: structure_out next to the output)")
+    p.add_argument("--updatefreq", type=int, default=None,
+                   help="UPDATEFREQ in extraparams (Ln Like rows for structure_convergence.py)")
+    p.add_argument("--write_bed", action="store_true", help="Also write each level as a PLINK set")
+    p.add_argument("--block_loci", type=int, default=4096)
+    args = p.parse_args()
+
+    fam, bim, body = read_plink(args.bfile)
+    levels = select_levels(bim, args.thin_count, args.subset, args.seed)
+    if len(levels) > (2 if args.main_out else 1) and "{n}" not in args.out:
+        p.error("--out needs a {n} placeholder when writing several levels")
+
+    # One decode of every locus any level needs
+    union = np.unique(np.concatenate([idx for _, idx in levels])).astype(np.int64)
+    G = decode_loci(body, len(fam), union, args.block_loci)
+    print(f"[decode] {len(fam)} samples x {len(union)} loci from {args.bfile}.bed")
+
+    for i, (name, idx) in enumerate(levels):
+        prefix = args.main_out if args.main_out and i == 0 else args.out.replace("{n}", name)
+        os.makedirs(os.path.dirname(os.path.abspath(prefix)), exist_ok=True)
+        cols = np.searchsorted(union, idx)
+        rows = [bim[l] for l in idx]
+        str_file = os.path.abspath(f"{prefix}.str")
+        write_structure(str_file, fam, rows, G[:, cols])
+        structure_out = args.structure_out or os.path.join(os.path.dirname(str_file), "structure_out")
+        write_mainparams(f"{prefix}.mainparams", str_file, structure_out, len(fam), len(idx),
+                         args.burnin, args.numreps, args.maxpops)
+        write_extraparams(f"{prefix}.extraparams", args.updatefreq)
+        if args.write_bed:
+            write_plink_subset(prefix, args.bfile, body, bim, idx)
+        print(f"[level {name}] {len(fam)} individuals, {len(idx)} loci -> {prefix}.str")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,371 @@
+#!/usr/bin/env python3
+"""
+Purpose
+-------
+Download the 1000 Genomes Phase 3 (20130502) per-chromosome VCFs and panel, build
+the CEU+CHS sample list, and subset every chromosome to those samples, several
+chromosomes at a time. Replaces the serial loop of download_and_subset_chr1to22.sh
+(which now just calls this script).
+
+Usage
+-----
+python scripts/download_and_subset_chr1to22.py                 # chr1..22
+python scripts/download_and_subset_chr1to22.py 1 2 10 --jobs 3
+OFFLINE=1 python scripts/download_and_subset_chr1to22.py       # only data/raw, no network
+
+Every option defaults to the environment variable the shell script read
+(THREADS, MAKE_TBI) or a new one (JOBS, IO_JOBS, DOWNLOAD_JOBS, OFFLINE, VERIFY).
+
+Inputs (fetched if missing, unless --offline)
+------
+- data/panel/integrated_call_samples_v3.20130502.ALL.panel
+- data/raw/ALL.chrN.phase3_shapeit2_mvncall_integrated_v5b.20130502.genotypes.vcf.gz (+ .tbi)
+
+Outputs
+-------
+- data/panel/ceu_chs_samples.txt           # sample IDs for CEU+CHS
+- data/subsets/CEU_CHS.chrN.vcf.gz         # + .tbi (MAKE_TBI=1) or .csi
+- data/subsets/manifest.json               # one entry per finished chromosome:
+                                           #   output size/mtime/sha256, record and sample
+                                           #   counts, source size/mtime, sample-list hash,
+                                           #   seconds and throughput
+- logs/subset_chr1to22.log                 # per-chromosome progress and throughput
+
+Notes
+-----
+- Chromosomes are subset largest first (raw VCF size, else GRCh37 length), on
+  --jobs bcftools processes with --threads compression threads each. --jobs
+  defaults to cores // (threads + 1), capped at --io_jobs because every job
+  streams a whole VCF from disk. Downloads run on their own --download_jobs
+  workers, and each chromosome is queued for subsetting as soon as its VCF is present.
+- A chromosome is redone only when its manifest entry no longer matches. It is
+  redone if the output or its index is missing, the output size/mtime changed,
+  the raw VCF (when present) changed, or the sample list changed. --verify also
+  re-hashes each output against its recorded sha256. Outputs are written to a
+  temporary name and renamed only after indexing, so an interrupted run leaves
+  nothing that looks finished.
+- Outputs written before the manifest existed (by the old shell loop) are
+  adopted when they have an index and exactly the expected samples.
+- With --offline nothing is downloaded. Chromosomes without a raw VCF in
+  data/raw are reported and skipped, and the panel is only needed if the
+  sample list does not exist yet.
+"""
+
+import argparse, hashlib, json, os, shutil, subprocess, sys, threading, time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+
+BASE_URL = "https://ftp.1000genomes.ebi.ac.uk/vol1/ftp/release/20130502"
+PANEL_NAME = "integrated_call_samples_v3.20130502.ALL.panel"
+WGET_OPTS = ["-q", "-c", "--retry-connrefused", "--waitretry=1", "--read-timeout=20", "--timeout=20", "--tries=5"]
+
+# GRCh37 lengths: scheduling order when a raw VCF is not downloaded yet
+GRCH37_LENGTH = {
+    "1": 249250621, "2": 243199373, "3": 198022430, "4": 191154276, "5": 180915260, "6": 171115067,
+    "7": 159138663, "8": 146364022, "9": 141213431, "10": 135534747, "11": 135006516, "12": 133851895,
+    "13": 115169878, "14": 107349540, "15": 102531392, "16": 90354753, "17": 81195210, "18": 78077248,
+    "19": 59128983, "20": 63025520, "21": 48129895, "22": 51304566,
+}
+
+
+class RunLog:
+    """Prints and appends timestamped lines to the log file (thread-safe)."""
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+
+    def __call__(self, msg):
+        line = f"[{datetime.now():%c}] {msg}"
+        with self.lock:
+            print(line, flush=True)
+            with open(self.path, "a") as fh:
+                fh.write(line + "\n")
+
+
+class Manifest:
+    """manifest.json of finished chromosomes; rewritten atomically after every change."""
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        try:
+            with open(path) as fh:
+                self.entries = json.load(fh)
+        except (OSError, ValueError):
+            self.entries = {}
+
+    def get(self, chrom):
+        return self.entries.get(chrom)
+
+    def put(self, chrom, entry):
+        with self.lock:
+            self.entries[chrom] = entry
+            tmp = f"{self.path}.tmp"
+            with open(tmp, "w") as fh:
+                json.dump(dict(sorted(self.entries.items(), key=lambda kv: _chrom_order(kv[0]))), fh, indent=1)
+            os.replace(tmp, self.path)
+
+
+def _chrom_order(chrom):
+    return (0, int(chrom), "") if chrom.isdigit() else (1, 0, chrom)
+
+
+def sha256(path, bufsize=1 << 22):
+    h = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for block in iter(lambda: fh.read(bufsize), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def wget(url, dest):
+    """Downloads url to dest through a .part file, so dest only exists when complete."""
+    part = f"{dest}.part"
+    subprocess.run(["wget", *WGET_OPTS, "-O", part, url], check=True)
+    os.replace(part, dest)
+
+
+def query_samples(vcf):
+    out = subprocess.run(["bcftools", "query", "-l", vcf], check=True, capture_output=True, text=True).stdout
+    return out.split()
+
+
+def count_records(vcf):
+    out = subprocess.run(["bcftools", "index", "--nrecords", vcf], capture_output=True, text=True)
+    return int(out.stdout.strip()) if out.returncode == 0 and out.stdout.strip().isdigit() else None
+
+
+def read_samples(path):
+    with open(path) as fh:
+        return [line.strip() for line in fh if line.strip()]
+
+
+def build_sample_list(panel, path):
+    """CEU+CHS IDs of the panel (column 1 where column 2 is CEU or CHS), sorted and unique."""
+    ids = set()
+    with open(panel) as fh:
+        for line in fh:
+            fields = line.rstrip("\r\n").split()
+            if len(fields) >= 2 and fields[1] in ("CEU", "CHS"):
+                ids.add(fields[0])
+    with open(path, "w") as fh:
+        fh.writelines(f"{s}\n" for s in sorted(ids))
+
+
+class Chromosome:
+    """Paths of one chromosome's raw input and subset output."""
+
+    def __init__(self, cfg, chrom):
+        self.chrom = chrom
+        self.name = f"ALL.chr{chrom}.phase3_shapeit2_mvncall_integrated_v5b.20130502.genotypes.vcf.gz"
+        self.vcf = os.path.join(cfg.raw_dir, self.name)
+        self.out = os.path.join(cfg.out_dir, f"CEU_CHS.chr{chrom}.vcf.gz")
+        self.index = self.out + (".tbi" if cfg.make_tbi else ".csi")
+
+    def size_hint(self):
+        return os.path.getsize(self.vcf) if os.path.exists(self.vcf) else GRCH37_LENGTH.get(self.chrom, 0)
+
+
+def entry_current(cfg, c, entry, samples_hash):
+    """True if the manifest entry of c still describes its output, source and sample list."""
+    if not entry or not os.path.exists(c.out) or not os.path.exists(c.index):
+        return False
+    st = os.stat(c.out)
+    if entry.get("size") != st.st_size or entry.get("mtime_ns") != st.st_mtime_ns:
+        return False
+    if entry.get("samples_sha256") != samples_hash:
+        return False
+    if os.path.exists(c.vcf):
+        src = os.stat(c.vcf)
+        if entry.get("source_size") != src.st_size or entry.get("source_mtime_ns") != src.st_mtime_ns:
+            return False
+    return not cfg.verify or sha256(c.out) == entry.get("sha256")
+
+
+def make_entry(c, samples_hash, n_samples, seconds):
+    st = os.stat(c.out)
+    entry = {"output": os.path.basename(c.out), "size": st.st_size, "mtime_ns": st.st_mtime_ns,
+             "sha256": sha256(c.out), "index": os.path.basename(c.index), "records": count_records(c.out),
+             "samples": n_samples, "samples_sha256": samples_hash, "seconds": round(seconds, 1)}
+    if os.path.exists(c.vcf):
+        src = os.stat(c.vcf)
+        entry.update(source=c.name, source_size=src.st_size, source_mtime_ns=src.st_mtime_ns)
+        if seconds > 0:
+            entry["input_mb_per_s"] = round(src.st_size / 2**20 / seconds, 2)
+    if seconds > 0 and entry["records"]:
+        entry["records_per_s"] = round(entry["records"] / seconds)
+    entry["finished"] = datetime.now().isoformat(timespec="seconds")
+    return entry
+
+
+def subset(cfg, log, manifest, c, wanted, samples_hash):
+    """Subsets one chromosome to the sample list and indexes it. Returns the manifest entry."""
+    present = set(query_samples(c.vcf))
+    overlap = len(wanted & present)
+    log(f"chr{c.chrom}: subsetting {c.name} ({os.path.getsize(c.vcf) / 2**30:.2f} GiB), "
+        f"{overlap}/{len(wanted)} listed samples in the VCF")
+    if overlap == 0:
+        raise RuntimeError(f"chr{c.chrom}: none of the listed samples are in {c.vcf}")
+
+    # bcftools names the index after the file it indexes, so index under the
+    # temporary name and rename both
+    tmp = os.path.join(cfg.out_dir, f".CEU_CHS.chr{c.chrom}.{os.getpid()}.tmp.vcf.gz")
+    tmp_index = tmp + os.path.splitext(c.index)[1]
+    start = time.time()
+    try:
+        subprocess.run(["bcftools", "view", "--samples-file", cfg.samples, "--threads", str(cfg.threads),
+                        "--output-type", "z", "--output", tmp, c.vcf], check=True)
+        subprocess.run(["bcftools", "index", *(["-t"] if cfg.make_tbi else []), "--threads", str(cfg.threads),
+                        tmp], check=True)
+        os.replace(tmp_index, c.index)
+        os.replace(tmp, c.out)
+    finally:
+        for path in (tmp, tmp_index):
+            if os.path.exists(path):
+                os.remove(path)
+    seconds = time.time() - start
+
+    entry = make_entry(c, samples_hash, overlap, seconds)
+    manifest.put(c.chrom, entry)
+    rate = f", {entry['records_per_s']} records/s" if "records_per_s" in entry else ""
+    log(f"chr{c.chrom}: wrote {os.path.basename(c.out)} ({entry['records']} records, {overlap} samples) "
+        f"in {seconds:.0f}s, {entry.get('input_mb_per_s', 0):.1f} MB/s in{rate}")
+    return entry
+
+
+def adopt(cfg, log, manifest, c, wanted, samples_hash):
+    """Records an output of the old shell loop if it is indexed and has exactly the expected samples."""
+    if not (os.path.exists(c.out) and os.path.exists(c.index)):
+        return False
+    try:
+        samples = set(query_samples(c.out))
+    except subprocess.CalledProcessError:
+        return False
+    if samples != wanted:
+        return False
+    manifest.put(c.chrom, make_entry(c, samples_hash, len(samples), 0.0))
+    log(f"chr{c.chrom}: adopted existing {os.path.basename(c.out)} into the manifest")
+    return True
+
+
+def fetch(cfg, log, c):
+    """Downloads the raw VCF and its .tbi of c if missing. Returns c."""
+    for path, name in ((c.vcf, c.name), (c.vcf + ".tbi", c.name + ".tbi")):
+        if not os.path.exists(path):
+            log(f"chr{c.chrom}: downloading {name}")
+            start = time.time()
+            wget(f"{BASE_URL}/{name}", path)
+            seconds = max(time.time() - start, 1e-9)
+            log(f"chr{c.chrom}: downloaded {name} ({os.path.getsize(path) / 2**20 / seconds:.1f} MB/s)")
+    return c
+
+
+def parse_args():
+    env = os.environ.get
+    project = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+    p = argparse.ArgumentParser(description="Parallel per-chromosome download and CEU+CHS subsetting of 1000G")
+    p.add_argument("chroms", nargs="*", help="Chromosomes to process (default 1..22)")
+    p.add_argument("--project_dir", default=env("PROJECT_DIR", project))
+    p.add_argument("--threads", type=int, default=int(env("THREADS", 0)),
+                   help="bcftools --threads per chromosome (0: compression on the main thread)")
+    p.add_argument("--jobs", type=int, default=int(env("JOBS")) if env("JOBS") else None,
+                   help="Chromosomes subset at once (default cores // (threads + 1), at most --io_jobs)")
+    p.add_argument("--io_jobs", type=int, default=int(env("IO_JOBS", 4)),
+                   help="Upper bound on concurrent VCF streams for the default --jobs")
+    p.add_argument("--download_jobs", type=int, default=int(env("DOWNLOAD_JOBS", 3)))
+    p.add_argument("--make_tbi", type=int, choices=(0, 1), default=int(env("MAKE_TBI", 1)),
+                   help="1: tabix .tbi index, 0: .csi")
+    p.add_argument("--offline", action="store_true", default=env("OFFLINE", "0") == "1",
+                   help="Never download; use what is in data/raw")
+    p.add_argument("--verify", action="store_true", default=env("VERIFY", "0") == "1",
+                   help="Re-hash finished outputs against the manifest")
+    args = p.parse_args()
+    args.chroms = args.chroms or [str(i) for i in range(1, 23)]
+    args.threads = max(0, args.threads)
+    if args.jobs is None:
+        args.jobs = min((os.cpu_count() or 1) // (args.threads + 1), args.io_jobs)
+    args.jobs = max(1, args.jobs)
+    args.raw_dir = os.path.join(args.project_dir, "data", "raw")
+    args.panel_dir = os.path.join(args.project_dir, "data", "panel")
+    args.out_dir = os.path.join(args.project_dir, "data", "subsets")
+    args.log_dir = os.path.join(args.project_dir, "logs")
+    args.panel = os.path.join(args.panel_dir, PANEL_NAME)
+    args.samples = os.path.join(args.panel_dir, "ceu_chs_samples.txt")
+    return args
+
+
+def main():
+    cfg = parse_args()
+    for d in (cfg.raw_dir, cfg.panel_dir, cfg.out_dir, cfg.log_dir):
+        os.makedirs(d, exist_ok=True)
+    need = ["bcftools"] + ([] if cfg.offline else ["wget"])
+    missing = [tool for tool in need if shutil.which(tool) is None]
+    if missing:
+        sys.exit(f"Missing dependency: {', '.join(missing)}")
+    log = RunLog(os.path.join(cfg.log_dir, "subset_chr1to22.log"))
+
+    if not os.path.exists(cfg.samples):
+        if not os.path.exists(cfg.panel):
+            if cfg.offline:
+                sys.exit(f"Offline and neither {cfg.samples} nor {cfg.panel} exists")
+            log(f"Downloading panel: {PANEL_NAME}")
+            wget(f"{BASE_URL}/{PANEL_NAME}", cfg.panel)
+        log(f"Building CEU+CHS sample list -> {cfg.samples}")
+        build_sample_list(cfg.panel, cfg.samples)
+    wanted = set(read_samples(cfg.samples))
+    samples_hash = sha256(cfg.samples)
+
+    manifest = Manifest(os.path.join(cfg.out_dir, "manifest.json"))
+    chroms = [Chromosome(cfg, chrom) for chrom in dict.fromkeys(cfg.chroms)]
+    todo = []
+    for c in chroms:
+        if entry_current(cfg, c, manifest.get(c.chrom), samples_hash):
+            log(f"chr{c.chrom}: up to date ({os.path.basename(c.out)})")
+        elif manifest.get(c.chrom) is None and adopt(cfg, log, manifest, c, wanted, samples_hash):
+            continue
+        elif cfg.offline and not os.path.exists(c.vcf):
+            log(f"chr{c.chrom}: [skip] offline and {c.name} not in {cfg.raw_dir}")
+        else:
+            todo.append(c)
+    todo.sort(key=Chromosome.size_hint, reverse=True)
+    log(f"{len(chroms) - len(todo)} chromosomes done or skipped, {len(todo)} to subset: "
+        f"JOBS={cfg.jobs} THREADS={cfg.threads} DOWNLOAD_JOBS={cfg.download_jobs} OFFLINE={int(cfg.offline)}")
+
+    start = time.time()
+    failed = []
+    with ThreadPoolExecutor(max_workers=cfg.jobs) as workers, \
+            ThreadPoolExecutor(max_workers=max(1, cfg.download_jobs)) as downloads:
+        # Each chromosome is queued for subsetting as soon as its download finishes
+        staged = {} if cfg.offline else {downloads.submit(fetch, cfg, log, c): c for c in todo}
+        jobs = {}
+        for item in (todo if cfg.offline else as_completed(staged)):
+            c = staged.get(item, item)
+            try:
+                if item in staged:
+                    item.result()
+            except (subprocess.CalledProcessError, OSError) as e:
+                log(f"chr{c.chrom}: [error] download failed: {e}")
+                failed.append(c.chrom)
+                continue
+            jobs[c.chrom] = workers.submit(subset, cfg, log, manifest, c, wanted, samples_hash)
+        done_bytes = 0
+        for chrom, fut in jobs.items():
+            try:
+                entry = fut.result()
+                done_bytes += entry.get("source_size", 0)
+            except (subprocess.CalledProcessError, OSError, RuntimeError) as e:
+                log(f"chr{chrom}: [error] {e}")
+                failed.append(chrom)
+
+    seconds = time.time() - start
+    if todo:
+        log(f"Subset {len(todo) - len(failed)} chromosomes in {seconds:.0f}s "
+            f"({done_bytes / 2**20 / max(seconds, 1e-9):.1f} MB/s of raw VCF overall)")
+    log(f"Done. Outputs in: {cfg.out_dir} (manifest: {manifest.path})")
+    if failed:
+        sys.exit(f"Failed chromosomes: {' '.join(sorted(failed, key=_chrom_order))}")
+
+
+if __name__ == "__main__":
+    main()
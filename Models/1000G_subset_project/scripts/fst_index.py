@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+"""
+Purpose
+-------
+Persistent per-site Weir & Cockerham FST components, so windowed FST for any
+WIN/STEP or region list is a binary search plus a prefix-sum difference instead
+of another pass over the VCFs. wc_fst.py writes the index (--index_dir) while it
+computes the default windows; this CLI reads it.
+
+Usage
+-----
+# windowed table, same columns and windows as wc_fst.py / ppp_fst_bin_and_sample.sh
+python scripts/fst_index.py windows --index data/fst/index --win 100000 --step 25000 \
+  --out data/fst/CEU_CHS.allchr.w100k_s25k.windowed.weir.fst
+
+# arbitrary regions (CHROM START END, 1-based inclusive; header line optional)
+python scripts/fst_index.py regions --index data/fst/index --regions regions.tsv --out regions.fst
+
+python scripts/fst_index.py info --index data/fst/index
+
+Index layout
+------------
+INDEX/<vcf name>.fstidx/meta.json        # source path/size/mtime, population hash, chromosomes
+INDEX/<vcf name>.fstidx/c<i>/*.npy       # chromosome i of meta.json "chroms":
+                                         #   pos, num, den (informative sites, position-sorted)
+                                         #   cs_num, cs_den, cs_fst (prefix sums, length n + 1)
+
+Notes
+-----
+- Arrays are memory-mapped; a window query touches two positions per window.
+- An index is only reused by wc_fst.py when its source VCF (size, mtime) and the
+  population lists are unchanged.
+- --filtered writes the N_VARIANTS > 0 / finite WEIGHTED_FST table as well
+  (windows without sites are never written).
+"""
+
+import argparse, glob, hashlib, json, os, re, shutil, sys
+
+import numpy as np
+
+HEADER = ["CHROM", "BIN_START", "BIN_END", "N_VARIANTS", "WEIGHTED_FST", "MEAN_FST"]
+ARRAYS = ("pos", "num", "den", "cs_num", "cs_den", "cs_fst")
+
+
+class ChromIndex:
+    """Position-sorted per-site components of one chromosome with their prefix sums."""
+
+    def __init__(self, pos, num, den, cs_num=None, cs_den=None, cs_fst=None):
+        self.pos, self.num, self.den = pos, num, den
+        prefix = lambda x: np.concatenate([[0.0], np.cumsum(x)])
+        self.cs_num = prefix(num) if cs_num is None else cs_num
+        self.cs_den = prefix(den) if cs_den is None else cs_den
+        self.cs_fst = prefix(num / den) if cs_fst is None else cs_fst
+
+    @classmethod
+    def load(cls, path):
+        return cls(*(np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r") for name in ARRAYS))
+
+    def save(self, path):
+        os.makedirs(path, exist_ok=True)
+        for name in ARRAYS:
+            np.save(os.path.join(path, f"{name}.npy"), np.asarray(getattr(self, name)))
+
+    def __len__(self):
+        return len(self.pos)
+
+    def query(self, starts, ends):
+        """(n, weighted, mean) for 1-based inclusive intervals [starts, ends]."""
+        lo = np.searchsorted(self.pos, starts, side="left")
+        hi = np.searchsorted(self.pos, ends, side="right")
+        n = hi - lo
+        with np.errstate(divide="ignore", invalid="ignore"):
+            weighted = (self.cs_num[hi] - self.cs_num[lo]) / (self.cs_den[hi] - self.cs_den[lo])
+            mean = (self.cs_fst[hi] - self.cs_fst[lo]) / n
+        return n, weighted, mean
+
+    def windows(self, win, step):
+        """
+        vcftools windows [1 + k*step, k*step + win] up to the last site. Returns
+        (starts, ends, n, weighted, mean) for windows holding at least one site.
+        """
+        if len(self) == 0:
+            empty = np.zeros(0, dtype=np.int64)
+            return empty, empty, empty, np.zeros(0), np.zeros(0)
+        k = np.arange((int(self.pos[-1]) - 1) // step + 1, dtype=np.int64)
+        starts = 1 + k * step
+        ends = starts + win - 1
+        n, weighted, mean = self.query(starts, ends)
+        keep = n > 0
+        return starts[keep], ends[keep], n[keep], weighted[keep], mean[keep]
+
+
+def pops_hash(pop_samples):
+    return hashlib.sha256(json.dumps(pop_samples).encode()).hexdigest()
+
+
+def index_path(index_dir, vcf):
+    name = os.path.basename(vcf)
+    for ext in (".gz", ".bgz", ".vcf"):
+        if name.endswith(ext):
+            name = name[: -len(ext)]
+    return os.path.join(index_dir, f"{name}.fstidx")
+
+
+def _source_meta(vcf, pop_samples):
+    st = os.stat(vcf)
+    return {"source": os.path.abspath(vcf), "size": st.st_size, "mtime_ns": st.st_mtime_ns,
+            "pops": pops_hash(pop_samples)}
+
+
+def write_index(index_dir, vcf, pop_samples, sites):
+    """Stores {chrom: (pos, num, den)} for one VCF; replaces an older index atomically."""
+    target = index_path(index_dir, vcf)
+    tmp = f"{target}.{os.getpid()}.tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    for i, (chrom, (pos, num, den)) in enumerate(sites.items()):
+        ChromIndex(pos, num, den).save(os.path.join(tmp, f"c{i}"))
+    os.makedirs(tmp, exist_ok=True)
+    meta = _source_meta(vcf, pop_samples)
+    meta["chroms"] = list(sites)
+    with open(os.path.join(tmp, "meta.json"), "w") as fh:
+        json.dump(meta, fh, indent=1)
+    shutil.rmtree(target, ignore_errors=True)
+    os.replace(tmp, target)
+
+
+def read_index(path):
+    """Returns (meta, {chrom: ChromIndex}) of one <vcf>.fstidx directory."""
+    with open(os.path.join(path, "meta.json")) as fh:
+        meta = json.load(fh)
+    return meta, {chrom: ChromIndex.load(os.path.join(path, f"c{i}")) for i, chrom in enumerate(meta["chroms"])}
+
+
+def current_index(index_dir, vcf, pop_samples):
+    """{chrom: ChromIndex} if the index of vcf matches the file and populations, else None."""
+    path = index_path(index_dir, vcf)
+    try:
+        meta, chroms = read_index(path)
+    except (OSError, ValueError, KeyError):
+        return None
+    want = _source_meta(vcf, pop_samples)
+    if any(meta.get(k) != want[k] for k in ("size", "mtime_ns", "pops")):
+        return None
+    return chroms
+
+
+def _chrom_key(chrom):
+    bare = re.sub(r"^chr", "", chrom)
+    return (0, int(bare), "") if bare.isdigit() else (1, 0, bare)
+
+
+def load_all(index_dir):
+    """{chrom: ChromIndex} over every index in index_dir, in chromosome order."""
+    chroms = {}
+    for path in glob.glob(os.path.join(index_dir, "*.fstidx")):
+        chroms.update(read_index(path)[1])
+    return {c: chroms[c] for c in sorted(chroms, key=_chrom_key)}
+
+
+def format_rows(chrom, starts, ends, n, weighted, mean):
+    return [f"{chrom}\t{s}\t{e}\t{c}\t{w:.6g}\t{m:.6g}\n" for s, e, c, w, m in zip(starts, ends, n, weighted, mean)]
+
+
+def write_table(path, rows):
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as fh:
+        fh.write("\t".join(HEADER) + "\n")
+        fh.writelines(rows)
+    os.replace(tmp, path)
+
+
+def informative(row):
+    fields = row.split("\t")
+    return int(fields[3]) > 0 and np.isfinite(float(fields[4]))
+
+
+def read_regions(path):
+    """{chrom: (starts, ends)} from a CHROM START END table, in file order per chromosome."""
+    regions = {}
+    with open(path) as fh:
+        for line in fh:
+            fields = line.split()
+            if len(fields) < 3 or not fields[1].isdigit():
+                continue
+            regions.setdefault(fields[0], []).append((int(fields[1]), int(fields[2])))
+    return {c: tuple(np.array(x, dtype=np.int64) for x in zip(*iv)) for c, iv in regions.items()}
+
+
+def main():
+    p = argparse.ArgumentParser(description="Windowed FST from a per-site WC component index")
+    sub = p.add_subparsers(dest="cmd", required=True)
+    w = sub.add_parser("windows", help="WIN/STEP table for every indexed chromosome")
+    w.add_argument("--win", type=int, default=50000)
+    w.add_argument("--step", type=int, default=50000)
+    w.add_argument("--filtered", default=None, help="Also write the filtered table here")
+    r = sub.add_parser("regions", help="FST of listed regions (CHROM START END)")
+    r.add_argument("--regions", required=True)
+    i = sub.add_parser("info", help="Indexed chromosomes and site counts")
+    for s in (w, r, i):
+        s.add_argument("--index", required=True, help="Index directory (wc_fst.py --index_dir)")
+    for s in (w, r):
+        s.add_argument("--out", required=True)
+    args = p.parse_args()
+
+    chroms = load_all(args.index)
+    if not chroms:
+        sys.exit(f"No FST index under {args.index}")
+
+    if args.cmd == "info":
+        for chrom, idx in chroms.items():
+            span = f"{int(idx.pos[0])}-{int(idx.pos[-1])}" if len(idx) else "-"
+            print(f"{chrom}\t{len(idx)} sites\t{span}")
+        return
+
+    rows = []
+    if args.cmd == "windows":
+        for chrom, idx in chroms.items():
+            rows += format_rows(chrom, *idx.windows(args.win, args.step))
+    else:
+        for chrom, (starts, ends) in read_regions(args.regions).items():
+            if chrom not in chroms:
+                print(f"[warn] {chrom} not indexed; skipping its regions")
+                continue
+            rows += format_rows(chrom, starts, ends, *chroms[chrom].query(starts, ends))
+    write_table(args.out, rows)
+    if getattr(args, "filtered", None):
+        write_table(args.filtered, [row for row in rows if informative(row)])
+    print(f"[fst_index] {len(rows)} rows -> {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -7,11 +7,11 @@ Generate quick QC plots and a small numerical summary for PPP windowed Weir–FS
 
 Usage
 -----
-python scripts/qc_fst_plots.py \
+python scripts/ppp_qc_plots.py \
   --filtered data/fst/CEU_CHS.allchr.windowed.weir.filtered.fst \
   --sampled  data/bins/CEU_CHS.uniform3.N300.windowed.weir.fst \
   --outdir   figs \
-  --chr      1
+  --chr      all --jobs 8
 
 Inputs
 ------
@@ -23,30 +23,116 @@ Outputs
 -------
 - figs/fst_hist_all_vs_sampled.png
 - figs/fst_ecdf_all_vs_sampled.png
-- figs/fst_track_chr{chr}.png
+- figs/fst_track_chr{chr}.png        # one per chromosome (--chr all) or per listed chr
 - figs/sampled_windows_per_chrom.png
 - figs/fst_vs_nvariants_hexbin.png
-- figs/summary.txt   # counts and key quantiles
+- figs/summary.txt   # counts, key quantiles, two-sample KS all vs sampled
 
 Notes
 -----
 - Tries to be resilient to slight header differences by renaming first 6 columns.
+- Each table is read once, only the five columns used, as category / int32 /
+  float32. Histograms and ECDFs are computed with NumPy on shared bin edges.
+- Tracks are drawn on --jobs processes with the Agg backend. The windows of a
+  chromosome are aggregated into --track_bins position bins (mean line and
+  min–max band) before plotting, so drawing cost does not grow with window
+  count. Sampled windows are drawn individually.
+- summary.txt adds the two-sample Kolmogorov–Smirnov distance between the
+  WEIGHTED_FST of all and sampled windows (ks_d), its asymptotic p-value, and
+  the 5% critical distance. The sampled windows are a subset of all windows,
+  so the p-value is conservative; read ks_d against ks_d_crit_05 as a
+  representativeness check.
 - Uses default matplotlib; no external style dependencies.
 """
 
-import argparse, os, math
-import pandas as pd
+import argparse, os
+from concurrent.futures import ProcessPoolExecutor
+
+import matplotlib
+matplotlib.use("Agg")
 import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+
+COLS = ["CHROM", "BIN_START", "BIN_END", "N_VARIANTS", "WEIGHTED_FST", "MEAN_FST"]
+DTYPES = {"CHROM": "category", "BIN_START": np.int32, "BIN_END": np.int32,
+          "N_VARIANTS": np.int32, "WEIGHTED_FST": np.float32}
+
+
+def read_table(path):
+    """CHROM..WEIGHTED_FST of a windowed FST table with compact dtypes (first 6 columns renamed)."""
+    header = pd.read_csv(path, sep="\t", nrows=0).columns[:6]
+    names = dict(zip(header, COLS))
+    used = [h for h in header if names[h] in DTYPES]
+    df = pd.read_csv(path, sep="\t", usecols=used, dtype={h: DTYPES[names[h]] for h in used})
+    return df.rename(columns=names)
+
+
+def chrom_key(chrom):
+    bare = str(chrom).replace("chr", "")
+    return (0, int(bare), "") if bare.isdigit() else (1, 0, bare)
+
 
 def ecdf(x):
-    """Return ECDF x,y for a 1D series (NaNs dropped)."""
-    x = pd.Series(x).dropna().sort_values().values
-    y = (pd.Series(range(1, len(x)+1)) / len(x)).values
-    return x, y
+    """Return ECDF x,y for a 1D array (NaNs dropped)."""
+    x = np.sort(x[np.isfinite(x)])
+    return x, np.arange(1, len(x) + 1) / len(x)
+
+
+def thin(x, y, n=4000):
+    """At most n points of a monotone curve, always keeping both ends."""
+    if len(x) <= n:
+        return x, y
+    idx = np.unique(np.linspace(0, len(x) - 1, n).astype(np.int64))
+    return x[idx], y[idx]
+
+
+def ks_2samp(a, b):
+    """Two-sample KS distance D and its asymptotic p-value (Kolmogorov distribution)."""
+    a = np.sort(a[np.isfinite(a)])
+    b = np.sort(b[np.isfinite(b)])
+    n, m = len(a), len(b)
+    if not n or not m:
+        return float("nan"), float("nan")
+    pooled = np.concatenate([a, b])
+    d = float(np.abs(np.searchsorted(a, pooled, side="right") / n
+                     - np.searchsorted(b, pooled, side="right") / m).max())
+    en = np.sqrt(n * m / (n + m))
+    lam = (en + 0.12 + 0.11 / en) * d
+    k = np.arange(1, 101)
+    p = float(np.clip(2 * np.sum((-1.0) ** (k - 1) * np.exp(-2 * (k * lam) ** 2)), 0, 1)) if lam > 0 else 1.0
+    return d, p
+
+
+def binned_track(mid, fst, nbins):
+    """(centres, mean, min, max) of fst over nbins equal position bins; empty bins dropped."""
+    edges = np.linspace(mid.min(), mid.max(), nbins + 1)
+    b = np.clip(np.searchsorted(edges, mid, side="right") - 1, 0, nbins - 1)
+    order = np.argsort(b, kind="stable")
+    b, mid, fst = b[order], mid[order], fst[order]
+    starts = np.flatnonzero(np.r_[True, b[1:] != b[:-1]])
+    counts = np.diff(np.r_[starts, len(b)])
+    return (np.add.reduceat(mid, starts) / counts, np.add.reduceat(fst, starts) / counts,
+            np.minimum.reduceat(fst, starts), np.maximum.reduceat(fst, starts))
+
+
+def draw_track(chrom, mid, fst, s_mid, s_fst, nbins, out):
+    """Worker: one chromosome's track with all windows binned and sampled windows on top."""
+    centres, mean, lo, hi = binned_track(mid, fst, nbins)
+    fig, ax = plt.subplots()
+    ax.fill_between(centres / 1e6, lo, hi, step="mid", alpha=0.3, linewidth=0, label="all (min–max)")
+    ax.plot(centres / 1e6, mean, drawstyle="steps-mid", linewidth=0.8, label="all (mean)")
+    if len(s_mid):
+        ax.scatter(s_mid / 1e6, s_fst, s=14, marker="x", color="C3", label="sampled", zorder=3)
+    ax.set_xlabel(f"Chromosome {chrom} position (Mb)")
+    ax.set_ylabel("Weighted FST")
+    ax.set_title(f"Windowed FST track (chr{chrom}, {len(mid)} windows)")
+    ax.legend()
+    fig.tight_layout()
+    fig.savefig(out, dpi=200)
+    plt.close(fig)
+    return out
 
-def midpoints(df):
-    """Midpoint (bp) of each window: (BIN_START + BIN_END)/2."""
-    return (df["BIN_START"].astype(float) + df["BIN_END"].astype(float)) / 2.0
 
 def main():
     p = argparse.ArgumentParser(description="QC plots for PPP windowed Fst + sampled windows")
@@ -55,27 +141,28 @@ def main():
     p.add_argument("--sampled", default="data/bins/CEU_CHS.uniform3.N300.windowed.weir.fst",
                    help="Sampled windows table")
     p.add_argument("--outdir", default="figs", help="Output figures directory")
-    p.add_argument("--chr", default="1", help="Chromosome to draw a track for (e.g. 1)")
+    p.add_argument("--chr", nargs="+", default=["all"],
+                   help="Chromosome(s) to draw a track for (e.g. 1 2), or 'all'")
+    p.add_argument("--track_bins", type=int, default=2000, help="Position bins per chromosome track")
+    p.add_argument("--jobs", type=int, default=os.cpu_count() or 1, help="Processes drawing tracks")
     args = p.parse_args()
 
     os.makedirs(args.outdir, exist_ok=True)
 
     # Read tables
-    cols = ["CHROM","BIN_START","BIN_END","N_VARIANTS","WEIGHTED_FST","MEAN_FST"]
-    all_df = pd.read_csv(args.filtered, sep="\t")
-    if list(all_df.columns[:6]) != cols:
-        # handle if header slightly differs; try rename safely
-        rename_map = dict(zip(all_df.columns[:6], cols))
-        all_df = all_df.rename(columns=rename_map)
-    samp_df = pd.read_csv(args.sampled, sep="\t")
-    if list(samp_df.columns[:6]) != cols:
-        rename_map = dict(zip(samp_df.columns[:6], cols))
-        samp_df = samp_df.rename(columns=rename_map)
-
-    # 1) Histogram of WEIGHTED_FST (all vs sampled)
+    all_df = read_table(args.filtered)
+    samp_df = read_table(args.sampled)
+    fst_all = all_df["WEIGHTED_FST"].to_numpy()
+    fst_samp = samp_df["WEIGHTED_FST"].to_numpy()
+    fin_all = fst_all[np.isfinite(fst_all)]
+    fin_samp = fst_samp[np.isfinite(fst_samp)]
+
+    # 1) Histogram of WEIGHTED_FST (all vs sampled), shared edges
+    edges = np.histogram_bin_edges(np.concatenate([fin_all, fin_samp]), bins=60)
     plt.figure()
-    all_df["WEIGHTED_FST"].plot(kind="hist", bins=60, density=True, label="all", alpha=0.5)
-    samp_df["WEIGHTED_FST"].plot(kind="hist", bins=60, density=True, label="sampled", alpha=0.5)
+    for x, label in ((fin_all, "all"), (fin_samp, "sampled")):
+        dens, _ = np.histogram(x, bins=edges, density=True)
+        plt.stairs(dens, edges, fill=True, alpha=0.5, label=label)
     plt.xlabel("Weighted FST per 50kb window")
     plt.ylabel("Density")
     plt.legend()
@@ -85,11 +172,9 @@ def main():
     plt.close()
 
     # 2) ECDF (all vs sampled)
-    x_all, y_all = ecdf(all_df["WEIGHTED_FST"])
-    x_s, y_s = ecdf(samp_df["WEIGHTED_FST"])
     plt.figure()
-    plt.plot(x_all, y_all, label="all")
-    plt.plot(x_s, y_s, label="sampled")
+    for x, label in ((fst_all, "all"), (fst_samp, "sampled")):
+        plt.plot(*thin(*ecdf(x)), drawstyle="steps-post", label=label)
     plt.xlabel("Weighted FST")
     plt.ylabel("ECDF")
     plt.legend()
@@ -98,28 +183,32 @@ def main():
     plt.savefig(os.path.join(args.outdir, "fst_ecdf_all_vs_sampled.png"), dpi=200)
     plt.close()
 
-    # 3) Manhattan-like track for one chromosome (all windows), highlight sampled ones
-    chr_sel = str(args.chr)
-    all_chr = all_df[all_df["CHROM"].astype(str) == chr_sel].copy()
-    samp_chr = samp_df[samp_df["CHROM"].astype(str) == chr_sel].copy()
-    if len(all_chr) > 0:
-        plt.figure()
-        plt.scatter(midpoints(all_chr)/1e6, all_chr["WEIGHTED_FST"], s=6, label="all")
-        if len(samp_chr) > 0:
-            plt.scatter(midpoints(samp_chr)/1e6, samp_chr["WEIGHTED_FST"], s=14, marker="x", label="sampled")
-        plt.xlabel(f"Chromosome {chr_sel} position (Mb)")
-        plt.ylabel("Weighted FST")
-        plt.title(f"Windowed FST track (chr{chr_sel})")
-        plt.legend()
-        plt.tight_layout()
-        plt.savefig(os.path.join(args.outdir, f"fst_track_chr{chr_sel}.png"), dpi=200)
-        plt.close()
+    # 3) Manhattan-like track per chromosome (all windows binned), sampled ones highlighted
+    chroms = sorted(all_df["CHROM"].astype(str).unique(), key=chrom_key)
+    wanted = chroms if "all" in args.chr else [c for c in map(str, args.chr) if c in chroms]
+    mid_all = (all_df["BIN_START"].to_numpy(np.float64) + all_df["BIN_END"].to_numpy(np.float64)) / 2.0
+    mid_samp = (samp_df["BIN_START"].to_numpy(np.float64) + samp_df["BIN_END"].to_numpy(np.float64)) / 2.0
+    groups_all = all_df.groupby(all_df["CHROM"].astype(str), observed=True).indices
+    groups_samp = samp_df.groupby(samp_df["CHROM"].astype(str), observed=True).indices
+    with ProcessPoolExecutor(max_workers=max(1, min(args.jobs, len(wanted) or 1))) as pool:
+        futures = []
+        for chrom in wanted:
+            rows = groups_all[chrom]
+            keep = rows[np.isfinite(fst_all[rows])]
+            if not len(keep):
+                continue
+            srows = groups_samp.get(chrom, np.zeros(0, dtype=np.int64))
+            futures.append(pool.submit(draw_track, chrom, mid_all[keep], fst_all[keep].astype(np.float64),
+                                       mid_samp[srows], fst_samp[srows], args.track_bins,
+                                       os.path.join(args.outdir, f"fst_track_chr{chrom}.png")))
+        for fut in futures:
+            fut.result()
 
     # 4) Count sampled windows per chromosome (bar)
-    samp_counts = samp_df.groupby("CHROM").size().reset_index(name="n")
-    samp_counts = samp_counts.sort_values("CHROM", key=lambda s: s.astype(str).str.replace("chr","", regex=False).astype(int))
+    samp_counts = samp_df["CHROM"].astype(str).value_counts()
+    samp_counts = samp_counts.reindex(sorted(samp_counts.index, key=chrom_key))
     plt.figure()
-    plt.bar(samp_counts["CHROM"].astype(str), samp_counts["n"])
+    plt.bar(samp_counts.index, samp_counts.to_numpy())
     plt.xlabel("Chromosome")
     plt.ylabel("# sampled windows")
     plt.title("Sampled windows per chromosome")
@@ -129,7 +218,7 @@ def main():
 
     # 5) Relationship: N_VARIANTS vs WEIGHTED_FST (all windows)
     plt.figure()
-    plt.hexbin(all_df["N_VARIANTS"], all_df["WEIGHTED_FST"], gridsize=50)
+    plt.hexbin(all_df["N_VARIANTS"].to_numpy(), fst_all, gridsize=50)
     plt.xlabel("N_VARIANTS (per 50kb window)")
     plt.ylabel("Weighted FST")
     plt.title("N_VARIANTS vs FST (all windows)")
@@ -138,14 +227,19 @@ def main():
     plt.close()
 
     # 6) Print a small text summary (helps Methods + sanity checks)
-    q = all_df["WEIGHTED_FST"].quantile([0.33, 0.66]).values
+    q = np.quantile(fin_all, [0.33, 0.66])
+    d, pval = ks_2samp(fst_all, fst_samp)
+    n, m = len(fin_all), len(fin_samp)
     summary = {
         "n_all_windows": int(len(all_df)),
         "n_sampled": int(len(samp_df)),
-        "mean_fst_all": float(all_df["WEIGHTED_FST"].mean()),
-        "mean_fst_sampled": float(samp_df["WEIGHTED_FST"].mean()),
+        "mean_fst_all": float(fin_all.mean(dtype=np.float64)),
+        "mean_fst_sampled": float(fin_samp.mean(dtype=np.float64)),
         "fst_33pct_all": float(q[0]),
         "fst_66pct_all": float(q[1]),
+        "ks_d": d,
+        "ks_pvalue": pval,
+        "ks_d_crit_05": float(1.358 * np.sqrt((n + m) / (n * m))) if n and m else float("nan"),
     }
     with open(os.path.join(args.outdir, "summary.txt"), "w") as fh:
         for k,v in summary.items():
@@ -19,6 +19,8 @@
 #   - evanno.tsv, bestK.txt
 #   - aic_bic.tsv
 #   - best_rep_per_K.tsv
+#   - q_align/                                # cluster labels aligned across reps (q_align.py):
+#                                             #   K*.aligned.npz, K*.consensus.Q, K*.similarity.tsv, summary.tsv
 #   - counts.txt
 #   - params_snapshot.txt
 #
@@ -35,13 +37,15 @@ export LC_ALL=C
 BASE="${BASE:-results/structure_ppp_sampled}"
 OUT="${BASE}/summary"
 PANEL="${PANEL:-data/panel/integrated_call_samples_v3.20130502.ALL.panel}"
+SCRIPT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
+Q_ALIGN_PY="${Q_ALIGN_PY:-$SCRIPT_DIR/../../../tests_of_ghost_introgression_pipeline/scripts/q_align.py}"
 mkdir -p "$OUT"
 
 # Inputs produced by STRUCTURE_PPP.pbs (PLINK stage + STRUCTURE input)
 BED_PREFIX="${BASE}/ppp_sampled.thin"       # .fam/.bim
-STR_IN="${BASE}/ppp_sampled.thin_structure.recode.strct_in"
-MAINP="${BASE}/mainparams.fix"
-EXTRAP="${BASE}/extraparams.fix"
+STR_IN="${BASE}/ppp_sampled.thin.str"
+MAINP="${BASE}/ppp_sampled.thin.mainparams"
+EXTRAP="${BASE}/ppp_sampled.thin.extraparams"
 
 # ---------- sanity ----------
 [[ -f "$BED_PREFIX.fam" && -f "$BED_PREFIX.bim" ]] || { echo "Missing PLINK outputs under $BASE"; exit 1; }
@@ -197,6 +201,12 @@ with open(os.path.join(outdir, "aic_bic.tsv"), "w") as fw:
         fw.write("{}\t{}\t{}\t{}\t{}\n".format(K, ll, p, aic(ll,p), bic(ll,p,I)))
 PY
 
+# ---------- align cluster labels across replicates (per K) ----------
+if compgen -G "$BASE/K*/rep*/run_f" > /dev/null && [[ -f "$Q_ALIGN_PY" ]]; then
+  "$PYTHON" "$Q_ALIGN_PY" --inputs "$BASE/K*/rep*/run_f" --outdir "$OUT/q_align" \
+    || echo "[warn] Q alignment failed (needs python3 with NumPy/SciPy)" >&2
+fi
+
 # ---------- snapshot params (for Methods) ----------
 {
   echo "[files]"
@@ -212,5 +222,6 @@ echo "  - $SUMMARY"
 echo "  - $OUT/evanno.tsv  (bestK: $(cat "$OUT/bestK.txt" 2>/dev/null || echo NA))"
 echo "  - $OUT/aic_bic.tsv"
 echo "  - $OUT/best_rep_per_K.tsv"
+[[ -f "$OUT/q_align/summary.tsv" ]] && echo "  - $OUT/q_align/  (aligned Q stacks, consensus Q per K)"
 echo "  - $OUT/counts.txt"
 echo "  - $OUT/params_snapshot.txt"
@@ -0,0 +1,308 @@
+#!/usr/bin/env python3
+"""
+Purpose
+-------
+Extract a list of regions from bgzipped, tabix/CSI-indexed VCFs into one bgzipped
+VCF, seeking through the index and decompressing only the BGZF blocks that hold
+the regions. Replaces the per-chromosome `bcftools view -R` + `bcftools index`
+calls and the `bcftools concat` of ppp_fst_bin_and_sample.sh.
+
+Usage
+-----
+python scripts/vcf_regions.py \
+  --vcf data/subsets/CEU_CHS.chr{1..22}.vcf.gz \
+  --regions data/bins/CEU_CHS.sampled_regions.tsv \
+  --out data/subsets_fst_sampled/CEU_CHS.sampled.windows.vcf.gz
+
+Inputs
+------
+- VCFs compressed with bgzip, each with a .tbi or .csi index next to it.
+- Regions: CHROM START END per line (1-based, inclusive); other lines are skipped.
+
+Outputs
+-------
+- --out: BGZF-compressed VCF (header of the first input, then the records of every
+  region in --vcf order and position order), indexable with `bcftools index`.
+
+Notes
+-----
+- Like `bcftools view -R`, a record is kept when it overlaps a region
+  (POS <= END and POS + len(REF) - 1 >= START); overlapping regions are merged
+  first, so no record is written twice.
+- Index chunks of all regions of a chromosome are merged before reading, so every
+  needed BGZF block is decompressed once.
+"""
+
+import argparse, gzip, os, struct, sys, zlib
+
+import numpy as np
+
+BGZF_EOF = bytes.fromhex("1f8b08040000000000ff0600424302001b0003000000000000000000")
+_MAX_BLOCK = 0xff00
+
+
+# BGZF
+
+def read_block(fh, coffset):
+    """(decompressed data, compressed size) of the BGZF block at file offset coffset."""
+    fh.seek(coffset)
+    header = fh.read(18)
+    if len(header) < 18:
+        return b"", 0
+    if header[:4] != b"\x1f\x8b\x08\x04":
+        raise ValueError(f"not a BGZF block at offset {coffset}")
+    xlen = struct.unpack("<H", header[10:12])[0]
+    extra = header[12:12 + xlen] if xlen <= 6 else header[12:] + fh.read(xlen - 6)
+    bsize = None
+    i = 0
+    while i + 4 <= len(extra):
+        si1, si2, slen = extra[i], extra[i + 1], struct.unpack("<H", extra[i + 2:i + 4])[0]
+        if si1 == 66 and si2 == 67:
+            bsize = struct.unpack("<H", extra[i + 4:i + 6])[0]
+        i += 4 + slen
+    if bsize is None:
+        raise ValueError(f"BGZF block without BSIZE at offset {coffset}")
+    fh.seek(coffset + 12 + xlen)
+    cdata = fh.read(bsize - xlen - 19)
+    return zlib.decompress(cdata, -15), bsize + 1
+
+
+def read_chunk(fh, beg, end):
+    """Decompressed bytes between two virtual offsets."""
+    coffset, uoffset = beg >> 16, beg & 0xFFFF
+    end_c, end_u = end >> 16, end & 0xFFFF
+    parts = []
+    while coffset <= end_c:
+        data, size = read_block(fh, coffset)
+        if size == 0:
+            break
+        stop = end_u if coffset == end_c else len(data)
+        parts.append(data[uoffset:stop])
+        uoffset = 0
+        coffset += size
+    return b"".join(parts)
+
+
+class BgzfWriter:
+    """Minimal BGZF writer (64 kB blocks, EOF marker on close)."""
+
+    def __init__(self, path):
+        self.fh = open(path, "wb")
+        self.buf = bytearray()
+
+    def write(self, data):
+        self.buf += data
+        while len(self.buf) >= _MAX_BLOCK:
+            self._block(bytes(self.buf[:_MAX_BLOCK]))
+            del self.buf[:_MAX_BLOCK]
+
+    def _block(self, data):
+        comp = zlib.compressobj(6, zlib.DEFLATED, -15)
+        cdata = comp.compress(data) + comp.flush()
+        bsize = len(cdata) + 25
+        self.fh.write(struct.pack("<4BI2BH2BHH", 0x1f, 0x8b, 8, 4, 0, 0, 0xff, 6, 66, 67, 2, bsize))
+        self.fh.write(cdata)
+        self.fh.write(struct.pack("<II", zlib.crc32(data), len(data)))
+
+    def close(self):
+        if self.buf:
+            self._block(bytes(self.buf))
+            self.buf.clear()
+        self.fh.write(BGZF_EOF)
+        self.fh.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# Tabix / CSI indexes
+
+def _reg2bins(beg, end, min_shift, depth):
+    """Bins overlapping the 0-based half-open interval [beg, end) (htslib's hts_reg2bins)."""
+    bins = []
+    end -= 1
+    s = min_shift + depth * 3
+    t = 0
+    for level in range(depth + 1):
+        b = t + (beg >> s)
+        e = t + (end >> s)
+        bins.extend(range(b, e + 1))
+        s -= 3
+        t += 1 << (level * 3)
+    return bins
+
+
+class VcfIndex:
+    """Bins, chunks and (tabix) linear index of a .tbi or .csi file."""
+
+    def __init__(self, path, contigs=()):
+        data = gzip.open(path, "rb").read()
+        self.refs = {}
+        if data[:4] == b"TBI\x01":
+            self.min_shift, self.depth = 14, 5
+            n_ref = struct.unpack_from("<i", data, 4)[0]
+            names, off = self._names(data, 8)
+            linear = True
+        elif data[:4] == b"CSI\x01":
+            self.min_shift, self.depth, l_aux = struct.unpack_from("<iii", data, 4)
+            names, _ = self._names(data, 16) if l_aux >= 28 else ([], None)
+            off = 16 + l_aux
+            n_ref = struct.unpack_from("<i", data, off)[0]
+            off += 4
+            linear = False
+        else:
+            raise ValueError(f"{path}: not a tabix or CSI index")
+        names = names or list(contigs)   # CSI without a tabix header: header contig order
+        for r in range(n_ref):
+            bins = {}
+            n_bin = struct.unpack_from("<i", data, off)[0]
+            off += 4
+            for _ in range(n_bin):
+                if linear:
+                    bin_id, n_chunk = struct.unpack_from("<Ii", data, off)
+                    off += 8
+                else:
+                    bin_id, _, n_chunk = struct.unpack_from("<IQi", data, off)
+                    off += 16
+                chunks = struct.unpack_from(f"<{2 * n_chunk}Q", data, off)
+                off += 16 * n_chunk
+                bins[bin_id] = list(zip(chunks[0::2], chunks[1::2]))
+            ioff = ()
+            if linear:
+                n_intv = struct.unpack_from("<i", data, off)[0]
+                off += 4
+                ioff = struct.unpack_from(f"<{n_intv}Q", data, off)
+                off += 8 * n_intv
+            self.refs[names[r] if r < len(names) else str(r)] = (bins, ioff)
+
+    @staticmethod
+    def _names(data, off):
+        """Sequence names of the tabix header starting at off (format .. l_nm)."""
+        l_nm = struct.unpack_from("<i", data, off + 24)[0]
+        raw = data[off + 28:off + 28 + l_nm]
+        return [n.decode() for n in raw.split(b"\0") if n], off + 28 + l_nm
+
+    def chunks(self, chrom, starts, ends):
+        """Merged (beg, end) virtual-offset chunks covering 1-based regions of chrom."""
+        if chrom not in self.refs:
+            return []
+        bins, ioff = self.refs[chrom]
+        found = []
+        for start, end in zip(starts, ends):
+            beg0 = max(int(start) - 1, 0)
+            min_off = ioff[min(beg0 >> 14, len(ioff) - 1)] if ioff else 0
+            for b in _reg2bins(beg0, int(end), self.min_shift, self.depth):
+                found.extend(c for c in bins.get(b, ()) if c[1] > min_off)
+        found.sort()
+        merged = []
+        for beg, end in found:
+            if merged and beg <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], end)
+            else:
+                merged.append([beg, end])
+        return merged
+
+
+def index_for(vcf):
+    for ext in (".tbi", ".csi"):
+        if os.path.exists(vcf + ext):
+            contigs = [line.split(b"ID=", 1)[1].split(b",")[0].split(b">")[0].decode()
+                       for line in read_header(vcf).splitlines() if line.startswith(b"##contig=<")]
+            return VcfIndex(vcf + ext, contigs)
+    raise FileNotFoundError(f"{vcf}: no .tbi or .csi index")
+
+
+# Regions
+
+def read_regions(path):
+    """{chrom: (starts, ends)} merged, sorted 1-based inclusive regions."""
+    raw = {}
+    with open(path) as fh:
+        for line in fh:
+            fields = line.split()
+            if len(fields) < 3 or not fields[1].isdigit() or not fields[2].isdigit():
+                continue
+            raw.setdefault(fields[0], []).append((int(fields[1]), int(fields[2])))
+    merged = {}
+    for chrom, iv in raw.items():
+        iv.sort()
+        out = [list(iv[0])]
+        for s, e in iv[1:]:
+            if s <= out[-1][1] + 1:
+                out[-1][1] = max(out[-1][1], e)
+            else:
+                out.append([s, e])
+        arr = np.array(out, dtype=np.int64)
+        merged[chrom] = (arr[:, 0], arr[:, 1])
+    return merged
+
+
+def read_header(vcf):
+    lines = []
+    with gzip.open(vcf, "rb") as fh:
+        for line in fh:
+            if not line.startswith(b"#"):
+                break
+            lines.append(line)
+    return b"".join(lines)
+
+
+def region_records(fh, index, chrom, starts, ends):
+    """Yields the raw record lines of chrom that overlap any of the regions."""
+    key = chrom.encode()
+    for beg, end in index.chunks(chrom, starts, ends):
+        for line in read_chunk(fh, beg, end).splitlines(keepends=True):
+            fields = line.split(b"\t", 4)
+            if len(fields) < 4 or fields[0] != key:
+                continue
+            pos = int(fields[1])
+            last = pos + len(fields[3]) - 1
+            # Last region starting at or before the record's end must reach its start
+            i = np.searchsorted(starts, last, side="right") - 1
+            if i >= 0 and ends[i] >= pos:
+                yield line
+
+
+def extract(vcfs, regions, out):
+    """Writes the records of regions from vcfs to out. Returns records written per VCF."""
+    counts = {}
+    with BgzfWriter(out) as writer:
+        writer.write(read_header(vcfs[0]))
+        for vcf in vcfs:
+            index = index_for(vcf)
+            n = 0
+            with open(vcf, "rb") as fh:
+                for chrom in index.refs:
+                    if chrom not in regions:
+                        continue
+                    for line in region_records(fh, index, chrom, *regions[chrom]):
+                        writer.write(line)
+                        n += 1
+            counts[vcf] = n
+    return counts
+
+
+def main():
+    p = argparse.ArgumentParser(description="Indexed region extraction from bgzipped VCFs")
+    p.add_argument("--vcf", nargs="+", required=True, help="Indexed .vcf.gz inputs (.tbi or .csi)")
+    p.add_argument("--regions", required=True, help="CHROM START END table (1-based inclusive)")
+    p.add_argument("--out", required=True, help="Output .vcf.gz (BGZF)")
+    args = p.parse_args()
+
+    vcfs = [v for v in args.vcf if os.path.exists(v)]
+    if not vcfs:
+        sys.exit("No input VCFs found")
+    regions = read_regions(args.regions)
+    counts = extract(vcfs, regions, args.out)
+    for vcf, n in counts.items():
+        if n:
+            print(f"[regions] {os.path.basename(vcf)}: {n} records")
+    print(f"[regions] {sum(counts.values())} records from {sum(len(s) for s, _ in regions.values())} "
+          f"regions -> {args.out}")
+
+
+if __name__ == "__main__":
+    main()
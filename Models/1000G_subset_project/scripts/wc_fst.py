@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+"""
+Purpose
+-------
+Windowed Weir & Cockerham (1984) FST between two populations, computed in-process
+from bgzipped VCFs with one worker per input file. Replaces the per-chromosome
+`vcf_calc.py --calc-statistic windowed-weir-fst` loop, the head/tail merge and the
+awk filter of ppp_fst_bin_and_sample.sh.
+
+Usage
+-----
+python scripts/wc_fst.py \
+  --vcf data/subsets/CEU_CHS.chr{1..22}.vcf.gz \
+  --pop data/panel/ceu_samples.txt --pop data/panel/chs_samples.txt \
+  --win 50000 --step 50000 --outdir data/fst --merged CEU_CHS.allchr --jobs 8
+
+Outputs
+-------
+- OUTDIR/<vcf name>.windowed.weir.fst               # per input, e.g. CEU_CHS.chr1...
+- OUTDIR/MERGED.windowed.weir.fst                   # all inputs, in --vcf order
+- OUTDIR/MERGED.windowed.weir.filtered.fst          # N_VARIANTS > 0 and finite WEIGHTED_FST
+  columns: CHROM BIN_START BIN_END N_VARIANTS WEIGHTED_FST MEAN_FST
+
+Notes
+-----
+- Records are read in blocks of --block_sites lines. Plain `GT` records with
+  single-digit alleles (the 1000G subsets) are decoded as one byte array per
+  block; anything else falls back to per-record parsing.
+- Per site and allele the WC variance components a, b, c are computed for all
+  sites of a block at once; the site's numerator is sum(a) and its denominator
+  sum(a + b + c) over alleles, as in vcftools. Sites with a zero or undefined
+  denominator (monomorphic, or a population without called genotypes) are
+  skipped and do not count in N_VARIANTS.
+- Windows are vcftools' windows: [1 + k*STEP, k*STEP + WIN], 1-based inclusive.
+  WEIGHTED_FST is sum(numerators) / sum(denominators) and MEAN_FST the mean of
+  the per-site ratios; both come from prefix sums over the position-sorted sites.
+- Inputs are run largest first on --jobs processes. A per-input table that
+  already exists is reused unless --overwrite is given.
+- With --index_dir the per-site components are also saved (see fst_index.py).
+  A later run whose index is current for a VCF (same file and populations)
+  rebuilds that VCF's table from the index without reading the VCF, so WIN/STEP
+  changes take seconds; --overwrite forces a VCF pass.
+"""
+
+import argparse, gzip, os, sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from fst_index import ChromIndex, current_index, format_rows, informative, write_index, write_table
+
+
+def read_samples(path):
+    with open(path) as fh:
+        return [line.split()[0] for line in fh if line.strip()]
+
+
+def table_path(outdir, vcf):
+    name = os.path.basename(vcf)
+    for ext in (".gz", ".bgz", ".vcf"):
+        if name.endswith(ext):
+            name = name[: -len(ext)]
+    return os.path.join(outdir, f"{name}.windowed.weir.fst")
+
+
+# GT decoding
+
+def _gt_fast(records, n_samples):
+    """(S, n_samples, 2) allele codes from "a|b\\ta|b..." strings of single-digit GTs."""
+    buf = np.frombuffer("".join(r + "\t" for r in records).encode(), dtype=np.uint8)
+    buf = buf.reshape(len(records), 4 * n_samples)
+    G = np.stack([buf[:, 0::4], buf[:, 2::4]], axis=2).astype(np.int16) - ord("0")
+    G[(G < 0) | (G > 9)] = -1
+    return G
+
+
+def _gt_slow(fmt, samples, n_samples):
+    """(n_samples, 2) allele codes of one record, any FORMAT layout."""
+    keys = fmt.split(":")
+    if "GT" not in keys:
+        return np.full((n_samples, 2), -1, dtype=np.int16)
+    gi = keys.index("GT")
+    out = np.full((n_samples, 2), -1, dtype=np.int16)
+    for j, entry in enumerate(samples.split("\t")):
+        fields = entry.split(":")
+        if gi >= len(fields):
+            continue
+        alleles = fields[gi].replace("|", "/").split("/")
+        if len(alleles) != 2:
+            continue  # haploid or malformed: treated as missing
+        for h, a in enumerate(alleles):
+            if a.isdigit():
+                out[j, h] = int(a)
+    return out
+
+
+def decode_block(lines, n_samples):
+    """Returns (chrom list, pos array, (S, n_samples, 2) allele codes) for VCF lines."""
+    chroms, pos, fast, slow = [], [], [], []
+    for i, line in enumerate(lines):
+        parts = line.rstrip("\n").split("\t", 9)
+        chroms.append(parts[0])
+        pos.append(int(parts[1]))
+        samples = parts[9]
+        if parts[8] == "GT" and len(samples) == 4 * n_samples - 1:
+            fast.append((i, samples))
+        else:
+            slow.append((i, parts[8], samples))
+    G = np.empty((len(lines), n_samples, 2), dtype=np.int16)
+    if fast:
+        G[[i for i, _ in fast]] = _gt_fast([s for _, s in fast], n_samples)
+    for i, fmt, samples in slow:
+        G[i] = _gt_slow(fmt, samples, n_samples)
+    return chroms, np.array(pos, dtype=np.int64), G
+
+
+# Weir & Cockerham components
+
+def wc_components(G, pops):
+    """
+    Per-site WC numerator and denominator for allele codes G (S, N, 2) and a list of
+    sample-index arrays, one per population. Returns (num, den).
+    """
+    r = len(pops)
+    S = G.shape[0]
+    num = np.zeros(S)
+    den = np.zeros(S)
+    called = [(G[:, idx] >= 0).all(axis=2) for idx in pops]           # (S, n_i)
+    n = np.stack([c.sum(axis=1) for c in called], axis=1).astype(float)  # (S, r)
+    n_bar = n.sum(axis=1) / r
+    nc = (r * n_bar - (n ** 2).sum(axis=1) / (r * n_bar)) / (r - 1)
+    max_allele = int(G.max()) if G.size else 0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        for allele in range(max_allele + 1):
+            p = np.empty((S, r))
+            h = np.empty((S, r))
+            for i, idx in enumerate(pops):
+                copies = (G[:, idx] == allele).sum(axis=2) * called[i]   # 0/1/2 per individual
+                p[:, i] = copies.sum(axis=1) / (2 * n[:, i])
+                h[:, i] = (copies == 1).sum(axis=1) / n[:, i]
+            p_bar = (n * p).sum(axis=1) / (r * n_bar)
+            s2 = (n * (p - p_bar[:, None]) ** 2).sum(axis=1) / ((r - 1) * n_bar)
+            h_bar = (n * h).sum(axis=1) / (r * n_bar)
+            pq = p_bar * (1 - p_bar)
+            a = n_bar / nc * (s2 - (pq - (r - 1) / r * s2 - h_bar / 4) / (n_bar - 1))
+            b = n_bar / (n_bar - 1) * (pq - (r - 1) / r * s2 - (2 * n_bar - 1) / (4 * n_bar) * h_bar)
+            c = h_bar / 2
+            num += a
+            den += a + b + c
+    return num, den
+
+
+def site_components(vcf, pop_samples, block_sites=20000):
+    """
+    Streams a VCF and returns {chrom: (pos, num, den)} for sites with a finite,
+    non-zero denominator, stable-sorted by position within each chromosome (so an
+    unsorted VCF still gives a position-sorted ChromIndex).
+    """
+    pops = None
+    n_samples = 0
+    out = {}
+
+    def flush(lines):
+        chroms, pos, G = decode_block(lines, n_samples)
+        num, den = wc_components(G, pops)
+        keep = np.isfinite(num) & np.isfinite(den) & (den != 0)
+        chroms = np.array(chroms)
+        for chrom in dict.fromkeys(chroms[keep]):
+            sel = keep & (chroms == chrom)
+            out.setdefault(chrom, []).append((pos[sel], num[sel], den[sel]))
+
+    with gzip.open(vcf, "rt") as fh:
+        block = []
+        for line in fh:
+            if line.startswith("##"):
+                continue
+            if line.startswith("#CHROM"):
+                names = line.rstrip("\n").split("\t")[9:]
+                n_samples = len(names)
+                index = {s: i for i, s in enumerate(names)}
+                pops = [np.array([index[s] for s in pop if s in index], dtype=np.int64) for pop in pop_samples]
+                if any(len(p) == 0 for p in pops):
+                    raise ValueError(f"{vcf}: a population has no samples in the VCF")
+                continue
+            block.append(line)
+            if len(block) >= block_sites:
+                flush(block)
+                block = []
+        if block:
+            flush(block)
+
+    sites = {}
+    for chrom, chunks in out.items():
+        pos, num, den = (np.concatenate(parts) for parts in zip(*chunks))
+        if np.any(pos[1:] < pos[:-1]):
+            order = np.argsort(pos, kind="stable")
+            pos, num, den = pos[order], num[order], den[order]
+        sites[chrom] = (pos, num, den)
+    return sites
+
+
+def process_vcf(vcf, pop_samples, win, step, out_path, block_sites, index_dir=None, overwrite=False):
+    """
+    Worker: windowed FST table of one VCF, from its index when that is current.
+    Returns (vcf, number of sites used, "index" or "vcf").
+    """
+    chroms = None if overwrite or not index_dir else current_index(index_dir, vcf, pop_samples)
+    source = "index"
+    if chroms is None:
+        sites = site_components(vcf, pop_samples, block_sites)
+        if index_dir:
+            write_index(index_dir, vcf, pop_samples, sites)
+        chroms = {chrom: ChromIndex(*arrays) for chrom, arrays in sites.items()}
+        source = "vcf"
+    rows = []
+    for chrom, idx in chroms.items():
+        rows += format_rows(chrom, *idx.windows(win, step))
+    write_table(out_path, rows)
+    return vcf, sum(len(idx) for idx in chroms.values()), source
+
+
+def main():
+    p = argparse.ArgumentParser(description="Windowed Weir & Cockerham FST from bgzipped VCFs")
+    p.add_argument("--vcf", nargs="+", required=True, help="Input VCF(s), e.g. one per chromosome")
+    p.add_argument("--pop", action="append", required=True, help="Sample list per population (use twice)")
+    p.add_argument("--win", type=int, default=50000, help="Window size (bp)")
+    p.add_argument("--step", type=int, default=50000, help="Window step (bp)")
+    p.add_argument("--outdir", required=True)
+    p.add_argument("--merged", default="allchr", help="Prefix of the merged/filtered tables in --outdir")
+    p.add_argument("--jobs", type=int, default=os.cpu_count() or 1)
+    p.add_argument("--block_sites", type=int, default=20000)
+    p.add_argument("--index_dir", default=None,
+                   help="Keep per-site components here (fst_index.py); current indexes replace VCF passes")
+    p.add_argument("--overwrite", action="store_true", help="Recompute from the VCFs")
+    args = p.parse_args()
+
+    if len(args.pop) < 2:
+        p.error("need at least two --pop files")
+    pop_samples = [read_samples(path) for path in args.pop]
+    vcfs = [v for v in args.vcf if os.path.exists(v)]
+    for v in set(args.vcf) - set(vcfs):
+        print(f"[skip] missing {v}")
+    if not vcfs:
+        sys.exit("No input VCFs found")
+    os.makedirs(args.outdir, exist_ok=True)
+
+    # With an index every table is rebuilt (cheaply, for the current WIN/STEP);
+    # without one, existing tables are kept
+    todo = [v for v in vcfs if args.overwrite or args.index_dir or not os.path.exists(table_path(args.outdir, v))]
+    todo.sort(key=os.path.getsize, reverse=True)
+    print(f"[fst] {len(vcfs) - len(todo)} tables present, {len(todo)} to compute on {args.jobs} processes")
+    with ProcessPoolExecutor(max_workers=max(1, min(args.jobs, len(todo) or 1))) as pool:
+        futures = [pool.submit(process_vcf, v, pop_samples, args.win, args.step, table_path(args.outdir, v),
+                               args.block_sites, args.index_dir, args.overwrite) for v in todo]
+        for fut in futures:
+            vcf, n_sites, source = fut.result()
+            print(f"[fst] {os.path.basename(vcf)}: {n_sites} informative sites (from {source})")
+
+    merged = os.path.join(args.outdir, f"{args.merged}.windowed.weir.fst")
+    filtered = os.path.join(args.outdir, f"{args.merged}.windowed.weir.filtered.fst")
+    rows = []
+    for v in vcfs:
+        with open(table_path(args.outdir, v)) as fh:
+            next(fh, None)
+            rows += fh.readlines()
+    write_table(merged, rows)
+    write_table(filtered, [r for r in rows if informative(r)])
+    print(f"[fst] {len(rows)} windows -> {merged}")
+
+
+if __name__ == "__main__":
+    main()
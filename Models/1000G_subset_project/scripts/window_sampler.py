@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Purpose
+-------
+Stratified sampling of FST windows and extraction of the sampled windows from the
+per-chromosome VCFs, in one Python stage. Replaces PPP `stat_sampler.py
+--sampling-scheme uniform`, the awk per-chromosome region split, and the
+`bcftools view -R` / `bcftools concat` fan-out of ppp_fst_bin_and_sample.sh.
+
+Usage
+-----
+python scripts/window_sampler.py \
+  --fst data/fst/CEU_CHS.allchr.windowed.weir.filtered.fst \
+  --nbins 3 --sample_total 300 --seed 12345 \
+  --out data/bins/CEU_CHS.uniform3.N300.windowed.weir.fst \
+  --regions data/bins/CEU_CHS.sampled_regions.tsv \
+  --vcf data/subsets/CEU_CHS.chr{1..22}.vcf.gz \
+  --vcf_out data/subsets_fst_sampled/CEU_CHS.sampled.windows.vcf.gz
+
+Outputs
+-------
+- --out      sampled windows: the input columns plus FST_BIN (0 = lowest), genome order
+- --regions  CHROM BIN_START BIN_END of the sampled windows (no header)
+- --vcf_out  with --vcf: records of the sampled windows from the indexed VCFs
+             (vcf_regions.py), one BGZF file
+
+Notes
+-----
+- Windows are binned on WEIGHTED_FST into --nbins bins, by quantiles (equal
+  counts, the default) or by equal width (--binning width); each bin contributes
+  sample_total / nbins windows, drawn without replacement. A bin with fewer
+  windows contributes all of them, with a warning.
+- The draw uses numpy's default_rng(--seed). Without --seed a seed is drawn from
+  OS entropy and printed, so the sample can be reproduced.
+"""
+
+import argparse, os, sys
+
+import numpy as np
+import pandas as pd
+
+from vcf_regions import extract, read_regions
+
+
+def assign_bins(values, nbins, binning="quantile"):
+    """0-based bin of every value; edges from quantiles or an equal-width grid."""
+    if binning == "quantile":
+        edges = np.quantile(values, np.linspace(0, 1, nbins + 1))
+    else:
+        edges = np.linspace(values.min(), values.max(), nbins + 1)
+    return np.searchsorted(edges[1:-1], values, side="right")
+
+
+def stratified_sample(bins, nbins, per_bin, rng):
+    """Sorted row indices: per_bin rows drawn without replacement from every bin."""
+    picked = []
+    for b in range(nbins):
+        rows = np.flatnonzero(bins == b)
+        if len(rows) < per_bin:
+            print(f"[warn] bin {b} has {len(rows)} windows (< {per_bin}); taking all of them")
+        picked.append(rng.choice(rows, size=min(per_bin, len(rows)), replace=False))
+    return np.sort(np.concatenate(picked))
+
+
+def main():
+    p = argparse.ArgumentParser(description="Stratified FST window sampling + indexed VCF extraction")
+    p.add_argument("--fst", required=True, help="Filtered windowed FST table")
+    p.add_argument("--nbins", type=int, default=3)
+    p.add_argument("--sample_total", type=int, default=300, help="Windows to sample; divisible by --nbins")
+    p.add_argument("--seed", type=int, default=None)
+    p.add_argument("--binning", choices=("quantile", "width"), default="quantile")
+    p.add_argument("--out", required=True, help="Sampled windows table")
+    p.add_argument("--regions", default=None, help="Also write CHROM START END of the sampled windows")
+    p.add_argument("--vcf", nargs="*", default=[], help="Indexed per-chromosome VCFs to extract from")
+    p.add_argument("--vcf_out", default=None, help="Combined .vcf.gz of the sampled windows")
+    args = p.parse_args()
+
+    if args.sample_total % args.nbins:
+        p.error(f"--sample_total ({args.sample_total}) must be divisible by --nbins ({args.nbins})")
+    if args.vcf and not (args.vcf_out and args.regions):
+        p.error("--vcf needs --vcf_out and --regions")
+
+    df = pd.read_csv(args.fst, sep="\t")
+    df = df[np.isfinite(pd.to_numeric(df["WEIGHTED_FST"], errors="coerce"))].reset_index(drop=True)
+    if df.empty:
+        sys.exit(f"No windows with a finite WEIGHTED_FST in {args.fst}")
+
+    seed = args.seed if args.seed is not None else int(np.random.SeedSequence().entropy % 2**32)
+    if args.seed is None:
+        print(f"[sample] no --seed given; using {seed}")
+    rng = np.random.default_rng(seed)
+
+    bins = assign_bins(df["WEIGHTED_FST"].to_numpy(dtype=float), args.nbins, args.binning)
+    rows = stratified_sample(bins, args.nbins, args.sample_total // args.nbins, rng)
+    sampled = df.iloc[rows].assign(FST_BIN=bins[rows])
+    for d in (args.out, args.regions, args.vcf_out):
+        if d and os.path.dirname(d):
+            os.makedirs(os.path.dirname(d), exist_ok=True)
+    sampled.to_csv(args.out, sep="\t", index=False)
+    print(f"[sample] {len(sampled)} of {len(df)} windows ({args.binning} bins: "
+          f"{np.bincount(bins[rows], minlength=args.nbins).tolist()}) -> {args.out}")
+
+    if args.regions:
+        sampled.iloc[:, :3].to_csv(args.regions, sep="\t", index=False, header=False)
+    if args.vcf:
+        vcfs = [v for v in args.vcf if os.path.exists(v)]
+        counts = extract(vcfs, read_regions(args.regions), args.vcf_out)
+        print(f"[extract] {sum(counts.values())} records -> {args.vcf_out}")
+
+
+if __name__ == "__main__":
+    main()
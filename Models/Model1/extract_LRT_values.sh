@@ -1,46 +1,21 @@
 #!/bin/bash
 
-# Script to extract 2LLR values, degrees of freedom (df), 
+# Script to extract 2LLR values, degrees of freedom (df),
 # compute p-values, and save results to a text file.
+#
+# Parsing and p-values are done by ima3_lrt.py, which reads every .LRT.out file of
+# LRT_outfiles_3pop/ and LRT_outfiles_2pop/ in parallel and computes all p-values
+# in one vectorized call. Besides LRT_results.txt it writes
+# All_LRT_results_{2pop,3pop}.csv next to the two directories.
+# MIXTURE=starred (or all) gives chi-bar-square p-values for boundary ("*") tests.
 
-# Output file name
-output_file="LRT_results.txt"
-
-# Write the header to the output file
-echo -e "Filename\t2LLR\t df\t p-value" > "$output_file"
-
-# Function to process files in a directory
-process_files_in_directory() {
-    dir="$1"  # Directory to process
-
-    # Loop through all files in the directory
-    for file in "$dir"/*; do
-        # Only process files with .LRT.out extension
-        if [[ $file =~ \.LRT\.out$ ]]; then
-            echo "Processing file: $file"
+set -euo pipefail
 
-            # Read each line in the file
-            while IFS= read -r line; do
-                # Use regular expression to extract the 2LLR statistic and degrees of freedom (df)
-                if [[ $line =~ [[:space:]]+([0-9]+\.[0-9]+)[[:space:]]+([0-9]+)[[:space:]]+([0-9]+)[[:space:]]+[0-9]+\.[0-9]+ ]]; then
-                    llr="${BASH_REMATCH[1]}"  # Extracted 2LLR value
-                    df="${BASH_REMATCH[2]}"   # Extracted degrees of freedom
+SCRIPT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
+IMA3_LRT="${IMA3_LRT:-$SCRIPT_DIR/../../tests_of_ghost_introgression_pipeline/scripts/ima3_lrt.py}"
 
-                    # Compute the p-value using Python's SciPy package
-                    p_value=$(python3 -c "import scipy.stats as stats; print(stats.chi2.sf($llr, $df))")
-
-                    # Append results to the output file, including the filename
-                    echo -e "$file\t$llr\t $df\t $p_value" >> "$output_file"
-                fi
-            done < "$file"
-        fi
-    done
-}
-
-# Process the 3pop and 2pop directories
-process_files_in_directory "LRT_outfiles_3pop"
-process_files_in_directory "LRT_outfiles_2pop"
+# Output file name
+output_file="LRT_results.txt"
 
-# Print confirmation message
-echo "Results saved to $output_file"
-L
\ No newline at end of file
+python3 "$IMA3_LRT" --results_dir . --sets 3pop 2pop \
+    --mixture "${MIXTURE:-none}" --combined "$output_file"
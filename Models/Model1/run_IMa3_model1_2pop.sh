@@ -11,15 +11,22 @@
 cd $PBS_O_WORKDIR
 NCORES=$(wc -w < $PBS_NODEFILE)
 
-echo "Running 2-population IMa3 model with $NCORES cores"
+# Several runs share the node: NCORES / PROCS jobs of PROCS MPI processes each.
+# IMa3's -hn is per process: CHAINS (default 120, the old -hn) heated chains per
+# process, PROCS * CHAINS per run (the old single run had NCORES * 120; PROCS=NCORES
+# reproduces it). TOTAL_CHAINS instead fixes the per-run total, -hn =
+# ceil(TOTAL_CHAINS / PROCS). Finished runs are recorded in
+# ima3_jobs.tsv, so resubmitting the script continues the queue; outputs written
+# before the ledger existed count as finished unless RERUN=1. Wall times per
+# PROCS split: python ../ima3_scheduler.py --report --ledger ima3_jobs.tsv
+PROCS=${PROCS:-4}
+CHAINS=${CHAINS:-120}
+SCHEDULER=${SCHEDULER:-../ima3_scheduler.py}
 
-for FILE in *_2pop.u
-do
-    echo "Running IMa3 on $FILE"
-    mpirun -np $NCORES IMa3 -i "$FILE" \
-        -o "${FILE%.u}.out" \
-        -q100 -m5.5 -t5.5 \
-        -b10000 -L5000 -d200 -p 2 -r245 \
-        -hn 120 -ha 0.99 -hb 0.9
-done
+echo "Running 2-population IMa3 model with $NCORES cores ($PROCS processes per run)"
 
+python3 "$SCHEDULER" *_2pop.u \
+    --stage mcmc --ima3 IMa3 --cores "$NCORES" --procs "$PROCS" --chains "$CHAINS" \
+    ${TOTAL_CHAINS:+--total_chains "$TOTAL_CHAINS"} \
+    --ha 0.99 --hb 0.9 --out '{name}.out' --ledger ima3_jobs.tsv ${RERUN:+--rerun} \
+    -- -q100 -m5.5 -t5.5 -b10000 -L5000 -d200 -p 2 -r245
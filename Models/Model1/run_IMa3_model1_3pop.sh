@@ -11,15 +11,21 @@
 cd $PBS_O_WORKDIR
 NCORES=$(wc -w < $PBS_NODEFILE)
 
-echo "Running 3-population IMa3 model (with ghost) using $NCORES cores"
+# Several runs share the allocation: NCORES / PROCS jobs of PROCS MPI processes
+# each. IMa3's -hn is per process: CHAINS (default 120, the old -hn) heated chains
+# per process, PROCS * CHAINS per run (the old single run had NCORES * 120;
+# PROCS=NCORES reproduces it). TOTAL_CHAINS instead fixes the per-run total, -hn =
+# ceil(TOTAL_CHAINS / PROCS). Finished runs are recorded in
+# ima3_jobs_ghost.tsv, so resubmitting the script continues the queue; outputs
+# written before the ledger existed count as finished unless RERUN=1.
+PROCS=${PROCS:-10}
+CHAINS=${CHAINS:-120}
+SCHEDULER=${SCHEDULER:-../ima3_scheduler.py}
 
-for FILE in *.u
-do
-    echo "Running IMa3 on $FILE (ghost model)"
-    mpirun -np $NCORES IMa3 -i "$FILE" \
-        -o "${FILE%.u}_ghost.out" \
-        -q100 -m5.5 -t5.5 \
-        -b100000 -L5000 -d200 -p 2 -r245 \
-        -hn 120 -ha 0.99 -hb 0.9 -j1
-done
+echo "Running 3-population IMa3 model (with ghost) using $NCORES cores ($PROCS processes per run)"
 
+python3 "$SCHEDULER" *.u \
+    --stage mcmc --ima3 IMa3 --cores "$NCORES" --procs "$PROCS" --chains "$CHAINS" \
+    ${TOTAL_CHAINS:+--total_chains "$TOTAL_CHAINS"} \
+    --ha 0.99 --hb 0.9 --out '{name}_ghost.out' --ledger ima3_jobs_ghost.tsv ${RERUN:+--rerun} \
+    -- -q100 -m5.5 -t5.5 -b100000 -L5000 -d200 -p 2 -r245 -j1
@@ -8,25 +8,18 @@
 # - IMa3 must be compiled and located at ../../IMa3/IMa3 relative to the script
 # - Input files must have a .u extension
 # - Output will be saved in ./LRT_outfiles_2pop/
+#
+# Each test is a single-process IMa3 run; ../ima3_scheduler.py runs NCORES of them
+# at once (default: all cores), skips tests already finished (ledger:
+# ./LRT_outfiles_2pop/ima3_jobs.tsv). Outputs written before the ledger existed
+# count as finished unless RERUN=1.
 
-# Loop over all .u files in the specified input directory
-for FILE in ./original.u_Files_2pop/*.u; do
-    echo "Processing file: $FILE"
+NCORES=${NCORES:-$(nproc)}
 
-    # Strip the directory and .u extension to get a base name for the output
-    BASENAME=$(basename "$FILE" .u)
-    echo "Running 2-pop LRT on: $BASENAME"
-
-    # Run the IMa3 program with specified parameters using mpirun
-    mpirun -np 1 ../../IMa3/IMa3 \
-        -i "$FILE" \
-        -r0 \
-        -v "./geneology.ti_Files_2pop/" \
-        -L 5000 \
-        -m 5.5 \
-        -q 100 \
-        -t 5.5 \
-        -o "./LRT_outfiles_2pop/${BASENAME}.2pop.LRT.out"
-done
+python3 "${SCHEDULER:-../ima3_scheduler.py}" ./original.u_Files_2pop/*.u \
+    --stage lrt --ima3 ../../IMa3/IMa3 --cores "$NCORES" --procs 1 ${RERUN:+--rerun} \
+    --ti "./geneology.ti_Files_2pop/" \
+    --out "./LRT_outfiles_2pop/{name}.2pop.LRT.out" \
+    -- -r0 -L 5000 -m 5.5 -q 100 -t 5.5
 
 echo "2-pop LRT analysis completed for all files."
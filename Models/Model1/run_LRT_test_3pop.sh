@@ -9,39 +9,18 @@
 # - Genealogy files must be present in ./geneology.ti_Files_3pop/ and named like: <input>.u.out.ti
 # - Input files must have a .u extension
 # - Output will be saved in ./LRT_outfiles_3pop/
-
-# Create output directory if it doesn't exist
-mkdir -p ./LRT_outfiles_3pop/
-
-# Loop over all .u files in the specified input directory
-for FILE in ./original.u_Files_3pop/*.u; do
-    echo "Processing file: $FILE"
-
-    # Get the base name without directory and extension
-    BASENAME=$(basename "$FILE" .u)
-    echo "Running 3-pop LRT on: $BASENAME"
-
-    # Define expected .ti file
-    TI_FILE="./geneology.ti_Files_3pop/${BASENAME}.u.out.ti"
-
-    # Check if the genealogy .ti file exists
-    if [[ ! -f "$TI_FILE" ]]; then
-        echo "Skipping $BASENAME — missing genealogy file: $TI_FILE"
-        continue
-    fi
-
-    # Run the IMa3 program with specified parameters using mpirun
-    mpirun -np 1 ../../IMa3/IMa3 \
-        -i "$FILE" \
-        -r0 \
-        -v "$TI_FILE" \
-        -L 5000 \
-        -m 5.5 \
-        -q 100 \
-        -t 5.5 \
-        -o "./LRT_outfiles_3pop/${BASENAME}.3pop.LRT.out"
-
-    echo "Finished 3-pop LRT: $BASENAME"
-done
+#
+# Each test is a single-process IMa3 run; ../ima3_scheduler.py runs NCORES of them
+# at once (default: all cores), skips inputs without a .ti file and tests already
+# finished (ledger: ./LRT_outfiles_3pop/ima3_jobs.tsv). Outputs written before the
+# ledger existed count as finished unless RERUN=1.
+
+NCORES=${NCORES:-$(nproc)}
+
+python3 "${SCHEDULER:-../ima3_scheduler.py}" ./original.u_Files_3pop/*.u \
+    --stage lrt --ima3 ../../IMa3/IMa3 --cores "$NCORES" --procs 1 ${RERUN:+--rerun} \
+    --ti "./geneology.ti_Files_3pop/{name}.u.out.ti" \
+    --out "./LRT_outfiles_3pop/{name}.3pop.LRT.out" \
+    -- -r0 -L 5000 -m 5.5 -q 100 -t 5.5
 
 echo "3-pop LRT analysis completed for all files."
@@ -31,6 +31,9 @@ echo "Job submitted: $DATE"
 DIR="/usr/scratch/userdata/mwanjiku/ghost-pop-gen/Models/Model1_fasta_files"
 cd $DIR
 
+# TMRCA extraction script (scripts/smc_tmrca.py of this repository)
+export SMC_TMRCA="${SMC_TMRCA:-/usr/scratch/userdata/mwanjiku/ghost-pop-gen/scripts/smc_tmrca.py}"
+
 # Function to process each FASTA file
 process_file() {
     FILE=$1
@@ -47,7 +50,8 @@ process_file() {
     
     # Extract TMRCA for each ARG
     echo "Extracting TMRCA for $FILE"
-    arg-extract-tmrca ${FILE}.arg.%d.smc.gz > ${FILE%.fasta}.tmrca.txt
+    # Python 3 SMC reader (no argweaver_py2 needed); column 5 is the median TMRCA
+    "${PYTHON3:-python3}" "$SMC_TMRCA" "${FILE}.arg.%d.smc.gz" --out "${FILE%.fasta}.tmrca.txt" --jobs 1
 
     
     echo "TMRCA extraction completed for $FILE"
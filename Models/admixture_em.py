@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+
+"""
+admixture_em.py
+
+In-process NumPy fit of the ADMIXTURE binomial model, used by
+bootstrap_structure_lrt_all.py as an alternative to launching the admixture binary.
+
+Model: genotype g_il in {0, 1, 2} counts copies of allele 1 and
+    g_il ~ Binomial(2, sum_k Q[i, k] * P[l, k])
+with log-likelihood sum_il [g log p + (2 - g) log(1 - p)], the value ADMIXTURE
+reports as "Loglikelihood". Missing genotypes (any value outside 0..2) are skipped.
+genos may also be a memory-mapped genotype_store.GenotypeStore (dosages use 3 for
+missing): it is then read block_loci loci at a time on every pass instead of being
+decoded whole, so only the packed file mapping and one decoded block are in memory.
+
+The fit is the standard EM update for (Q, P), written as matrix products over
+individuals and loci so no (I, K, L) array is ever built, and accelerated with
+SQUAREM (Varadhan & Roland 2008) with a monotone fallback. Q and P follow the
+ADMIXTURE .Q/.P layouts: Q is (I, K), P is (L, K).
+"""
+
+import numpy as np
+
+# Parameter bounds, as in ADMIXTURE
+P_MIN = 1e-5
+Q_MIN = 1e-5
+
+# Likelihood
+
+def _prepare(genos):
+    """
+    Returns (G, observed) as float arrays with missing genotypes zeroed out.
+    genos may be dosages (I, L) or allele copies (I, L, 2).
+    """
+    G = np.asarray(genos)
+    if G.ndim == 3:
+        G = G.sum(axis=2)
+    G = G.astype(float)
+    observed = (G >= 0) & (G <= 2)
+    return np.where(observed, G, 0.0), observed.astype(float)
+
+def _project(Q, P):
+    P = np.clip(P, P_MIN, 1 - P_MIN)
+    Q = np.clip(Q, Q_MIN, 1.0)
+    Q /= Q.sum(axis=1, keepdims=True)
+    return Q, P
+
+def _blocks(genos, block_loci):
+    """
+    Returns (I, L, blocks) where blocks() yields (start, stop, G, observed) over
+    loci. Arrays are prepared once as a single block; a store (anything with
+    iter_blocks) is decoded block by block on every call.
+    """
+    if hasattr(genos, "iter_blocks"):
+        I, L = genos.shape
+
+        def blocks():
+            for start, stop, D in genos.iter_blocks(block_loci):
+                yield (start, stop) + _prepare(D)
+        return I, L, blocks
+    G, observed = _prepare(genos)
+    block = [(0, G.shape[1], G, observed)]
+    return G.shape[0], G.shape[1], lambda: block
+
+def _block_loglik(G, observed, Q, P):
+    p = np.clip(Q @ P.T, P_MIN, 1 - P_MIN)
+    return float(np.sum(G * np.log(p) + (2 * observed - G) * np.log1p(-p)))
+
+def _loglik(blocks, Q, P):
+    return sum(_block_loglik(G, observed, Q, P[start:stop])
+               for start, stop, G, observed in blocks())
+
+def admixture_loglik(genos, Q, P, block_loci=4096):
+    """
+    Log-likelihood of genotypes under ancestry Q (I, K) and frequencies P (L, K).
+    """
+    _, _, blocks = _blocks(genos, block_loci)
+    return _loglik(blocks, np.asarray(Q, float), np.asarray(P, float))
+
+# EM
+
+def _em_step(blocks, n_copies, Q, P):
+    """
+    One EM update of (Q, P). n_copies is the (I, 1) count of observed allele copies.
+    P is updated block by block; the Q update sums over all blocks.
+    """
+    S = np.zeros_like(Q)
+    P_new = np.empty_like(P)
+    for start, stop, G, observed in blocks():
+        Pb = P[start:stop]
+        p = np.clip(Q @ Pb.T, P_MIN, 1 - P_MIN)
+        R1 = G / p                              # (I, l)
+        R0 = (2 * observed - G) / (1 - p)
+        S += R1 @ Pb + R0 @ (1 - Pb)
+        A = Pb * (R1.T @ Q)                     # (l, K) expected allele-1 copies
+        B = (1 - Pb) * (R0.T @ Q)
+        P_new[start:stop] = A / np.maximum(A + B, 1e-300)
+    return _project(Q * S / n_copies, P_new)
+
+def _initial_values(I, L, K, Q0, P0, seed):
+    rng = np.random.default_rng(seed)
+    if Q0 is None:
+        Q0 = rng.dirichlet(np.ones(K), size=I)
+    if P0 is None:
+        P0 = rng.uniform(0.05, 0.95, size=(L, K))
+    Q0 = np.array(Q0, dtype=float)
+    P0 = np.array(P0, dtype=float)
+    if Q0.shape != (I, K) or P0.shape != (L, K):
+        raise ValueError(f"Warm start shapes Q{Q0.shape}/P{P0.shape} do not match "
+                         f"I={I}, L={L}, K={K}")
+    return _project(Q0, P0)
+
+def fit_admixture(genos, K, Q0=None, P0=None, seed=None, tol=1e-4, max_iter=5000,
+                  accelerate=True, block_loci=4096):
+    """
+    Maximizes the admixture log-likelihood for K clusters.
+
+    genos: (I, L) allele-1 dosages, (I, L, 2) allele copies or a GenotypeStore
+    Q0, P0: optional warm start, shapes (I, K) and (L, K); random if omitted
+    tol: stop when an iteration improves the log-likelihood by less than tol
+    block_loci: loci decoded at a time when genos is a GenotypeStore
+
+    Returns a dict with 'loglik', 'P' (L, K), 'Q' (I, K), 'iterations', 'converged'.
+    """
+    I, L, blocks = _blocks(genos, block_loci)
+    n_copies = np.zeros((I, 1))
+    for _, _, _, observed in blocks():
+        n_copies += 2 * observed.sum(axis=1, keepdims=True)
+    n_copies = np.maximum(n_copies, 1)
+    Q, P = _initial_values(I, L, K, Q0, P0, seed)
+
+    def step(Q, P):
+        return _em_step(blocks, n_copies, Q, P)
+
+    ll = _loglik(blocks, Q, P)
+    converged = False
+    it = 0
+    while it < max_iter:
+        if accelerate:
+            Q1, P1 = step(Q, P)
+            Q2, P2 = step(Q1, P1)
+            rQ, rP = Q1 - Q, P1 - P
+            vQ, vP = Q2 - Q1 - rQ, P2 - P1 - rP
+            r_norm = np.sqrt(np.sum(rQ ** 2) + np.sum(rP ** 2))
+            v_norm = np.sqrt(np.sum(vQ ** 2) + np.sum(vP ** 2))
+            alpha = -r_norm / v_norm if v_norm > 0 else -1.0
+            alpha = min(alpha, -1.0)
+            Qx, Px = _project(Q - 2 * alpha * rQ + alpha ** 2 * vQ,
+                              P - 2 * alpha * rP + alpha ** 2 * vP)
+            Qn, Pn = step(Qx, Px)
+            ll_new = _loglik(blocks, Qn, Pn)
+            ll2 = _loglik(blocks, Q2, P2)
+            if not np.isfinite(ll_new) or ll_new < ll2:
+                Qn, Pn, ll_new = Q2, P2, ll2
+            it += 3
+        else:
+            Qn, Pn = step(Q, P)
+            ll_new = _loglik(blocks, Qn, Pn)
+            it += 1
+
+        improvement = ll_new - ll
+        Q, P, ll = Qn, Pn, ll_new
+        if abs(improvement) < tol:
+            converged = True
+            break
+
+    return {"loglik": ll, "P": P, "Q": Q, "iterations": it, "converged": converged}
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+
+"""
+bootstrap_executor.py
+
+Process-pool work queue with an on-disk ledger for the STRUCTURE bootstrap LRT.
+
+Every (model, replicate, K, b) fit pair is an independent task. Tasks are fanned out
+over a ProcessPoolExecutor and each finished task is appended to a tab-separated
+ledger as soon as it returns, so an interrupted run can be restarted and will only
+submit the tasks that are not in the ledger yet. The parent process is the only
+writer, so the ledger needs no locking.
+
+Seeds are derived from the task key, never from submission order, which keeps
+results identical at any worker count. The key does not cover the run settings
+(seed, loci sampled, backend, ...), so the ledger's first line records them as
+"# config {json}" and a ledger written with other settings is refused.
+"""
+
+import json
+import os
+import zlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+LEDGER_COLUMNS = ["model", "replicate", "K", "b", "ll_K", "ll_K1", "T"]
+
+# Seeds
+
+def transition_seed(seed, model, replicate, k):
+    """
+    SeedSequence for one K -> K+1 transition. Draw b of the transition uses spawn
+    key b of this sequence (see genotype_sim.replicate_generators).
+    """
+    tag = zlib.crc32(f"{model}/{replicate}/K{k}".encode())
+    return np.random.SeedSequence([seed, tag])
+
+# Ledger
+
+def task_key(model, replicate, k, b):
+    return (str(model), str(replicate), int(k), int(b))
+
+def _config_line(config):
+    return "# config " + json.dumps(config, sort_keys=True) + "\n"
+
+def load_ledger(path, config=None):
+    """
+    Reads finished tasks from the ledger. Returns {task_key: {column: value}}.
+    A truncated last line from an interrupted write is ignored. With config, raises
+    ValueError if the ledger was written with a different (or no) configuration.
+    """
+    done = {}
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return done
+    with open(path) as fh:
+        first = fh.readline()
+        stored = json.loads(first[len("# config "):]) if first.startswith("# config ") else None
+        if config is not None and stored != json.loads(json.dumps(config)):
+            raise ValueError(f"Ledger {path} was written with configuration {stored}, "
+                             f"not {config}; use another output directory or delete the ledger")
+        header = (fh.readline() if first.startswith("#") else first).rstrip("\n").split("\t")
+        for line in fh:
+            parts = line.rstrip("\n").split("\t")
+            if len(parts) != len(header):
+                continue
+            row = dict(zip(header, parts))
+            try:
+                key = task_key(row["model"], row["replicate"], row["K"], row["b"])
+                done[key] = {
+                    "ll_K": float(row["ll_K"]),
+                    "ll_K1": float(row["ll_K1"]),
+                    "T": float(row["T"]),
+                }
+            except (KeyError, ValueError):
+                continue
+    return done
+
+def open_ledger(path, config=None):
+    """
+    Opens the ledger for appending, writing the config line and header if the file is new.
+    """
+    is_new = not os.path.exists(path) or os.path.getsize(path) == 0
+    fh = open(path, "a")
+    if is_new:
+        if config is not None:
+            fh.write(_config_line(config))
+        fh.write("\t".join(LEDGER_COLUMNS) + "\n")
+        fh.flush()
+    return fh
+
+def append_ledger(fh, key, ll_k, ll_k1, T):
+    model, replicate, k, b = key
+    fh.write(f"{model}\t{replicate}\t{k}\t{b}\t{ll_k!r}\t{ll_k1!r}\t{T!r}\n")
+    fh.flush()
+    os.fsync(fh.fileno())
+
+# Executor
+
+def run_tasks(tasks, worker, ledger_path, workers=1, config=None):
+    """
+    Runs worker(task) for every task whose key is not already in the ledger.
+
+    tasks: iterable of (key, task) pairs, key as returned by task_key()
+    worker: picklable callable returning (ll_K, ll_K1)
+    config: JSON-serializable run settings the ledger must match (see load_ledger)
+
+    Returns the full ledger contents (previous and new results). Failed tasks are
+    reported and left out of the ledger so a rerun retries them.
+    """
+    done = load_ledger(ledger_path, config)
+    tasks = list(tasks)
+    pending = [(key, task) for key, task in tasks if key not in done]
+    if len(pending) < len(tasks):
+        print(f"Ledger {ledger_path}: {len(tasks) - len(pending)} tasks already done, "
+              f"{len(pending)} to run")
+
+    with open_ledger(ledger_path, config) as ledger, \
+            ProcessPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = {pool.submit(worker, task): key for key, task in pending}
+        for fut in as_completed(futures):
+            key = futures[fut]
+            try:
+                ll_k, ll_k1 = fut.result()
+            except Exception as e:
+                print(f"Task {key} failed: {e}")
+                continue
+            T = -2 * (ll_k - ll_k1)
+            append_ledger(ledger, key, ll_k, ll_k1, T)
+            done[key] = {"ll_K": ll_k, "ll_K1": ll_k1, "T": T}
+
+    return done
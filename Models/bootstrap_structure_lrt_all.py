@@ -9,99 +9,60 @@ to assess model support for different values of K (number of ancestral populatio
 Steps:
 1. Parses STRUCTURE output files to extract Q matrices and allele frequencies.
 2. Simulates genotypes under the current K model.
-3. Re-runs ADMIXTURE on simulated data at K and K+1.
+3. Writes simulated genotypes as PLINK .bed and re-runs ADMIXTURE at K and K+1
+   (or, with --backend numpy, fits both models in-process; see admixture_em.py).
 4. Computes the test statistic T_obs and compares it to a bootstrapped null distribution.
 5. Outputs per-model, per-replicate test results into CSV.
 
+Every (model, replicate, K, b) draw runs as an independent task on a process pool
+(--workers, with --threads ADMIXTURE threads each). Finished tasks are recorded in
+<output_dir>/ledger.tsv so an interrupted run resumes where it stopped, and each task
+derives its seed from its own key so results do not depend on the worker count.
+The ledger records --root, --seed, --loci_sample, --backend and --cold_start; a run
+with different values in the same --output_dir is refused. Draws that failed are
+left out of the p-value (and retried by the next run).
+With --sequential, draws are submitted in rounds and a transition stops as soon as
+its p-value is decided relative to --alpha (see sequential_pvalue.py) on draws 1..n
+without gaps, failed draws being resubmitted in later rounds; the number of draws
+used is reported in the B_used column.
+With --calibrated, only --pilot draws are run per transition, a scaled chi-square or
+gamma null is fitted to them (see lrt_calibration.py), and the p-value comes from the
+fitted distribution; transitions whose fit diagnostic is poor fall back to all
+--bootstraps draws. The p_method, calib_ks and calib_ks_p columns record which.
+Fits are looked up in a content-addressed cache (<output_dir>/fit_cache, see
+fit_cache.py) before anything is run, so a rerun or a second analysis over the same
+simulated data reuses finished ADMIXTURE/NumPy fits; --no_fit_cache disables it.
+
 Author: [Your Name or Institution]
 Date: [Optional]
 """
 
 import os
 import re
+import sys
+import shutil
+import argparse
 import numpy as np
 import pandas as pd
 from glob import glob
 import subprocess
 
-# STRUCTURE Parsing
-
-def parse_structure_output(filepath):
-    """
-    Parses STRUCTURE output file to extract:
-    - Q matrix: ancestry proportions (individuals x clusters)
-    - Allele frequencies per locus per cluster
-    """
-    q_matrix = []
-    freqs = {}
-    reading_q = False
-    reading_freqs = False
-    current_locus = None
-    locus_counter = 1
-    cluster_id = 0  # STRUCTURE outputs one cluster block at a time
-
-    with open(filepath, 'r') as file:
-        lines = file.readlines()
-
-    for line in lines:
-        stripped = line.strip()
-
-        if "Inferred ancestry of individuals" in stripped:
-            reading_q = True
-            continue
-
-        if reading_q:
-            if not stripped or "Label" in stripped:
-                continue
-            if "Estimated Allele Frequencies in each cluster" in stripped:
-                reading_q = False
-                reading_freqs = True
-                continue
-            try:
-                parts = stripped.split(":")[-1].strip().split()
-                q_matrix.append([float(x) for x in parts])
-            except ValueError:
-                continue
-
-        if reading_freqs and "First column gives estimated ancestral frequencies" in stripped:
-            continue
-
-        if reading_freqs:
-            if stripped.startswith("Locus"):
-                current_locus = f"L{locus_counter}"
-                locus_counter += 1
-                continue
-            if stripped.startswith("Values of parameters used"):
-                break
-            parts = stripped.split()
-            if len(parts) >= 3 and parts[0].isdigit():
-                allele = parts[0]
-                try:
-                    freq = float(parts[-1])
-                    freqs[(cluster_id, current_locus, allele)] = freq
-                except ValueError:
-                    continue
+from genotype_sim import simulate_genotypes_batch
+from plink_bed import write_bed
+from bootstrap_executor import load_ledger, run_tasks, task_key, transition_seed
+from admixture_em import fit_admixture
+from sequential_pvalue import sequential_pvalue
+from fit_cache import DEFAULT_MAX_BYTES, FitCache, fit_key, hash_arrays, hash_genotypes
 
-    return np.array(q_matrix), freqs
+# The STRUCTURE _f parser and its cache are shared with the Snakemake pipeline scripts
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir,
+                                "tests_of_ghost_introgression_pipeline", "scripts"))
+from structure_output import load_structure_f
+from lrt_calibration import METHODS as CALIBRATION_METHODS, calibrate
 
 # Genotype simulation
 
-def convert_freqs_to_array(freqs, loci_ids, alleles, K):
-    """
-    Converts allele frequencies from dictionary to structured NumPy array of shape (K, L, A)
-    """
-    L = len(loci_ids)
-    A = len(alleles)
-    arr = np.zeros((K, L, A))
-    for k in range(K):
-        for l_idx, locus in enumerate(loci_ids):
-            for a_idx, a in enumerate(alleles):
-                key = (k, locus, a)
-                if key in freqs:
-                    arr[k, l_idx, a_idx] = freqs[key]
-    return arr
-
-def simulate_genotypes(I, L, allele_freqs, q_matrix):
+def simulate_genotypes(I, L, allele_freqs, q_matrix, seed=None):
     """
     Simulates diploid genotypes given:
     - I individuals
@@ -111,63 +72,22 @@ def simulate_genotypes(I, L, allele_freqs, q_matrix):
     
     Returns: array of shape (I, L, 2)
     """
-    K = allele_freqs.shape[0]
-    ploidy = 2
-    genos = np.zeros((I, L, ploidy), dtype=int)
-    for i in range(I):
-        q_probs = q_matrix[i]
-        if np.sum(q_probs) == 0:
-            raise ValueError(f"Invalid q_matrix for individual {i}: sum=0")
-        q_probs = np.clip(q_probs, 0, 1)
-        q_probs /= np.sum(q_probs)
-        for l in range(L):
-            for p in range(ploidy):
-                k = np.random.choice(K, p=q_probs)
-                p1 = allele_freqs[k, l, 1]
-                allele_probs = np.clip([1 - p1, p1], 0, 1)
-                allele_probs /= np.sum(allele_probs)
-                allele = np.random.choice([0, 1], p=allele_probs)
-                genos[i, l, p] = allele
-    return genos
+    return simulate_genotypes_batch(q_matrix[:I], allele_freqs[:, :L], 1, seed=seed)[0]
 
 # PLINK/ADMIXTURE I/O
 
-def write_ped_map(genos, loci_ids, output_prefix):
-    """
-    Writes PLINK .ped and .map files for ADMIXTURE input
-    """
-    I, L, P = genos.shape
-    with open(f"{output_prefix}.ped", 'w') as ped:
-        for i in range(I):
-            row = ['FAM1', f'ind{i+1}', '0', '0', '1', '1']
-            for l in range(L):
-                alleles = [str(genos[i, l, j] + 1) for j in range(P)]
-                row.extend(alleles)
-            ped.write(' '.join(row) + '\n')
-    with open(f"{output_prefix}.map", 'w') as mapf:
-        for idx, locus in enumerate(loci_ids):
-            mapf.write(f"1\t{locus}\t0\t{idx+1}\n")
-
-def convert_to_bed(ped_prefix):
+def run_admixture(bed_prefix, K, threads=1):
     """
-    Converts PLINK .ped/.map to binary .bed format using PLINK
-    """
-    cmd = ["plink", "--file", ped_prefix, "--make-bed", "--out", ped_prefix]
-    subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
-
-def run_admixture(ped_prefix, K):
-    """
-    Runs ADMIXTURE on binary .bed file and extracts log-likelihood from the log output.
+    Runs ADMIXTURE on the .bed/.bim/.fam fileset written by write_bed() and extracts
+    log-likelihood from the log output.
     Ensures all output is written inside the correct directory.
     """
-    convert_to_bed(ped_prefix)
-
-    dirname = os.path.dirname(ped_prefix)
-    basename = os.path.basename(ped_prefix)
+    dirname = os.path.dirname(bed_prefix)
+    basename = os.path.basename(bed_prefix)
     log_file = os.path.join(dirname, f"{basename}.{K}.log")
     bed_file = f"{basename}.bed"
 
-    cmd = ["admixture", "--cv", bed_file, str(K)]
+    cmd = ["admixture", "--cv", f"-j{threads}", bed_file, str(K)]
     
     with open(log_file, "w") as lf:
         subprocess.run(cmd, cwd=dirname, stdout=lf, stderr=lf, check=True)
@@ -181,6 +101,14 @@ def run_admixture(ped_prefix, K):
 
     raise RuntimeError(f"Loglikelihood not found in {log_file}")
 
+def read_admixture_outputs(bed_prefix, K):
+    """
+    Loads the .P (L, K) and .Q (I, K) matrices ADMIXTURE wrote next to bed_prefix.
+    """
+    P = np.loadtxt(f"{bed_prefix}.{K}.P", ndmin=2)
+    Q = np.loadtxt(f"{bed_prefix}.{K}.Q", ndmin=2)
+    return P, Q
+
 
 # File helpers
 
@@ -190,24 +118,98 @@ def find_k_files(rep_dir):
 def extract_k(filename):
     return int(re.findall(r'K(\d+)', filename)[0])
 
-# Main routine
+# Bootstrap tasks
 
-def main():
+def open_fit_cache(task):
     """
-    Main entry point for running bootstrap LRT analysis
+    Returns the task's FitCache, or None when caching is disabled.
     """
-    root = "structure_outputs"
-    bootstraps = 100
-    loci_sample = 200
-    alleles = ['1', '2']
-    results = []
-
-    # Create clean output directory for bootstrap simulations
-    output_dir = "bootstrap_temp"
-    os.makedirs(output_dir, exist_ok=True)
-
-    print("Starting parametric bootstrap analysis...\n")
+    if not task.get("fit_cache"):
+        return None
+    return FitCache(task["fit_cache"], max_bytes=task.get("fit_cache_bytes") or DEFAULT_MAX_BYTES)
 
+def cached_fit(cache, data_hash, K, fit, seed=None, backend="admixture", **options):
+    """
+    Returns the log-likelihood of fit() (which returns (loglik, P, Q)) for K clusters,
+    reusing a cached result for the same data, K, seed and options when there is one.
+    """
+    if cache is None:
+        return fit()[0]
+    key = fit_key(data_hash, K, seed=seed, backend=backend, **options)
+    entry = cache.get(key)
+    if entry is not None:
+        return entry["loglik"]
+    loglik, P, Q = fit()
+    cache.put(key, loglik, P, Q)
+    return loglik
+
+def run_bootstrap_task(task):
+    """
+    Runs one bootstrap draw: simulates replicate b of a K -> K+1 transition and fits
+    K and K+1 either with the admixture binary on a task-private .bed fileset or
+    in-process with the NumPy backend. Fits already in the fit cache are not rerun.
+    Draw b=0 is the observed-statistic draw; b=1..B are the bootstrap draws.
+    Returns (ll_K, ll_K1).
+    """
+    genos = simulate_genotypes_batch(task["q"], task["freqs"], 1, seed=task["seed"],
+                                     first_replicate=task["b"])[0]
+    cache = open_fit_cache(task)
+    data_hash = hash_genotypes(genos) if cache is not None else None
+    if task["backend"] == "numpy":
+        return fit_in_process(genos, task, cache, data_hash)
+
+    task_dir = os.path.join(task["output_dir"], task["model"], task["replicate"],
+                            f"K{task['K']}", f"b{task['b']:04d}")
+    prefix = os.path.join(task_dir, "sim")
+
+    def fit(K):
+        if not os.path.exists(f"{prefix}.bed"):
+            os.makedirs(task_dir, exist_ok=True)
+            write_bed(genos, task["loci"], prefix)
+        ll = run_admixture(prefix, K, threads=task["threads"])
+        return (ll, *read_admixture_outputs(prefix, K))
+
+    # Thread count does not change the ADMIXTURE result, so it is not part of the key
+    ll_k, ll_k1 = (cached_fit(cache, data_hash, K, lambda K=K: fit(K), cv=True)
+                   for K in (task["K"], task["K"] + 1))
+
+    # Keep the fileset of failed tasks for debugging; finished ones are in the ledger
+    shutil.rmtree(task_dir, ignore_errors=True)
+    return ll_k, ll_k1
+
+def fit_in_process(genos, task, cache=None, data_hash=None):
+    """
+    Fits K and K+1 with the NumPy admixture backend. With warm starts, each fit begins
+    at the STRUCTURE estimates for the observed data, which the simulated data were
+    drawn from; otherwise it starts from a random point derived from the task seed.
+    Returns (ll_K, ll_K1).
+    """
+    k = task["K"]
+    lls = []
+    for K, q, freqs in ((k, task["q"], task["freqs"]), (k + 1, task["q1"], task["freqs1"])):
+        if task["warm_start"]:
+            Q0, P0 = q, freqs[:, :, 1].T
+            run = lambda: fit_admixture(genos, K, Q0=Q0, P0=P0)
+            seed, options = None, {"init": hash_arrays(Q0, P0)}
+        else:
+            ss = np.random.SeedSequence(task["seed"].entropy,
+                                        spawn_key=task["seed"].spawn_key + (task["b"], K))
+            run = lambda: fit_admixture(genos, K, seed=ss)
+            seed, options = [ss.entropy, list(ss.spawn_key)], {}
+
+        def fit():
+            res = run()
+            return res["loglik"], res["P"], res["Q"]
+
+        lls.append(cached_fit(cache, data_hash, K, fit, seed=seed, backend="numpy", **options))
+    return tuple(lls)
+
+def collect_transitions(root, loci_sample):
+    """
+    Parses every usable K -> K+1 transition under root.
+    Returns a list of dicts holding the K-model Q matrix and allele frequency array.
+    """
+    transitions = []
     for model_path in sorted(glob(f"{root}/model*/")):
         model = os.path.basename(os.path.normpath(model_path))
 
@@ -229,63 +231,250 @@ def main():
                     continue
 
                 try:
-                    q_k, f_k = parse_structure_output(k_file)
-                    q_k1, f_k1 = parse_structure_output(k1_file)
-                    print(f"Parsed {rep_path} K={k}: Q={q_k.shape}, Freqs={len(f_k)}")
+                    parsed_k = load_structure_f(k_file)
+                    parsed_k1 = load_structure_f(k1_file)
+                    q_k, f_k = parsed_k['q'], parsed_k['freqs']
+                    print(f"Parsed {rep_path} K={k}: Q={q_k.shape}, Freqs={f_k.shape}")
                 except Exception as e:
                     print(f"Parsing error in {rep_path}: {e}")
                     continue
 
-                K_actual = q_k.shape[1]
-                loci_ids = sorted(set(k[1] for k in f_k.keys()))
-                if len(loci_ids) < loci_sample:
-                    print(f"Skipping {rep_path}: only {len(loci_ids)} usable loci (need {loci_sample})")
-                    continue
-
-                loci_sampled = loci_ids[:loci_sample]
-                I = q_k.shape[0]
-                f_arr_k = convert_freqs_to_array(f_k, loci_sampled, alleles, K_actual)
-
-                try:
-                    sim_prefix = os.path.join(output_dir, "bootstrap_sim")
-                    genos = simulate_genotypes(I, loci_sample, f_arr_k, q_k)
-                    write_ped_map(genos, loci_sampled, sim_prefix)
-                    ll_k = run_admixture(sim_prefix, k)
-                    ll_k1 = run_admixture(sim_prefix, k1)
-                    T_obs = -2 * (ll_k - ll_k1)
-                except Exception as e:
-                    print(f"ADMIXTURE failed on {model}/{replicate} K={k}: {e}")
+                n_loci = f_k.shape[1]
+                if n_loci < loci_sample:
+                    print(f"Skipping {rep_path}: only {n_loci} usable loci (need {loci_sample})")
                     continue
 
-                bootstrap_Ts = []
-                for b in range(bootstraps):
-                    try:
-                        g_b = simulate_genotypes(I, loci_sample, f_arr_k, q_k)
-                        prefix = os.path.join(output_dir, f"bootstrap_b{b}")
-                        write_ped_map(g_b, loci_sampled, prefix)
-                        llb_k = run_admixture(prefix, k)
-                        llb_k1 = run_admixture(prefix, k1)
-                        T_b = -2 * (llb_k - llb_k1)
-                        bootstrap_Ts.append(T_b)
-                    except Exception as e:
-                        print(f"Bootstrap {b} failed for {model}/{replicate}: {e}")
-                        continue
-
-                p_val = np.mean([t > T_obs for t in bootstrap_Ts])
-                print(f"[{model}/{replicate}] K={k} → K+1={k1}: T_obs={T_obs:.2f}, p={p_val:.3f}")
-
-                results.append({
+                # Biallelic frequencies ordered by allele code, as in the (K, L, 2) simulator input
+                transitions.append({
                     'model': model,
                     'replicate': replicate,
                     'K': k,
-                    'K+1': k1,
-                    'T_obs': T_obs,
-                    'p_value': p_val
+                    'q': q_k,
+                    'freqs': f_k[:, :loci_sample, :2],
+                    'q1': parsed_k1['q'],
+                    'freqs1': parsed_k1['freqs'][:, :loci_sample, :2],
+                    'loci': [f"L{l+1}" for l in range(loci_sample)],
                 })
+    return transitions
+
+def build_tasks(transitions, draws, seed, output_dir, threads, backend="admixture",
+                warm_start=True, fit_cache=None, fit_cache_bytes=None):
+    """
+    Yields (task_key, task) for the given draws of every transition
+    (b=0 is the observed draw, b=1..B the bootstrap draws).
+    fit_cache is the cache directory, or None to fit without caching.
+    """
+    for tr in transitions:
+        tr_seed = transition_seed(seed, tr['model'], tr['replicate'], tr['K'])
+        for b in draws:
+            key = task_key(tr['model'], tr['replicate'], tr['K'], b)
+            yield key, dict(tr, b=b, seed=tr_seed, output_dir=output_dir, threads=threads,
+                            backend=backend, warm_start=warm_start, fit_cache=fit_cache,
+                            fit_cache_bytes=fit_cache_bytes)
+
+def exceedances(done, tr, bootstraps, prefix=False):
+    """
+    Returns (T_obs, [T_b > T_obs for finished draws b=1..B in draw order]),
+    or (None, []) if the observed draw has not finished. With prefix=True the
+    flags stop at the first draw missing from the ledger (failed or not run yet),
+    so sequential stopping sees draws 1..n in order; otherwise missing draws are
+    skipped.
+    """
+    model, replicate, k = tr['model'], tr['replicate'], tr['K']
+    obs = done.get(task_key(model, replicate, k, 0))
+    if obs is None:
+        return None, []
+    T_obs = obs['T']
+    flags = []
+    for b in range(1, bootstraps + 1):
+        draw = done.get(task_key(model, replicate, k, b))
+        if draw is None:
+            if prefix:
+                break
+            continue
+        flags.append(draw['T'] > T_obs)
+    return T_obs, flags
+
+def run_sequential(transitions, make_tasks, ledger_path, workers, bootstraps, alpha, h, batch,
+                   config=None):
+    """
+    Runs bootstrap draws in rounds of `batch` per transition and stops submitting
+    draws for a transition once sequential_pvalue() has decided it. Each round also
+    resubmits the earlier draws of open transitions that failed (draws already in
+    the ledger are skipped), since the decision needs draws 1..n without gaps.
+    """
+    undecided = list(transitions)
+    done = {}
+    start = 0
+    while undecided and start <= bootstraps:
+        stop = min(start + batch, bootstraps + 1)
+        done = run_tasks(make_tasks(undecided, range(stop)), run_bootstrap_task,
+                         ledger_path, workers=workers, config=config)
+        still_open = []
+        for tr in undecided:
+            T_obs, flags = exceedances(done, tr, bootstraps, prefix=True)
+            if T_obs is not None and sequential_pvalue(flags, bootstraps, alpha, h)[0] is None:
+                still_open.append(tr)
+        print(f"Sequential round b={start}..{stop - 1}: "
+              f"{len(undecided) - len(still_open)} transitions decided, {len(still_open)} open")
+        undecided = still_open
+        start = stop
+    return done
+
+def run_calibrated(transitions, make_tasks, ledger_path, workers, bootstraps, pilot, method,
+                   min_ks_p, config=None):
+    """
+    Runs draws 0..pilot for every transition and fits the null distribution of T to
+    the pilot draws. Transitions with a poor fit get the remaining draws up to
+    bootstraps. Returns (done, {(model, replicate, K): (p_value or None, fit)}).
+    """
+    pilot = min(pilot, bootstraps)
+    done = run_tasks(make_tasks(transitions, range(pilot + 1)), run_bootstrap_task,
+                     ledger_path, workers=workers, config=config)
+    calibrations = {}
+    fallback = []
+    for tr in transitions:
+        key = (tr['model'], tr['replicate'], tr['K'])
+        T_obs = done.get(task_key(*key, 0), {}).get('T')
+        if T_obs is None:
+            continue
+        pilot_T = [done[task_key(*key, b)]['T'] for b in range(1, pilot + 1)
+                   if task_key(*key, b) in done]
+        p_val, fit = calibrate(pilot_T, T_obs, method=method, min_ks_p=min_ks_p)
+        calibrations[key] = (p_val, fit)
+        if p_val is None:
+            fallback.append(tr)
+    print(f"Calibrated {len(calibrations) - len(fallback)} transitions from {pilot} pilot draws, "
+          f"{len(fallback)} fall back to the full bootstrap")
+    if fallback:
+        done = run_tasks(make_tasks(fallback, range(bootstraps + 1)), run_bootstrap_task,
+                         ledger_path, workers=workers, config=config)
+    return done, calibrations
+
+# Main routine
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Parametric bootstrap LRT for STRUCTURE K vs K+1.")
+    parser.add_argument("--root", default="structure_outputs", help="STRUCTURE output root (model*/replicate*/)")
+    parser.add_argument("--output", default="bootstrap_lrt_results_all.csv")
+    parser.add_argument("--output_dir", default="bootstrap_temp", help="Scratch directory and ledger location")
+    parser.add_argument("--bootstraps", type=int, default=100)
+    parser.add_argument("--loci_sample", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=12345)
+    parser.add_argument("--workers", type=int, default=1, help="Parallel bootstrap tasks")
+    parser.add_argument("--threads", type=int, default=1, help="ADMIXTURE threads (-j) per task")
+    parser.add_argument("--backend", choices=["admixture", "numpy"], default="admixture",
+                        help="Fit with the admixture binary or the in-process NumPy EM")
+    parser.add_argument("--cold_start", action="store_true",
+                        help="NumPy backend: start fits at random values instead of the STRUCTURE estimates")
+    parser.add_argument("--sequential", action="store_true",
+                        help="Stop each transition once its p-value is decided relative to --alpha")
+    parser.add_argument("--alpha", type=float, default=0.05, help="Significance level for --sequential")
+    parser.add_argument("--bc_h", type=int, default=None,
+                        help="Besag-Clifford exceedance count (default floor(alpha*B)+1)")
+    parser.add_argument("--sequential_batch", type=int, default=10,
+                        help="Draws submitted per transition per round in --sequential mode")
+    parser.add_argument("--calibrated", action="store_true",
+                        help="P-values from a null distribution fitted to --pilot draws "
+                             "(full bootstrap where the fit is poor)")
+    parser.add_argument("--pilot", type=int, default=20, help="Pilot draws per transition for --calibrated")
+    parser.add_argument("--calibration", choices=CALIBRATION_METHODS, default="chi2",
+                        help="Scaled chi-square by moments or gamma by maximum likelihood")
+    parser.add_argument("--min_ks_p", type=float, default=0.1,
+                        help="Fall back to the full bootstrap below this KS p-value")
+    parser.add_argument("--fit_cache", default=None,
+                        help="Fit cache directory (default <output_dir>/fit_cache)")
+    parser.add_argument("--fit_cache_mb", type=float, default=1024,
+                        help="Size bound of the fit cache; least recently used fits are evicted")
+    parser.add_argument("--no_fit_cache", action="store_true", help="Always refit")
+    args = parser.parse_args()
+    if args.sequential and args.calibrated:
+        parser.error("--sequential and --calibrated are alternative modes")
+    return args
+
+def main():
+    """
+    Main entry point for running bootstrap LRT analysis
+    """
+    args = parse_args()
+    results = []
+
+    # Scratch directory for bootstrap simulations; the ledger makes reruns resume
+    output_dir = args.output_dir
+    os.makedirs(output_dir, exist_ok=True)
+    ledger_path = os.path.join(output_dir, "ledger.tsv")
+    fit_cache = None
+    if not args.no_fit_cache:
+        fit_cache = args.fit_cache or os.path.join(output_dir, "fit_cache")
+
+    print("Starting parametric bootstrap analysis...\n")
+
+    # Settings that change the draws or fits; a ledger written with others is refused
+    config = {"root": os.path.abspath(args.root), "seed": args.seed,
+              "loci_sample": args.loci_sample, "backend": args.backend,
+              "warm_start": not args.cold_start}
+    try:
+        load_ledger(ledger_path, config)
+    except ValueError as e:
+        sys.exit(str(e))
+
+    transitions = collect_transitions(args.root, args.loci_sample)
+
+    def make_tasks(trs, draws):
+        return build_tasks(trs, draws, args.seed, output_dir, args.threads,
+                           backend=args.backend, warm_start=not args.cold_start,
+                           fit_cache=fit_cache, fit_cache_bytes=int(args.fit_cache_mb * 2**20))
+
+    calibrations = {}
+    if args.sequential:
+        done = run_sequential(transitions, make_tasks, ledger_path, args.workers, args.bootstraps,
+                              args.alpha, args.bc_h, max(1, args.sequential_batch), config=config)
+    elif args.calibrated:
+        done, calibrations = run_calibrated(transitions, make_tasks, ledger_path, args.workers,
+                                            args.bootstraps, args.pilot, args.calibration,
+                                            args.min_ks_p, config=config)
+    else:
+        done = run_tasks(make_tasks(transitions, range(args.bootstraps + 1)), run_bootstrap_task,
+                         ledger_path, workers=args.workers, config=config)
+
+    for tr in transitions:
+        model, replicate, k = tr['model'], tr['replicate'], tr['K']
+        T_obs, flags = exceedances(done, tr, args.bootstraps, prefix=args.sequential)
+        if T_obs is None:
+            print(f"ADMIXTURE failed on {model}/{replicate} K={k}")
+            continue
+
+        decision = None
+        if args.sequential:
+            decision, n_used, p_val = sequential_pvalue(flags, args.bootstraps, args.alpha, args.bc_h)
+        p_cal, fit = calibrations.get((model, replicate, k), (None, None))
+        if p_cal is not None:
+            n_used, p_val = fit['n'], p_cal
+        elif decision is None:
+            n_used, p_val = len(flags), np.mean(flags)
+            if n_used < args.bootstraps:
+                print(f"[{model}/{replicate}] K={k}: {args.bootstraps - n_used} draws missing; "
+                      f"p uses {n_used} (rerun to retry the failed draws)")
+        print(f"[{model}/{replicate}] K={k} → K+1={k + 1}: T_obs={T_obs:.2f}, p={p_val:.3f} (B={n_used})")
+
+        row = {
+            'model': model,
+            'replicate': replicate,
+            'K': k,
+            'K+1': k + 1,
+            'T_obs': T_obs,
+            'p_value': p_val,
+            'B_used': n_used
+        }
+        if args.calibrated:
+            row['p_method'] = 'calibrated' if p_cal is not None else 'bootstrap'
+            row['calib_ks'] = fit['ks'] if fit else np.nan
+            row['calib_ks_p'] = fit['ks_p'] if fit else np.nan
+        results.append(row)
 
     df = pd.DataFrame(results)
-    df.to_csv("bootstrap_lrt_results_all.csv", index=False)
-    print("\nDone. Results written to 'bootstrap_lrt_results_all.csv'")
+    df.to_csv(args.output, index=False)
+    print(f"\nDone. Results written to '{args.output}'")
 
 # Entry
 
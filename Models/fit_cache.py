@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+
+"""
+fit_cache.py
+
+Content-addressed, size-bounded cache of ADMIXTURE-style fits.
+
+A fit is keyed by a hash of the genotype data together with K, the seed and the
+backend options that affect the result (thread counts do not). The value is the
+log-likelihood plus the P and Q matrices, stored as one compressed .npz per key in
+the cache directory. Reading an entry refreshes its modification time and writes
+evict the least recently used entries once the directory exceeds its byte budget,
+so the cache can be shared by concurrent workers and by both bootstrap drivers:
+
+- bootstrap_structure_lrt_all.py and admixture_bootstrap_grid.py both use FitCache;
+  export_fit writes a cached fit back out as ADMIXTURE .P/.Q/.log files.
+"""
+
+import hashlib
+import json
+import os
+
+import numpy as np
+
+DEFAULT_MAX_BYTES = 1024 * 1024 * 1024
+
+# Keys
+
+def hash_genotypes(genos):
+    """
+    Hashes a genotype array by its allele-1 dosages. Accepts (I, L) or (I, L, 2).
+    """
+    G = np.asarray(genos)
+    if G.ndim == 3:
+        G = G.sum(axis=2)
+    G = np.ascontiguousarray(G, dtype=np.int8)
+    h = hashlib.sha256()
+    h.update(repr(G.shape).encode())
+    h.update(G.tobytes())
+    return h.hexdigest()
+
+def hash_arrays(*arrays):
+    """
+    Hashes float arrays (e.g. warm-start values) for use as a key option.
+    """
+    h = hashlib.sha256()
+    for a in arrays:
+        a = np.ascontiguousarray(a, dtype=float)
+        h.update(repr(a.shape).encode())
+        h.update(a.tobytes())
+    return h.hexdigest()
+
+def hash_bed(prefix, block_size=1 << 20):
+    """
+    Hashes a PLINK fileset by the contents of its .bed, .bim and .fam files.
+    """
+    h = hashlib.sha256()
+    for ext in ("bed", "bim", "fam"):
+        with open(f"{prefix}.{ext}", "rb") as fh:
+            for block in iter(lambda: fh.read(block_size), b""):
+                h.update(block)
+    return h.hexdigest()
+
+def fit_key(data_hash, K, seed=None, backend="admixture", **options):
+    """
+    Cache key for fitting K clusters to a dataset with the given seed and options.
+    """
+    payload = json.dumps({"data": data_hash, "K": int(K), "seed": seed,
+                          "backend": backend, "options": options}, sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+# Cache
+
+class FitCache:
+    """
+    Directory of fit results with least-recently-used eviction by total size.
+    """
+
+    def __init__(self, cache_dir, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = int(max_bytes)
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.npz")
+
+    def get(self, key):
+        """
+        Returns {'loglik', 'P', 'Q'} for a cached fit, or None on a miss.
+        """
+        path = self._path(key)
+        try:
+            with np.load(path, allow_pickle=False) as z:
+                entry = {"loglik": float(z["loglik"]), "P": z["P"], "Q": z["Q"]}
+            os.utime(path)
+        except (OSError, KeyError, ValueError):
+            return None
+        return entry
+
+    def put(self, key, loglik, P=None, Q=None):
+        """
+        Stores a fit and evicts old entries if the cache is over budget.
+        """
+        path = self._path(key)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as fh:
+            np.savez_compressed(fh, loglik=float(loglik),
+                                P=np.zeros((0, 0)) if P is None else np.asarray(P, float),
+                                Q=np.zeros((0, 0)) if Q is None else np.asarray(Q, float))
+        os.replace(tmp, path)
+        self.evict()
+
+    def evict(self):
+        """
+        Deletes least recently used entries until the cache fits in max_bytes.
+        """
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(".npz"):
+                continue
+            try:
+                st = os.stat(os.path.join(self.cache_dir, name))
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime, st.st_size, name))
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.cache_dir, name))
+            except FileNotFoundError:
+                pass
+            total -= size
+
+# ADMIXTURE-style output files
+
+def export_fit(entry, out_prefix, key=""):
+    """
+    Writes a cached fit as out_prefix.P, out_prefix.Q and an out_prefix.log holding
+    the "Loglikelihood: ..." line ADMIXTURE logs, so log parsers work unchanged.
+    """
+    np.savetxt(f"{out_prefix}.P", entry["P"], fmt="%.6f")
+    np.savetxt(f"{out_prefix}.Q", entry["Q"], fmt="%.6f")
+    with open(f"{out_prefix}.log", "w") as log:
+        log.write(f"Loglikelihood: {entry['loglik']!r}\n(from fit cache {key})\n")
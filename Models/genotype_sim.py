@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+
+"""
+genotype_sim.py
+
+Vectorized parametric simulator for the STRUCTURE/ADMIXTURE bootstrap.
+
+Genotypes are drawn under the admixture model used by bootstrap_structure_lrt_all.py:
+each allele copy of individual i at locus l picks a source cluster k with probability
+q_matrix[i, k] and then carries allele 1 with probability allele_freqs[k, l, 1].
+Because the cluster draws are independent per copy, this is the same as drawing each
+copy from Bernoulli(sum_k q_ik * p_kl), which is what this module does in one array
+operation instead of two np.random.choice calls per allele.
+
+All replicates are drawn at once as an array of shape (B, I, L, 2). Each replicate has
+its own numpy.random.Generator spawned from a single SeedSequence, and loci are drawn
+in a fixed order, so a replicate's genotypes do not depend on B or on the chunk size.
+"""
+
+import numpy as np
+
+# Mixing probabilities
+
+def normalize_q(q_matrix):
+    """
+    Clips ancestry proportions to [0, 1] and renormalizes each row to sum to 1.
+    Raises ValueError for individuals whose proportions sum to zero.
+    """
+    q = np.clip(np.asarray(q_matrix, dtype=float), 0, 1)
+    sums = q.sum(axis=1)
+    bad = np.flatnonzero(sums == 0)
+    if bad.size:
+        raise ValueError(f"Invalid q_matrix for individual {bad[0]}: sum=0")
+    return q / sums[:, None]
+
+def admixed_allele_probs(q_matrix, allele_freqs):
+    """
+    Returns the (I, L) probability that an allele copy is allele 1, given:
+    - q_matrix: shape (I, K)
+    - allele_freqs: shape (K, L, 2); column 1 holds the allele-1 frequency
+    """
+    p1 = np.clip(np.asarray(allele_freqs, dtype=float)[:, :, 1], 0, 1)
+    return normalize_q(q_matrix) @ p1
+
+# Random streams
+
+def replicate_generators(n_replicates, seed=None, first_replicate=0):
+    """
+    Spawns one independent numpy.random.Generator per replicate from a single seed.
+
+    seed may be an int or a SeedSequence. Replicate r always gets spawn key r, so
+    first_replicate > 0 reproduces a slice of a larger batch on its own.
+    """
+    base = seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+    return [
+        np.random.default_rng(np.random.SeedSequence(
+            base.entropy, spawn_key=base.spawn_key + (first_replicate + r,)))
+        for r in range(n_replicates)
+    ]
+
+def loci_per_chunk(n_replicates, n_individuals, max_bytes):
+    """
+    Largest number of loci whose (B, I, chunk, 2) uint8 block fits in max_bytes.
+    """
+    per_locus = max(1, n_replicates * n_individuals * 2)
+    return max(1, int(max_bytes) // per_locus)
+
+# Simulation
+
+def iter_genotype_chunks(q_matrix, allele_freqs, n_replicates, seed=None,
+                         chunk_loci=None, max_bytes=None, first_replicate=0):
+    """
+    Simulates diploid genotypes for all replicates, one block of loci at a time.
+
+    Yields (start, stop, genos) where genos has shape (B, I, stop - start, 2) and
+    dtype uint8. Only one block is held in memory; its size is set by chunk_loci,
+    or derived from max_bytes, or covers every locus if neither is given.
+    """
+    probs = admixed_allele_probs(q_matrix, allele_freqs)
+    I, L = probs.shape
+    if chunk_loci is None:
+        chunk_loci = loci_per_chunk(n_replicates, I, max_bytes) if max_bytes else L
+    chunk_loci = max(1, int(chunk_loci))
+
+    rngs = replicate_generators(n_replicates, seed, first_replicate)
+    # Locus-major view so consecutive chunks consume each stream in the same order
+    probs_lt = np.ascontiguousarray(probs.T)[:, :, None]
+
+    for start in range(0, L, chunk_loci):
+        stop = min(start + chunk_loci, L)
+        block = np.empty((n_replicates, I, stop - start, 2), dtype=np.uint8)
+        p = probs_lt[start:stop]
+        for b, rng in enumerate(rngs):
+            draws = rng.random((stop - start, I, 2)) < p
+            block[b] = draws.transpose(1, 0, 2)
+        yield start, stop, block
+
+def simulate_genotypes_batch(q_matrix, allele_freqs, n_replicates, seed=None,
+                             chunk_loci=None, first_replicate=0):
+    """
+    Simulates n_replicates diploid genotype sets under the admixture model.
+
+    Returns: uint8 array of shape (B, I, L, 2)
+    """
+    I = np.shape(q_matrix)[0]
+    L = np.shape(allele_freqs)[1]
+    genos = np.empty((n_replicates, I, L, 2), dtype=np.uint8)
+    for start, stop, block in iter_genotype_chunks(q_matrix, allele_freqs, n_replicates,
+                                                   seed=seed, chunk_loci=chunk_loci,
+                                                   first_replicate=first_replicate):
+        genos[:, :, start:stop] = block
+    return genos
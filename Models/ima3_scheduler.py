@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+
+"""
+ima3_scheduler.py
+
+Packs many IMa3 runs onto one node within a core budget.
+
+Each .u file is one job: `<launcher> IMa3 -i FILE -o OUT ...`, with the launcher
+(default `mpirun -np {procs}`) starting --procs MPI processes. For the MCMC stage
+IMa3's -hn is the number of heated chains per MPI process, so a job runs
+procs * -hn chains in total; -hn is --chains, or ceil(--total_chains / --procs) when
+the total is fixed instead (the total is then rounded up to a multiple of --procs).
+--cores // --procs jobs run at once, largest input first, so a 20-core node can run
+e.g. five 4-process jobs instead of one 20-process job that scales poorly.
+
+Stages
+  mcmc  M-mode runs (run_IMa3_model1_*.sh, generate_ti_*.sh): heating options
+        -hn/-ha/-hb are added by the scheduler, everything after `--` is passed on.
+  lrt   L-mode nested-model tests (run_LRT_*.sh): adds -v TI (the --ti template) and
+        no heating; jobs whose .ti file is missing are skipped.
+
+Output names are templates over {name} (input basename without the final .u) and
+{base} (name up to its first dot), e.g.
+  --out '{name}_ghost.out'             model1_rep0.u -> model1_rep0_ghost.out
+  --out 'LRT_outfiles_2pop/{base}.2pop.LRT.out'
+
+Completion is tracked through the IMa3 output files and a tab-separated ledger
+(--ledger, default <out dir>/ima3_jobs.tsv), one row per finished job (chains is
+per process):
+  input output stage procs chains cores start wall_s rc out_size out_mtime_ns
+A "started" row (rc empty) is written when a job is launched and a full row when it
+ends. A job is done when its output file still has the size and mtime the ledger
+recorded for a run with exit status 0. An existing, non-empty output with no ledger
+row at all (a run finished before the ledger existed) also counts as done, unless
+--rerun is given; --done_pattern, if set, must then also match its text. Outputs
+whose last ledger row is a failed or unfinished run are rerun, so an interrupted
+queue resumes where it stopped without redoing earlier outputs. wall_s of every run, failed ones
+included, is kept for tuning the procs/chains split; `--report` summarizes it per
+split.
+
+IMa3 stdout/stderr go to <output>.log.
+"""
+
+import argparse
+import os
+import re
+import shlex
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+
+LEDGER_COLUMNS = ["input", "output", "stage", "procs", "chains", "cores", "start", "wall_s", "rc",
+                  "out_size", "out_mtime_ns"]
+
+# Jobs
+
+def job_names(path):
+    name = os.path.basename(path)
+    if name.endswith(".u"):
+        name = name[:-2]
+    return {"name": name, "base": name.split(".", 1)[0]}
+
+
+def build_command(cfg, ufile, out, ti=None):
+    launcher = shlex.split(cfg.launcher.format(procs=cfg.procs)) if cfg.launcher else []
+    cmd = launcher + [cfg.ima3, "-i", ufile, "-o", out]
+    if ti is not None:
+        cmd += ["-v", ti]
+    if cfg.stage == "mcmc":
+        cmd += ["-hn", str(cfg.chains), "-ha", str(cfg.ha), "-hb", str(cfg.hb)]
+    return cmd + cfg.ima3_args
+
+
+def make_jobs(cfg):
+    """[(input, output, command)] largest input first; skips LRT jobs without a .ti file."""
+    jobs = []
+    for ufile in cfg.inputs:
+        names = job_names(ufile)
+        out = cfg.out.format(**names)
+        ti = None
+        if cfg.stage == "lrt":
+            ti = cfg.ti.format(**names)
+            if not os.path.exists(ti):
+                print(f"[skip] {ufile}: missing genealogy file {ti}")
+                continue
+        jobs.append((ufile, out, build_command(cfg, ufile, out, ti)))
+    jobs.sort(key=lambda job: os.path.getsize(job[0]), reverse=True)
+    return jobs
+
+# Ledger
+
+def load_ledger(path):
+    """{output: last ledger row} (dict of column -> str); truncated lines are ignored."""
+    rows = {}
+    if not os.path.exists(path):
+        return rows
+    with open(path) as fh:
+        header = fh.readline().rstrip("\n").split("\t")
+        for line in fh:
+            parts = line.rstrip("\n").split("\t")
+            if len(parts) == len(header):
+                row = dict(zip(header, parts))
+                rows[row["output"]] = row
+    return rows
+
+
+def open_ledger(path):
+    is_new = not os.path.exists(path) or os.path.getsize(path) == 0
+    fh = open(path, "a")
+    if is_new:
+        fh.write("\t".join(LEDGER_COLUMNS) + "\n")
+        fh.flush()
+    return fh
+
+
+_LEDGER_LOCK = threading.Lock()
+
+
+def append_ledger(fh, row):
+    with _LEDGER_LOCK:
+        _write_row(fh, row)
+
+
+def _write_row(fh, row):
+    fh.write("\t".join(str(row[c]) for c in LEDGER_COLUMNS) + "\n")
+    fh.flush()
+    os.fsync(fh.fileno())
+
+
+def is_done(out, row, done_pattern=None, rerun=False):
+    """True if out is a finished IMa3 output (see module docstring)."""
+    if not os.path.exists(out):
+        return False
+    st = os.stat(out)
+    if row is not None:
+        return row["rc"] == "0" and row["out_size"] == str(st.st_size) \
+            and row["out_mtime_ns"] == str(st.st_mtime_ns)
+    if rerun or st.st_size == 0:
+        return False
+    if done_pattern:
+        with open(out, errors="replace") as fh:
+            return re.search(done_pattern, fh.read()) is not None
+    return True
+
+# Execution
+
+def run_job(cfg, ufile, out, cmd, ledger_fh=None):
+    """Runs one IMa3 job, marking it started in the ledger. Returns its final ledger row."""
+    if os.path.dirname(out):
+        os.makedirs(os.path.dirname(out), exist_ok=True)
+    start = time.time()
+    if ledger_fh is not None:
+        append_ledger(ledger_fh, {**job_row(cfg, ufile, out, start), "wall_s": "", "rc": "",
+                                  "out_size": -1, "out_mtime_ns": -1})
+    with open(f"{out}.log", "w") as log:
+        log.write(" ".join(shlex.quote(c) for c in cmd) + "\n")
+        log.flush()
+        rc = subprocess.run(cmd, stdout=log, stderr=subprocess.STDOUT).returncode
+    wall = time.time() - start
+    st = os.stat(out) if os.path.exists(out) else None
+    return {**job_row(cfg, ufile, out, start), "wall_s": f"{wall:.1f}", "rc": rc,
+            "out_size": st.st_size if st else -1, "out_mtime_ns": st.st_mtime_ns if st else -1}
+
+
+def job_row(cfg, ufile, out, start):
+    return {"input": ufile, "output": out, "stage": cfg.stage, "procs": cfg.procs, "chains": cfg.chains,
+            "cores": cfg.cores, "start": datetime.fromtimestamp(start).isoformat(timespec="seconds")}
+
+
+def run_queue(cfg):
+    """Runs every job not yet done, cfg.cores // cfg.procs at a time. Returns the number of failures."""
+    ledger = load_ledger(cfg.ledger)
+    jobs = make_jobs(cfg)
+    pending = [job for job in jobs if not is_done(job[1], ledger.get(job[1]), cfg.done_pattern, cfg.rerun)]
+    slots = max(1, cfg.cores // cfg.procs)
+    print(f"[ima3] {len(jobs) - len(pending)} of {len(jobs)} jobs done; running {len(pending)} as "
+          f"{slots} x {cfg.procs} processes" + (f" x {cfg.chains} chains" if cfg.stage == "mcmc" else ""))
+    if cfg.dry_run:
+        for _, _, cmd in pending:
+            print(" ".join(shlex.quote(c) for c in cmd))
+        return 0
+
+    failed = 0
+    start = time.time()
+    with open_ledger(cfg.ledger) as fh, ThreadPoolExecutor(max_workers=slots) as pool:
+        futures = {pool.submit(run_job, cfg, *job, fh): job for job in pending}
+        for n, fut in enumerate(as_completed(futures), 1):
+            row = fut.result()
+            append_ledger(fh, row)
+            ok = row["rc"] == 0 and row["out_size"] != -1
+            failed += not ok
+            elapsed = time.time() - start
+            print(f"[ima3] {'done' if ok else 'FAILED (rc ' + str(row['rc']) + ')'} {row['input']} "
+                  f"in {float(row['wall_s']) / 3600:.2f} h ({n}/{len(pending)}, "
+                  f"{n / elapsed * 3600:.2f} jobs/h)")
+    return failed
+
+
+def report(ledger_path):
+    """Mean wall time and node throughput per (stage, procs, chains, cores) split."""
+    groups = {}
+    with open(ledger_path) as fh:
+        header = fh.readline().rstrip("\n").split("\t")
+        for line in fh:
+            parts = line.rstrip("\n").split("\t")
+            if len(parts) != len(header):
+                continue
+            row = dict(zip(header, parts))
+            if row["rc"] != "0":
+                continue
+            key = (row["stage"], int(row["procs"]), int(row["chains"]), int(row["cores"]))
+            groups.setdefault(key, []).append(float(row["wall_s"]))
+    print("stage\tprocs\tchains\tcores\tjobs\tmean_wall_h\tjobs_per_node_hour")
+    for (stage, procs, chains, cores), walls in sorted(groups.items()):
+        mean = sum(walls) / len(walls)
+        per_hour = (cores // procs) * 3600 / mean if mean > 0 else float("inf")
+        print(f"{stage}\t{procs}\t{chains}\t{cores}\t{len(walls)}\t{mean / 3600:.3f}\t{per_hour:.3f}")
+
+
+def parse_args(argv=None):
+    env = os.environ.get
+    p = argparse.ArgumentParser(description="Run many IMa3 jobs at once within a core budget",
+                                epilog="Arguments after -- are passed to IMa3 unchanged.")
+    p.add_argument("inputs", nargs="*", help=".u input files")
+    p.add_argument("--stage", choices=("mcmc", "lrt"), default="mcmc")
+    p.add_argument("--ima3", default=env("IMA3", "IMa3"), help="IMa3 executable")
+    p.add_argument("--cores", type=int, default=int(env("NCORES", os.cpu_count() or 1)), help="Core budget")
+    p.add_argument("--procs", type=int, default=int(env("PROCS", 1)), help="MPI processes per job")
+    p.add_argument("--chains", type=int, default=int(env("CHAINS", 20)),
+                   help="Heated chains per MPI process (-hn)")
+    p.add_argument("--total_chains", type=int, default=int(env("TOTAL_CHAINS")) if env("TOTAL_CHAINS") else None,
+                   help="Chains per job over all processes; sets --chains to ceil(total / procs)")
+    p.add_argument("--ha", type=float, default=float(env("HA", 0.99)))
+    p.add_argument("--hb", type=float, default=float(env("HB", 0.9)))
+    p.add_argument("--launcher", default=env("LAUNCHER", "mpirun -np {procs}"),
+                   help="Command prefix ({procs} is substituted); empty runs IMa3 directly")
+    p.add_argument("--out", default="{name}.out", help="Output file template ({name}, {base})")
+    p.add_argument("--ti", default="{name}.u.out.ti", help="lrt: genealogy (.ti) file template")
+    p.add_argument("--ledger", default=None, help="Default: ima3_jobs.tsv next to the outputs")
+    p.add_argument("--done_pattern", default=None,
+                   help="Regex an output without a ledger entry must match to count as done")
+    p.add_argument("--rerun", action="store_true",
+                   help="Rerun outputs that have no ledger entry instead of treating them as done")
+    p.add_argument("--dry_run", action="store_true", help="Print the commands that would run")
+    p.add_argument("--report", action="store_true", help="Summarize ledger wall times per split and exit")
+    argv = sys.argv[1:] if argv is None else argv
+    extra = []
+    if "--" in argv:
+        i = argv.index("--")
+        argv, extra = argv[:i], argv[i + 1:]
+    cfg = p.parse_args(argv)
+    cfg.ima3_args = extra
+    cfg.procs = max(1, min(cfg.procs, cfg.cores))
+    if cfg.total_chains:
+        cfg.chains = -(-cfg.total_chains // cfg.procs)
+    if cfg.stage == "lrt":
+        cfg.chains = 0
+    if cfg.ledger is None:
+        out_dir = os.path.dirname(cfg.out.format(name="x", base="x")) or "."
+        cfg.ledger = os.path.join(out_dir, "ima3_jobs.tsv")
+    return cfg
+
+
+def main():
+    cfg = parse_args()
+    if cfg.report:
+        report(cfg.ledger)
+        return
+    if not cfg.inputs:
+        sys.exit("No .u input files")
+    if os.path.dirname(cfg.ledger):
+        os.makedirs(os.path.dirname(cfg.ledger), exist_ok=True)
+    failed = run_queue(cfg)
+    if failed:
+        sys.exit(f"{failed} IMa3 job(s) failed; rerun to retry them")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+
+"""
+sequential_pvalue.py
+
+Sequential Monte Carlo stopping for bootstrap LRT p-values.
+
+Bootstrap draws are examined in order, and sampling for a K -> K+1 transition stops
+as soon as its p-value is decided relative to alpha:
+
+- Besag & Clifford (1991): stop at the h-th exceedance (T_b > T_obs) and report
+  p = h / n, where n is the number of draws used. With h = floor(alpha * B) + 1
+  this p-value is always above alpha, so the transition is decided non-significant.
+- Curtailment: stop once even an exceedance on every remaining draw could not push
+  the full-run p-value above alpha. The reported p is that upper bound.
+
+Otherwise all B draws are used and p is the usual exceedance fraction. Because the
+rule only looks at the prefix of draws 1..n, the result does not depend on how
+many draws were evaluated past the stopping point.
+"""
+
+import math
+
+import numpy as np
+
+def besag_clifford_h(alpha, B):
+    """
+    Smallest exceedance count whose Besag-Clifford p-value h/n can never be <= alpha.
+    """
+    return int(math.floor(alpha * B)) + 1
+
+def sequential_pvalue(exceed, B, alpha, h=None):
+    """
+    Applies the stopping rule to exceedance flags for draws 1..n (in draw order).
+
+    Returns (decision, n_used, p_value). decision is "nonsignificant" or
+    "significant" once decided, or None if more draws are needed. n_used and
+    p_value are None while undecided.
+    """
+    if h is None:
+        h = besag_clifford_h(alpha, B)
+    exceed = np.asarray(exceed, dtype=bool)[:B]
+    n = np.arange(1, exceed.size + 1)
+    hits = np.cumsum(exceed)
+
+    # Besag-Clifford: first draw at which the h-th exceedance is reached
+    bc = np.flatnonzero(hits >= h)
+    # Curtailment: even B - n further exceedances keep p <= alpha
+    curtail = np.flatnonzero(hits + (B - n) <= alpha * B)
+
+    stop_bc = bc[0] if bc.size else None
+    stop_cu = curtail[0] if curtail.size else None
+    if stop_bc is not None and (stop_cu is None or stop_bc <= stop_cu):
+        return "nonsignificant", int(n[stop_bc]), float(h / n[stop_bc])
+    if stop_cu is not None:
+        return "significant", int(n[stop_cu]), float((hits[stop_cu] + B - n[stop_cu]) / B)
+    if exceed.size >= B:
+        p = float(hits[-1] / B) if B else float("nan")
+        return ("significant" if p <= alpha else "nonsignificant"), B, p
+    return None, None, None
@@ -0,0 +1,323 @@
+#!/usr/bin/env python3
+"""
+Single-pass parser of IMa3 M-mode output (.out) files.
+
+Each file is read line by line, once, and only the tables of the recognized
+sections are kept, so memory is bounded by the largest table rather than by the
+file (gzipped outputs are read directly). A section starts at an upper-case header
+line and is classified by keywords:
+
+  estimates  MARGINAL ... SUMMAR / PEAK   one column per parameter, one row per
+                                           statistic (Minbin, HiPt, Mean, 95%Lo,
+                                           HPD95Hi, ...)
+  densities  MARGINAL / HISTOGRAM (other)  columns "x P(x)" per parameter (or one
+                                           value column shared by several P(..)
+                                           columns), one row per bin
+  swaps      ... SWAP ...                   one row per adjacent chain pair; the
+                                           last value in [0, 1] is the swap rate
+
+A table ends at the first blank or non-numeric line after its first data row
+(SumP rows and the like). Sections not recognized are skipped.
+
+Outputs
+  --out FILE        ima3_summary.txt of a single --input: point estimates
+                    (parameter x statistic), per-parameter density summaries
+                    (bins, range, mode, mean, sum of P) and swap rates
+  --table FILE      tidy TSV over all inputs:
+                    set model replicate file param stat value
+                    (set is 2pop/3pop when the path names one; density modes and
+                    means are added as stats "dens_mode" / "dens_mean")
+  <input>.npz       binary cache per input (or under --cache_dir): estimates,
+                    density arrays padded with NaN (dens_x, dens_p; one row per
+                    parameter) and swap rates. It is reused while the source
+                    file keeps the size and mtime recorded in it.
+
+Usage:
+    python scripts/parse_ima3.py --input results/ima3/S/ima3.out --out results/ima3/S/ima3_summary.txt
+    python scripts/parse_ima3.py --input results/ima3/*/ima3.out --table results/ima3/ima3_estimates.tsv --jobs 16
+"""
+import argparse
+import gzip
+import os
+import re
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+WORD = re.compile(r"[A-Z]{3,}")
+
+
+def is_header(line):
+    """Upper-case line with at least two words: a section header."""
+    return line.isupper() and len(WORD.findall(line)) >= 2
+
+
+def section_kind(line):
+    """Kind of the section an upper-case header line opens (None if not kept)."""
+    if "SWAP" in line:
+        return "swaps"
+    if "MARGINAL" in line or "HISTOGRAM" in line:
+        return "estimates" if "SUMMAR" in line or "PEAK" in line else "densities"
+    return None
+
+
+def _floats(tokens):
+    try:
+        return [float(t) for t in tokens]
+    except ValueError:
+        return None
+
+
+def open_text(path):
+    return gzip.open(path, "rt", errors="replace") if path.endswith(".gz") else open(path, errors="replace")
+
+
+class Table:
+    """Rows of one section, collected until the table ends."""
+
+    def __init__(self, kind):
+        self.kind = kind
+        self.columns = None
+        self.rows = []
+        self.done = False
+
+    def feed(self, line):
+        tokens = line.split()
+        if not tokens or set(line.strip()) <= set("=-_*"):
+            self.done = bool(self.rows)
+            return
+        if self.kind == "estimates":
+            if self.columns is None:
+                self.columns = tokens[1:]
+                return
+            values = _floats(tokens[1:])
+            if values is None or _floats(tokens[:1]) is not None:
+                self.done = bool(self.rows)
+                return
+            self.rows.append((tokens[0], values))
+            return
+        values = _floats(tokens)
+        if values is None:
+            if self.rows:
+                self.done = True
+            elif self.kind == "densities":
+                self.columns = tokens
+            return
+        self.rows.append(values)
+
+
+def _densities(table):
+    """[(param, x, p)] of a density table (see module docstring for the layouts)."""
+    if not table.rows or not table.columns:
+        return []
+    width = max(len(r) for r in table.rows)
+    grid = np.full((len(table.rows), width), np.nan)
+    for i, r in enumerate(table.rows):
+        grid[i, :len(r)] = r
+    out = []
+    x_col = None
+    for j, name in enumerate(table.columns[:width]):
+        if name.startswith("P(") and name.endswith(")"):
+            if x_col is not None:
+                keep = np.isfinite(grid[:, x_col]) & np.isfinite(grid[:, j])
+                out.append((name[2:-1], grid[keep, x_col], grid[keep, j]))
+        else:
+            x_col = j
+    return out
+
+
+def parse_file(path):
+    """
+    Parses one IMa3 output in a single pass. Returns a dict of
+    est_params, est_stats, est_values (stats x params), densities [(param, x, p)],
+    swap_rates.
+    """
+    estimates = {}
+    stats_order, params_order = [], []
+    densities = {}
+    swap_rates = []
+    table = None
+    with open_text(path) as fh:
+        for line in fh:
+            if is_header(line):
+                if table is not None:
+                    _collect(table, estimates, stats_order, params_order, densities, swap_rates)
+                kind = section_kind(line)
+                table = Table(kind) if kind else None
+            elif table is not None:
+                table.feed(line)
+                if table.done:
+                    _collect(table, estimates, stats_order, params_order, densities, swap_rates)
+                    table = None
+        if table is not None:
+            _collect(table, estimates, stats_order, params_order, densities, swap_rates)
+
+    values = np.full((len(stats_order), len(params_order)), np.nan)
+    for (stat, param), v in estimates.items():
+        values[stats_order.index(stat), params_order.index(param)] = v
+    return {"est_params": params_order, "est_stats": stats_order, "est_values": values,
+            "densities": list(densities.values()), "swap_rates": np.array(swap_rates)}
+
+
+def _collect(table, estimates, stats_order, params_order, densities, swap_rates):
+    if table.kind == "estimates" and table.columns:
+        for stat, values in table.rows:
+            if stat not in stats_order:
+                stats_order.append(stat)
+            for param, v in zip(table.columns, values):
+                if param not in params_order:
+                    params_order.append(param)
+                estimates[(stat, param)] = v
+    elif table.kind == "densities":
+        for param, x, p in _densities(table):
+            key = param
+            while key in densities:
+                key += "'"
+            densities[key] = (key, x, p)
+    elif table.kind == "swaps" and not swap_rates:
+        for row in table.rows:
+            if len(row) >= 3 and row[0] == int(row[0]):
+                rate = next((v for v in reversed(row[1:]) if 0 <= v <= 1), None)
+                if rate is not None:
+                    swap_rates.append(rate)
+
+
+# Cache
+
+def cache_path(path, cache_dir=None):
+    if cache_dir is None:
+        return f"{path}.npz"
+    return os.path.join(cache_dir, re.sub(r"[/\\]", "__", os.path.normpath(path).lstrip("./")) + ".npz")
+
+
+def save_cache(path, parsed, src):
+    st = os.stat(src)
+    dens = parsed["densities"]
+    width = max((len(x) for _, x, _ in dens), default=0)
+    dens_x = np.full((len(dens), width), np.nan, dtype=np.float32)
+    dens_p = np.full((len(dens), width), np.nan, dtype=np.float32)
+    for i, (_, x, p) in enumerate(dens):
+        dens_x[i, :len(x)] = x
+        dens_p[i, :len(p)] = p
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.tmp.npz"
+    np.savez(tmp, est_params=np.array(parsed["est_params"], dtype=str),
+             est_stats=np.array(parsed["est_stats"], dtype=str), est_values=parsed["est_values"],
+             dens_params=np.array([d[0] for d in dens], dtype=str), dens_x=dens_x, dens_p=dens_p,
+             swap_rates=parsed["swap_rates"], src_size=st.st_size, src_mtime_ns=st.st_mtime_ns)
+    os.replace(tmp, path)
+
+
+def load_cache(path, src):
+    """Parsed dict from the cache if it matches src's size and mtime, else None."""
+    if not os.path.exists(path):
+        return None
+    st = os.stat(src)
+    with np.load(path) as z:
+        if int(z["src_size"]) != st.st_size or int(z["src_mtime_ns"]) != st.st_mtime_ns:
+            return None
+        dens = []
+        for name, x, p in zip(z["dens_params"], z["dens_x"], z["dens_p"]):
+            keep = np.isfinite(x)
+            dens.append((str(name), x[keep].astype(float), p[keep].astype(float)))
+        return {"est_params": [str(s) for s in z["est_params"]], "est_stats": [str(s) for s in z["est_stats"]],
+                "est_values": z["est_values"], "densities": dens, "swap_rates": z["swap_rates"]}
+
+
+def load(path, cache_dir=None, refresh=False):
+    """Worker: parsed dict of one output, through its cache."""
+    cache = cache_path(path, cache_dir)
+    parsed = None if refresh else load_cache(cache, path)
+    if parsed is None:
+        parsed = parse_file(path)
+        save_cache(cache, parsed, path)
+    return parsed
+
+# Summaries
+
+def density_summary(x, p):
+    """(bins, x_min, x_max, mode, mean, sum of p) of one marginal density."""
+    if not len(x):
+        return 0, np.nan, np.nan, np.nan, np.nan, np.nan
+    total = p.sum()
+    mean = float((x * p).sum() / total) if total > 0 else np.nan
+    return len(x), float(x.min()), float(x.max()), float(x[np.argmax(p)]), mean, float(total)
+
+
+def write_summary(path, src, parsed):
+    with open(path, "w") as fh:
+        fh.write(f"# IMa3 summary of {src}\n\n")
+        fh.write("[estimates]\n")
+        fh.write("\t".join(["param"] + parsed["est_stats"]) + "\n")
+        for j, param in enumerate(parsed["est_params"]):
+            fh.write("\t".join([param] + [f"{v:.6g}" for v in parsed["est_values"][:, j]]) + "\n")
+        fh.write("\n[marginal_densities]\n")
+        fh.write("param\tbins\tx_min\tx_max\tmode\tmean\tsum_p\n")
+        for param, x, p in parsed["densities"]:
+            n, lo, hi, mode, mean, total = density_summary(x, p)
+            fh.write(f"{param}\t{n}\t{lo:.6g}\t{hi:.6g}\t{mode:.6g}\t{mean:.6g}\t{total:.6g}\n")
+        rates = parsed["swap_rates"]
+        fh.write("\n[chain_swapping]\n")
+        if len(rates):
+            fh.write(f"pairs\t{len(rates)}\nmin_rate\t{rates.min():.4g}\nmean_rate\t{rates.mean():.4g}\n")
+        else:
+            fh.write("pairs\t0\n")
+
+
+def tag(path, pattern):
+    m = re.search(pattern, path)
+    return m.group() if m else "NA"
+
+
+def table_rows(src, parsed):
+    keys = (tag(src, r"[23]pop"), tag(src, r"model\d+"), tag(src, r"replicate\d+"), src)
+    for i, stat in enumerate(parsed["est_stats"]):
+        for j, param in enumerate(parsed["est_params"]):
+            yield keys + (param, stat, parsed["est_values"][i, j])
+    for param, x, p in parsed["densities"]:
+        _, _, _, mode, mean, _ = density_summary(x, p)
+        yield keys + (param, "dens_mode", mode)
+        yield keys + (param, "dens_mean", mean)
+
+
+def main():
+    p = argparse.ArgumentParser(description="Parse IMa3 .out files into summaries, tidy tables and array caches")
+    p.add_argument("--input", nargs="+", required=True, help="IMa3 output file(s), optionally gzipped")
+    p.add_argument("--out", default=None, help="ima3_summary.txt (single --input only)")
+    p.add_argument("--table", default=None, help="Tidy TSV of estimates over all inputs")
+    p.add_argument("--cache_dir", default=None, help="Cache directory (default: <input>.npz)")
+    p.add_argument("--refresh", action="store_true", help="Ignore existing caches")
+    p.add_argument("--jobs", type=int, default=None, help="Parsing processes (default: all cores)")
+    args = p.parse_args()
+    if args.out and len(args.input) > 1:
+        sys.exit("--out takes a single --input; use --table for several")
+
+    if args.jobs == 1 or len(args.input) < 2:
+        parsed = [load(f, args.cache_dir, args.refresh) for f in args.input]
+    else:
+        with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+            parsed = list(pool.map(load, args.input, [args.cache_dir] * len(args.input),
+                                   [args.refresh] * len(args.input), chunksize=4))
+
+    for src, res in zip(args.input, parsed):
+        if not res["est_params"] and not res["densities"]:
+            print(f"⚠ No marginal distribution tables found in {src}")
+
+    if args.out:
+        write_summary(args.out, args.input[0], parsed[0])
+        print(f"✔ IMa3 summary saved to {args.out}")
+    if args.table:
+        with open(args.table, "w") as fh:
+            fh.write("set\tmodel\treplicate\tfile\tparam\tstat\tvalue\n")
+            n = 0
+            for src, res in zip(args.input, parsed):
+                for row in table_rows(src, res):
+                    fh.write("\t".join(map(str, row[:-1])) + f"\t{row[-1]:.6g}\n")
+                    n += 1
+        print(f"✔ {n} estimates from {len(args.input)} files saved to {args.table}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+"""
+Per-region TMRCA of ARGweaver MCMC samples (.smc.gz), without the Python 2 tools.
+
+Each SMC file is stream-decompressed and its records parsed in one pass:
+    NAMES   n0 n1 ...
+    REGION  chrom start end
+    TREE    start end newick        (1-based, inclusive; nodes carry [&&NHX:age=...])
+    SPR     pos recomb_node recomb_time coal_node coal_time
+The TMRCA of a block is the age of its local tree's root. For a TREE record that
+is read straight from the root's age annotation (the tree is only parsed when the
+annotation is missing, then ages come from branch lengths). Blocks given only by
+an SPR are handled incrementally: the last full tree is parsed once and every
+SPR is applied to it (the broken node is reused as the new coalescence node, as
+ARGweaver does), so the root age is kept current without text round trips.
+
+All MCMC samples of a run are read in parallel (--jobs processes). Outputs:
+  --npz FILE   compact arrays over all samples, one entry per block:
+               sample (int32, MCMC iteration from the file name), start (int64,
+               0-based), end (int64), tmrca (float32); plus chrom and names
+  --out FILE   per-region table over the union of all samples' breakpoints,
+               replacing arg-extract-tmrca's output (BED coordinates):
+                   chrom start end mean median lower upper
+               (column 5 is the median read by extract_median_tmrca.sh and
+               concat_tmrca_medians.sh; lower/upper are the --interval quantiles)
+
+Inputs may be files or arg-extract-tmrca style patterns (run.arg.%d.smc.gz).
+
+Usage:
+    python scripts/smc_tmrca.py results/argweaver/S/S.arg.*.smc.gz \\
+        --out results/argweaver/S/S.tmrca.tsv --npz results/argweaver/S/S.tmrca.npz
+"""
+import argparse
+import glob
+import gzip
+import re
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+AGE = re.compile(r"\[&&NHX:age=([-+\d.eE]+)\]")
+SAMPLE = re.compile(r"\.(\d+)\.smc(?:\.gz)?$")
+
+
+def root_age(newick):
+    """Age of the root of an ARGweaver newick tree (its last age annotation)."""
+    i = newick.rfind("[&&NHX:age=")
+    if i >= 0 and newick.find("[", i + 1) < 0:
+        return float(newick[i + 11:newick.index("]", i)])
+    return LocalTree.parse(newick).root_age()
+
+
+class LocalTree:
+    """Local tree as parent/children/age maps keyed by node name."""
+
+    def __init__(self):
+        self.parent = {}
+        self.children = {}
+        self.age = {}
+        self.root = None
+
+    @classmethod
+    def parse(cls, newick):
+        tree = cls()
+        stack = [[]]
+        lengths = {}
+        closed = None            # children of the clade just closed by ")", awaiting its label
+        auto = -1
+
+        def add(tok, kids):
+            nonlocal auto
+            name, length, age = _label(tok)
+            if name is None:
+                name, auto = auto, auto - 1
+            tree.children[name] = kids
+            for k in kids:
+                tree.parent[k] = name
+            if age is not None:
+                tree.age[name] = age
+            lengths[name] = length
+            stack[-1].append(name)
+
+        for tok in re.split(r"([(),;])", newick.strip()):
+            if tok in ("(", ")", ",", ";") and closed is not None:
+                add("", closed)
+                closed = None
+            if tok == "(":
+                stack.append([])
+            elif tok == ")":
+                closed = stack.pop()
+            elif tok.strip() and tok not in (",", ";"):
+                add(tok, closed if closed is not None else [])
+                closed = None
+        if closed is not None:
+            add("", closed)
+        tree.root = stack[0][-1]
+        tree.parent[tree.root] = None
+        if len(tree.age) < len(tree.children):
+            tree._ages_from_lengths(lengths)
+        return tree
+
+    def _ages_from_lengths(self, lengths):
+        def height(node):
+            if node not in self.age:
+                kids = self.children[node]
+                self.age[node] = max((height(k) + (lengths[k] or 0.0) for k in kids), default=0.0)
+            return self.age[node]
+        sys.setrecursionlimit(max(sys.getrecursionlimit(), 4 * len(self.children) + 100))
+        height(self.root)
+
+    def root_age(self):
+        return self.age[self.root]
+
+    def _replace_child(self, node, old, new):
+        kids = self.children[node]
+        kids[kids.index(old)] = new
+
+    def apply_spr(self, recomb_node, coal_node, coal_time):
+        """Prunes the branch above recomb_node and regrafts it onto coal_node's branch at coal_time."""
+        if recomb_node == coal_node:
+            return
+        broken = self.parent[recomb_node]
+        sibling = next(k for k in self.children[broken] if k != recomb_node)
+        above = self.parent[broken]
+        if above is None:
+            self.parent[sibling] = None
+            self.root = sibling
+        else:
+            self._replace_child(above, broken, sibling)
+            self.parent[sibling] = above
+        if coal_node == broken:
+            coal_node = sibling
+        target = self.parent[coal_node]
+        self.children[broken] = [coal_node, recomb_node]
+        self.parent[coal_node] = broken
+        self.parent[recomb_node] = broken
+        self.age[broken] = coal_time
+        self.parent[broken] = target
+        if target is None:
+            self.root = broken
+        else:
+            self._replace_child(target, coal_node, broken)
+
+
+def _label(tok):
+    """(name, branch length, age) of a newick node label such as 4:102.5[&&NHX:age=586.7]."""
+    m = AGE.search(tok)
+    age = float(m.group(1)) if m else None
+    tok = tok[:m.start()] if m else tok
+    name, _, length = tok.strip().partition(":")
+    name = int(name) if name.lstrip("-").isdigit() else (name or None)
+    return name, float(length) if length else None, age
+
+
+def read_smc(path):
+    """
+    One pass over an SMC file. Returns (chrom, names, starts, ends, tmrcas) with
+    0-based starts and inclusive 1-based ends, one entry per block.
+    """
+    chrom, names = None, []
+    region_end = None
+    starts, ends, tmrcas = [], [], []
+    tree, tree_text = None, None
+    pending = None           # (pos, recomb_node, coal_node, coal_time) of an SPR without a TREE yet
+
+    def flush(end):
+        nonlocal tree, pending
+        if tree is None:
+            tree = LocalTree.parse(tree_text)
+        pos, recomb_node, coal_node, coal_time = pending
+        tree.apply_spr(recomb_node, coal_node, coal_time)
+        starts.append(pos)
+        ends.append(end)
+        tmrcas.append(tree.root_age())
+        pending = None
+
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt") as fh:
+        for line in fh:
+            kind, _, rest = line.rstrip("\n").partition("\t")
+            if kind == "TREE":
+                start, end, newick = rest.split("\t", 2)
+                pending = None
+                tree, tree_text = None, newick
+                starts.append(int(start) - 1)
+                ends.append(int(end))
+                tmrcas.append(root_age(newick))
+            elif kind == "SPR":
+                pos, recomb_node, _, coal_node, coal_time = rest.split("\t")[:5]
+                if pending is not None:
+                    flush(int(pos))
+                pending = (int(pos), _node(recomb_node), _node(coal_node), float(coal_time))
+            elif kind == "NAMES":
+                names = rest.split("\t")
+            elif kind == "REGION":
+                chrom, _, region_end = rest.split("\t")[:3]
+                region_end = int(region_end)
+    if pending is not None and tree_text is not None:
+        flush(region_end)
+    return (chrom, names, np.array(starts, dtype=np.int64), np.array(ends, dtype=np.int64),
+            np.array(tmrcas, dtype=np.float64))
+
+
+def _node(text):
+    return int(text) if text.lstrip("-").isdigit() else text
+
+
+def expand_inputs(inputs):
+    """Files of inputs; %d patterns are expanded like arg-extract-tmrca. Sorted by sample."""
+    paths = []
+    for item in inputs:
+        paths += sorted(glob.glob(item.replace("%d", "*"))) if "%d" in item else [item]
+    return sorted(set(paths), key=lambda p: (sample_number(p), p))
+
+
+def sample_number(path):
+    m = SAMPLE.search(path)
+    return int(m.group(1)) if m else -1
+
+
+def region_table(starts, ends, tmrcas, samples, quantiles, chunk=100000):
+    """
+    Union of all breakpoints and, per segment, mean and quantiles of the TMRCA over
+    samples, computed chunk segments at a time. Yields (seg_start, seg_end, mean, q[0], q[1], ...).
+    """
+    order = np.unique(samples)
+    per_sample = [(starts[samples == s], ends[samples == s], tmrcas[samples == s]) for s in order]
+    bounds = np.unique(np.concatenate([starts, ends]))
+    n_seg = len(bounds) - 1
+    for lo in range(0, n_seg, chunk):
+        hi = min(lo + chunk, n_seg)
+        seg_start, seg_end = bounds[lo:hi], bounds[lo + 1:hi + 1]
+        values = np.full((len(seg_start), len(order)), np.nan, dtype=np.float32)
+        for j, (st, en, tm) in enumerate(per_sample):
+            idx = np.searchsorted(st, seg_start, side="right") - 1
+            ok = (idx >= 0) & (seg_start < en[np.clip(idx, 0, None)])
+            values[ok, j] = tm[idx[ok]]
+        covered = np.isfinite(values).any(axis=1)
+        values = values[covered].astype(np.float64)
+        yield (seg_start[covered], seg_end[covered], np.nanmean(values, axis=1),
+               *np.nanquantile(values, quantiles, axis=1))
+
+
+def main():
+    p = argparse.ArgumentParser(description="TMRCA per region from ARGweaver .smc(.gz) samples")
+    p.add_argument("inputs", nargs="+", help="SMC files or run.arg.%%d.smc.gz patterns")
+    p.add_argument("--out", default=None, help="Per-region table (chrom start end mean median lower upper)")
+    p.add_argument("--npz", default=None, help="Compact per-block arrays of all samples")
+    p.add_argument("--interval", type=float, default=0.95, help="Credible interval for lower/upper")
+    p.add_argument("--burnin", type=int, default=0, help="Skip samples with a smaller MCMC iteration")
+    p.add_argument("--jobs", type=int, default=None, help="Parsing processes (default: all cores)")
+    args = p.parse_args()
+
+    paths = [f for f in expand_inputs(args.inputs) if sample_number(f) >= args.burnin or sample_number(f) < 0]
+    if not paths:
+        sys.exit("No SMC files found")
+    if args.jobs == 1 or len(paths) < 2:
+        parsed = [read_smc(f) for f in paths]
+    else:
+        with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+            parsed = list(pool.map(read_smc, paths))
+
+    chrom, names = parsed[0][0], parsed[0][1]
+    samples = np.concatenate([np.full(len(r[2]), sample_number(f), dtype=np.int32) for f, r in zip(paths, parsed)])
+    starts = np.concatenate([r[2] for r in parsed])
+    ends = np.concatenate([r[3] for r in parsed])
+    tmrcas = np.concatenate([r[4] for r in parsed])
+    print(f"[smc] {len(paths)} samples, {len(tmrcas)} blocks from {chrom}")
+
+    if args.npz:
+        np.savez(args.npz, sample=samples, start=starts, end=ends, tmrca=tmrcas.astype(np.float32),
+                 chrom=np.array(chrom or ""), names=np.array(names, dtype=str))
+        print(f"✔ Block arrays saved to {args.npz}")
+    if args.out:
+        tail = (1 - args.interval) / 2
+        n = 0
+        with open(args.out, "w") as fh:
+            for chunk in region_table(starts, ends, tmrcas, samples, [0.5, tail, 1 - tail]):
+                for row in zip(*chunk):
+                    fh.write(f"{chrom}\t{row[0]}\t{row[1]}\t{row[2]:.6g}\t{row[3]:.6g}\t{row[4]:.6g}\t{row[5]:.6g}\n")
+                n += len(chunk[0])
+        print(f"✔ {n} regions saved to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,59 +3,101 @@ import pandas as pd
 import numpy as np
 import argparse
 
+from lrt_calibration import METHODS as CALIBRATION_METHODS, calibrate
+
+KEYS = ["model", "replicate", "K"]
+
+
+def pair_transitions(df):
+    """
+    Pairs every (model, replicate, K) with K+1 in one sort and self-merge.
+    Log-likelihoods are those of the first row for each K, as listed in the input.
+    Rows come out in input order of model and replicate, then by K.
+
+    Returns (pairs, pool): pool holds all log-likelihoods sorted so each
+    (model, replicate, K) is contiguous; pairs carries the K0 block as _start/_size.
+    """
+    df = df.assign(
+        _model=df.groupby("model", sort=False).ngroup(),
+        _rep=df.groupby(["model", "replicate"], sort=False).ngroup(),
+    ).sort_values(["_model", "_rep", "K"], kind="stable").reset_index(drop=True)
+
+    first = df.drop_duplicates(KEYS)
+    first = first.assign(_start=first.index, _size=np.diff(np.append(first.index, len(df))))
+    nxt = first[KEYS + ["log_likelihood"]].assign(K=first["K"] - 1)
+    pairs = first.merge(nxt, on=KEYS, suffixes=("_K0", "_K1"))
+    pairs = pairs.sort_values(["_model", "_rep", "K"], kind="stable").reset_index(drop=True)
+    pairs = pairs.rename(columns={
+        "K": "K0",
+        "log_likelihood_K0": "loglik_K0",
+        "log_likelihood_K1": "loglik_K1",
+    })
+    pairs["K1"] = pairs["K0"] + 1
+    return pairs, df["log_likelihood"].to_numpy(dtype=float)
+
+
+def bootstrap_matrix(pool, start, size, bootstraps, rng):
+    """
+    Bootstrap statistics for all pairs as one (n_pairs, bootstraps) array:
+    T_b = -2 * (ll_a - ll_b), with ll_a and ll_b drawn with replacement from
+    pool[start:start + size] (the K0 log-likelihoods of each pair).
+    """
+    start = np.asarray(start)[:, None, None]
+    size = np.asarray(size)[:, None, None]
+    draws = start + (rng.random((start.shape[0], bootstraps, 2)) * size).astype(np.int64)
+    ll = pool[draws]
+    return -2 * (ll[..., 0] - ll[..., 1])
+
+
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("--input", required=True, help="Input CSV file from STRUCTURE log-likelihoods")
     parser.add_argument("--output", default="bootstrap_lrt_results.csv")
     parser.add_argument("--bootstraps", type=int, default=100, help="Number of bootstrap replicates")
+    parser.add_argument("--seed", type=int, default=None, help="Random seed for the bootstrap draws")
+    parser.add_argument("--calibrated", action="store_true",
+                        help="Fit a scaled chi-square/gamma null to --pilot replicates and take p-values "
+                             "from it; only pairs whose fit is poor get all --bootstraps replicates")
+    parser.add_argument("--pilot", type=int, default=20, help="Pilot replicates for --calibrated")
+    parser.add_argument("--calibration", choices=CALIBRATION_METHODS, default="chi2")
+    parser.add_argument("--min_ks_p", type=float, default=0.1,
+                        help="Fall back to the full bootstrap below this KS p-value")
     args = parser.parse_args()
 
     df = pd.read_csv(args.input)
     df = df.dropna(subset=["model", "replicate", "K", "log_likelihood"])
 
-    lrt_results = []
-
-    for model in df["model"].unique():
-        model_df = df[df["model"] == model]
-        for replicate in model_df["replicate"].unique():
-            rep_df = model_df[model_df["replicate"] == replicate]
-            k_values = sorted(rep_df["K"].unique())
-
-            for k in k_values:
-                k_next = k + 1
-                if k_next not in rep_df["K"].values:
-                    continue
-
-                row_k = rep_df[rep_df["K"] == k]
-                row_k1 = rep_df[rep_df["K"] == k_next]
-
-                if row_k.empty or row_k1.empty:
-                    continue
-
-                loglik_k = row_k["log_likelihood"].values[0]
-                loglik_k1 = row_k1["log_likelihood"].values[0]
-                T_obs = -2 * (loglik_k - loglik_k1)
-
-                boot_stats = [
-                    -2 * (np.random.choice(row_k["log_likelihood"].values) - 
-                          np.random.choice(row_k["log_likelihood"].values))
-                    for _ in range(args.bootstraps)
-                ]
-
-                p_val = np.mean(np.array(boot_stats) > T_obs)
-
-                lrt_results.append({
-                    "model": model,
-                    "replicate": replicate,
-                    "K0": k,
-                    "K1": k_next,
-                    "loglik_K0": loglik_k,
-                    "loglik_K1": loglik_k1,
-                    "T_obs": T_obs,
-                    "p_value": p_val
-                })
-
-    pd.DataFrame(lrt_results).to_csv(args.output, index=False)
+    pairs, pool = pair_transitions(df)
+    T_obs = (-2 * (pairs["loglik_K0"] - pairs["loglik_K1"])).to_numpy()
+
+    rng = np.random.default_rng(args.seed)
+    start, size = pairs["_start"].to_numpy(), pairs["_size"].to_numpy()
+    out = pairs[["model", "replicate", "K0", "K1", "loglik_K0", "loglik_K1"]].assign(T_obs=T_obs)
+
+    if not args.calibrated:
+        boot = bootstrap_matrix(pool, start, size, args.bootstraps, rng)
+        out["p_value"] = np.mean(boot > T_obs[:, None], axis=1) if args.bootstraps else np.nan
+    else:
+        # Pilot draws only; the remaining draws are made just for the pairs that fall
+        # back to the bootstrap. With one chain per K the null is a point mass at 0,
+        # which cannot be calibrated, so those pairs go straight to the bootstrap.
+        n_pilot = min(args.pilot, args.bootstraps)
+        pilot = bootstrap_matrix(pool, start, size, n_pilot, rng)
+        fits = [calibrate(row, t, method=args.calibration, min_ks_p=args.min_ks_p) if n > 1 else (None, None)
+                for row, t, n in zip(pilot, T_obs, size)]
+        p_cal = np.array([np.nan if p is None else p for p, _ in fits], dtype=float)
+        fallback = np.isnan(p_cal)
+        p_val = p_cal.copy()
+        if fallback.any() and args.bootstraps:
+            rest = bootstrap_matrix(pool, start[fallback], size[fallback], args.bootstraps - n_pilot, rng)
+            boot = np.concatenate([pilot[fallback], rest], axis=1)
+            p_val[fallback] = np.mean(boot > T_obs[fallback, None], axis=1)
+        out["p_value"] = p_val
+        out["p_method"] = np.where(fallback, "bootstrap", "calibrated")
+        out["calib_ks"] = [fit["ks"] if fit else np.nan for _, fit in fits]
+        out["calib_ks_p"] = [fit["ks_p"] if fit else np.nan for _, fit in fits]
+
+    out.to_csv(args.output, index=False)
     print(f"Bootstrap LRT results written to: {args.output}")
 
 if __name__ == "__main__":
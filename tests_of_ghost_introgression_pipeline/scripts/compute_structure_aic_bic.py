@@ -5,6 +5,9 @@ import pandas as pd
 import numpy as np
 import argparse
 
+from structure_output import load_structure_f
+from genotype_store import structure_dimensions
+
 parser = argparse.ArgumentParser()
 parser.add_argument("--indir", required=True, help="Path to STRUCTURE output base directory")
 parser.add_argument("--strdir", required=True, help="Path to .str files directory")
@@ -37,17 +40,14 @@ for model in sorted(os.listdir(args.indir)):
             continue
 
         try:
-            with open(str_file) as f:
-                lines = [line.strip() for line in f if line.strip()]
-            I = len(lines)
-            num_loci = len(lines[0].split()) - 1
+            I, num_loci = structure_dimensions(str_file)
             A = num_loci * (2 - 1)
         except Exception as e:
             print(f"Error parsing {str_file}: {e}")
             continue
 
         for file in os.listdir(rep_path):
-            match = re.match(r"structure_run_K(\d+)_f", file)
+            match = re.match(r"structure_run_K(\d+)_f$", file)
             if not match:
                 continue
 
@@ -55,10 +55,9 @@ for model in sorted(os.listdir(args.indir)):
             output_file = os.path.join(rep_path, file)
 
             try:
-                with open(output_file, 'r') as f:
-                    lines = f.readlines()
-                lnL_line = [l for l in lines if "Estimated Ln Prob of Data" in l][-1]
-                lnL = float(re.search(r"-?\d+\.\d+", lnL_line).group())
+                lnL = load_structure_f(output_file)["lnprob"]
+                if lnL is None:
+                    raise ValueError("no 'Estimated Ln Prob of Data' line")
             except Exception as e:
                 print(f"Error reading {output_file}: {e}")
                 continue
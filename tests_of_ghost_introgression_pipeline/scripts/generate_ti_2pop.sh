@@ -1,7 +1,7 @@
 #!/bin/bash
 set -euo pipefail
 
-INPUT_DIR=$1
+INPUT=$1    # directory of .u files, or a single .u file
 OUTPUT_DIR=$2
 IMA3=$3
 NCORES=${4:-2}
@@ -15,7 +15,13 @@ HB=${11:-0.85}
 
 mkdir -p "$OUTPUT_DIR"
 
-for FILE in "$INPUT_DIR"/*.u; do
+if [ -d "$INPUT" ]; then
+    FILES=("$INPUT"/*.u)
+else
+    FILES=("$INPUT")
+fi
+
+for FILE in "${FILES[@]}"; do
     BASENAME=$(basename "$FILE" .u_2pop.u)
     echo "→ Sampling genealogies for $BASENAME using $NCORES cores"
 
@@ -0,0 +1,398 @@
+#!/usr/bin/env python3
+"""
+Packed, memory-mapped genotype store (`.gst`) shared by the STRUCTURE-side scripts.
+
+File layout:
+  - 32-byte fixed header: magic b"GHGS", version, ploidy, I (individuals), L (loci),
+    length of the JSON metadata block
+  - JSON metadata: sample IDs, locus IDs and the two allele labels of every locus
+  - zero padding up to a 64-byte boundary
+  - L locus rows of ceil(I / 4) bytes, four individuals per byte, two bits each,
+    lowest bits first, with the PLINK .bed codes:
+        00 = 0 copies of allele 1, 01 = missing, 10 = 1 copy, 11 = 2 copies
+    Haploid stores (ploidy 1) only use 00 and 10.
+
+The body is byte-for-byte a SNP-major .bed body, so .bed conversion is a copy. Loci
+are rows, so rows() of a locus slice is a view of the mapped file; dosages() decodes
+a slice to a new (I, l) uint8 array with 3 for missing. admixture_em.fit_admixture()
+accepts a GenotypeStore and decodes it with iter_blocks() one block of loci at a
+time; np.asarray(store) decodes every locus into memory. read_shape() reads only
+the fixed header, which is what structure_dimensions() uses for the .str consumers
+(run_structure.py creates the store with ensure_store() when the .str allows it).
+
+Converters (also on the command line, `python genotype_store.py convert IN OUT.gst`):
+  - from_str():       STRUCTURE .str, one row per individual (PLOIDY 1 as written by
+                      run_structure.py) or two rows per individual with ploidy=2
+  - from_bed():       PLINK .bed/.bim/.fam
+  - from_ima3_u():    IMa3 .u sequence input; every biallelic segregating site becomes
+                      a locus and every gene copy a haploid sample, matched across
+                      loci by sequence name
+"""
+import argparse
+import json
+import os
+import struct
+import sys
+
+import numpy as np
+
+MAGIC = b"GHGS"
+VERSION = 1
+_HEADER = struct.Struct("<4sHHQQQ")
+_ALIGN = 64
+MISSING = 3
+
+# 2-bit code -> allele-1 count (MISSING for 01), and back
+_CODE_TO_COUNT = np.array([0, MISSING, 1, 2], dtype=np.uint8)
+_COUNT_TO_CODE = np.array([0b00, 0b10, 0b11, 0b01], dtype=np.uint8)
+# Every byte value -> its four decoded individuals
+_DECODE = _CODE_TO_COUNT[(np.arange(256)[:, None] >> np.array([0, 2, 4, 6])) & 0b11]
+
+
+def row_bytes(n_individuals):
+    return (n_individuals + 3) // 4
+
+
+def _data_offset(meta_len):
+    end = _HEADER.size + meta_len
+    return end + (-end) % _ALIGN
+
+
+# Packing
+
+def pack_dosages(dosages):
+    """
+    Packs an (I, l) array of allele-1 counts (MISSING = 3) into (l, ceil(I/4)) rows.
+    """
+    D = np.asarray(dosages, dtype=np.uint8)
+    I, l = D.shape
+    codes = _COUNT_TO_CODE[np.minimum(D, MISSING)].T
+    pad = (-I) % 4
+    if pad:
+        codes = np.pad(codes, ((0, 0), (0, pad)), constant_values=0b01)
+    codes = codes.reshape(l, -1, 4)
+    return (codes[:, :, 0] | (codes[:, :, 1] << 2)
+            | (codes[:, :, 2] << 4) | (codes[:, :, 3] << 6)).astype(np.uint8)
+
+
+def unpack_rows(rows, n_individuals):
+    """Decodes packed locus rows (l, ceil(I/4)) to an (I, l) uint8 dosage array."""
+    rows = np.asarray(rows, dtype=np.uint8)
+    return _DECODE[rows].reshape(rows.shape[0], -1)[:, :n_individuals].T
+
+
+# Writing
+
+def write_store(path, blocks, n_individuals, n_loci, ploidy=1, samples=None, loci=None,
+                alleles=None, packed=False):
+    """
+    Writes a store from locus blocks in order: (I, l) dosage arrays, or already
+    packed (l, ceil(I/4)) rows with packed=True. The file is written to a temporary
+    name and renamed, so readers never see a partial store.
+    """
+    meta = json.dumps({
+        "samples": [str(s) for s in samples] if samples is not None
+        else [f"ind{i + 1}" for i in range(n_individuals)],
+        "loci": [str(l) for l in loci] if loci is not None
+        else [f"L{l + 1}" for l in range(n_loci)],
+        "alleles": [[str(a) for a in pair] for pair in alleles] if alleles is not None
+        else [["0", "1"]] * n_loci,
+    }).encode()
+    offset = _data_offset(len(meta))
+
+    tmp = f"{path}.{os.getpid()}.tmp"
+    written = 0
+    with open(tmp, "wb") as fh:
+        fh.write(_HEADER.pack(MAGIC, VERSION, ploidy, n_individuals, n_loci, len(meta)))
+        fh.write(meta)
+        fh.write(b"\0" * (offset - _HEADER.size - len(meta)))
+        for block in blocks:
+            rows = np.asarray(block, dtype=np.uint8) if packed else pack_dosages(block)
+            if rows.shape[1:] != (row_bytes(n_individuals),):
+                raise ValueError(f"Block of shape {rows.shape} does not hold {n_individuals} individuals")
+            fh.write(rows.tobytes())
+            written += rows.shape[0]
+    if written != n_loci:
+        os.remove(tmp)
+        raise ValueError(f"Wrote {written} loci, header says {n_loci}")
+    os.replace(tmp, path)
+    return path
+
+
+# Reading
+
+def read_shape(path):
+    """(I, L, ploidy) from the fixed header, without reading metadata or genotypes."""
+    with open(path, "rb") as fh:
+        magic, version, ploidy, I, L, _ = _HEADER.unpack(fh.read(_HEADER.size))
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"{path} is not a version {VERSION} genotype store")
+    return I, L, ploidy
+
+
+class GenotypeStore:
+    """Read-only memory-mapped view of a .gst file."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as fh:
+            magic, version, self.ploidy, self.n_individuals, self.n_loci, meta_len = \
+                _HEADER.unpack(fh.read(_HEADER.size))
+            if magic != MAGIC or version != VERSION:
+                raise ValueError(f"{path} is not a version {VERSION} genotype store")
+            self._meta_raw = fh.read(meta_len)
+        self._meta = None
+        offset = _data_offset(meta_len)
+        if self.n_loci and self.n_individuals:
+            self.packed = np.memmap(path, dtype=np.uint8, mode="r", offset=offset,
+                                    shape=(self.n_loci, row_bytes(self.n_individuals)))
+        else:
+            self.packed = np.zeros((self.n_loci, row_bytes(self.n_individuals)), dtype=np.uint8)
+
+    @property
+    def shape(self):
+        return self.n_individuals, self.n_loci
+
+    def _metadata(self):
+        if self._meta is None:
+            self._meta = json.loads(self._meta_raw)
+        return self._meta
+
+    @property
+    def samples(self):
+        return self._metadata()["samples"]
+
+    @property
+    def loci(self):
+        return self._metadata()["loci"]
+
+    @property
+    def alleles(self):
+        return self._metadata()["alleles"]
+
+    def rows(self, start=0, stop=None):
+        """Packed rows of loci start..stop, a view of the mapped file."""
+        return self.packed[start:stop]
+
+    def dosages(self, start=0, stop=None):
+        """(I, l) uint8 allele-1 counts for loci start..stop, MISSING = 3."""
+        return unpack_rows(self.rows(start, stop), self.n_individuals)
+
+    def iter_blocks(self, block_loci=4096):
+        """Yields (start, stop, dosages) over all loci."""
+        for start in range(0, self.n_loci, block_loci):
+            stop = min(start + block_loci, self.n_loci)
+            yield start, stop, self.dosages(start, stop)
+
+    def allele_frequencies(self):
+        """Allele-1 frequency of every locus over non-missing genotypes."""
+        counts = np.zeros(self.n_loci)
+        observed = np.zeros(self.n_loci)
+        for start, stop, D in self.iter_blocks():
+            ok = D != MISSING
+            counts[start:stop] = np.where(ok, D, 0).sum(axis=0)
+            observed[start:stop] = ok.sum(axis=0) * self.ploidy
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return counts / observed
+
+    def __array__(self, dtype=None, copy=None):
+        # A decoded copy of the whole store; use iter_blocks() to stay within memory
+        D = self.dosages()
+        return D if dtype is None else D.astype(dtype)
+
+    def __len__(self):
+        return self.n_individuals
+
+
+# Converters
+
+def _biallelic_codes(values, missing, what):
+    """
+    Maps an (n, L) array of allele labels to (indices 0/1 or MISSING, allele pairs).
+    Per locus, allele 0 is the smallest label and allele 1 the other one.
+    """
+    n, L = values.shape
+    out = np.full((n, L), MISSING, dtype=np.uint8)
+    alleles = []
+    for l in range(L):
+        col = values[:, l]
+        ok = ~np.isin(col, missing)
+        labels = np.unique(col[ok])
+        if labels.size > 2:
+            raise ValueError(f"{what}: locus {l + 1} has {labels.size} alleles; the store is biallelic")
+        out[ok, l] = np.searchsorted(labels, col[ok])
+        alleles.append(list(labels) + ["-1"] * (2 - labels.size))
+    return out, alleles
+
+
+def from_str(str_path, out_path, ploidy=1, missing=("0", "-9")):
+    """Converts a STRUCTURE .str file (label column then one column per locus)."""
+    labels, rows = [], []
+    with open(str_path) as fh:
+        for line in fh:
+            parts = line.split()
+            if parts:
+                labels.append(parts[0])
+                rows.append(parts[1:])
+    if not rows:
+        raise ValueError(f"{str_path} has no genotype rows")
+    values = np.array(rows)
+    alleles_idx, alleles = _biallelic_codes(values, list(missing), str_path)
+    if ploidy == 2:
+        if len(labels) % 2:
+            raise ValueError(f"{str_path}: odd number of rows for two rows per individual")
+        a, b = alleles_idx[0::2], alleles_idx[1::2]
+        D = np.where((a == MISSING) | (b == MISSING), MISSING, a + b).astype(np.uint8)
+        labels = labels[0::2]
+    else:
+        D = alleles_idx
+    loci = [f"L{l + 1}" for l in range(values.shape[1])]
+    return write_store(out_path, [D], D.shape[0], D.shape[1], ploidy, labels, loci, alleles)
+
+
+def from_bed(prefix, out_path, block_loci=4096):
+    """Converts a PLINK SNP-major .bed/.bim/.fam fileset (allele 1 = A2)."""
+    with open(f"{prefix}.fam") as fh:
+        samples = [line.split()[1] for line in fh if line.strip()]
+    with open(f"{prefix}.bim") as fh:
+        bim = [line.split() for line in fh if line.strip()]
+    I, L = len(samples), len(bim)
+    bed = np.memmap(f"{prefix}.bed", dtype=np.uint8, mode="r")
+    if bytes(bed[:3]) != bytes([0x6C, 0x1B, 0x01]):
+        raise ValueError(f"{prefix}.bed is not a SNP-major PLINK .bed")
+    body = bed[3:3 + L * row_bytes(I)].reshape(L, row_bytes(I))
+    blocks = (body[s:s + block_loci] for s in range(0, L, block_loci))
+    return write_store(out_path, blocks, I, L, 2, samples, [r[1] for r in bim],
+                       [[r[4], r[5]] for r in bim], packed=True)
+
+
+def read_ima3_u(u_path):
+    """
+    Reads an IMa3 .u input file. Returns [(locus_name, [(sample, sequence), ...]), ...].
+    """
+    with open(u_path) as fh:
+        lines = [line.rstrip("\n") for line in fh]
+    body = [line for line in lines[1:] if line.strip() and not line.lstrip().startswith("#")]
+    n_pops = int(body[0].split()[0])
+    # population names, population tree, number of loci
+    n_loci = int(body[3].split()[0])
+    pos = 4
+    loci = []
+    for _ in range(n_loci):
+        info = body[pos].split()
+        n_seqs = sum(int(x) for x in info[1:1 + n_pops])
+        seqs = [(line[:10].strip(), line[10:].strip().upper())
+                for line in body[pos + 1:pos + 1 + n_seqs]]
+        loci.append((info[0], seqs))
+        pos += 1 + n_seqs
+    return loci
+
+
+def from_ima3_u(u_path, out_path, missing="N-?"):
+    """Converts the biallelic segregating sites of an IMa3 .u file (haploid samples)."""
+    loci = read_ima3_u(u_path)
+    samples = []
+    index = {}
+    for _, seqs in loci:
+        for name, _ in seqs:
+            if name not in index:
+                index[name] = len(samples)
+                samples.append(name)
+
+    blocks, locus_ids, alleles = [], [], []
+    for locus_name, seqs in loci:
+        if not seqs:
+            continue
+        width = max(len(s) for _, s in seqs)
+        site = np.full((len(samples), width), "N", dtype="<U1")
+        for name, seq in seqs:
+            site[index[name], :len(seq)] = list(seq)
+        ok = ~np.isin(site, list(missing))
+        n_states = np.array([np.unique(site[ok[:, j], j]).size for j in range(width)])
+        keep = np.flatnonzero(n_states == 2)
+        if keep.size == 0:
+            continue
+        D, pairs = _biallelic_codes(site[:, keep], list(missing), f"{u_path}:{locus_name}")
+        blocks.append(D)
+        locus_ids += [f"{locus_name}_{j + 1}" for j in keep]
+        alleles += pairs
+    D = np.concatenate(blocks, axis=1) if blocks else np.zeros((len(samples), 0), dtype=np.uint8)
+    return write_store(out_path, [D], len(samples), D.shape[1], 1, samples, locus_ids, alleles)
+
+
+# Dimension queries for .str consumers
+
+def store_path_for(str_path):
+    """The store converted from a .str file sits next to it with a .gst suffix."""
+    return os.path.splitext(str_path)[0] + ".gst"
+
+
+def ensure_store(str_path, ploidy=1):
+    """
+    Converts str_path to its .gst unless a store at least as new exists. Returns
+    the store path, or None (with a message) when the .str cannot be stored, e.g.
+    a multiallelic locus; structure_dimensions() then reads the .str itself.
+    """
+    gst = store_path_for(str_path)
+    if os.path.exists(gst) and os.path.getmtime(gst) >= os.path.getmtime(str_path):
+        return gst
+    try:
+        return from_str(str_path, gst, ploidy=ploidy)
+    except ValueError as e:
+        print(f"[gst] {e}; using the .str directly")
+        return None
+
+
+def structure_dimensions(str_path):
+    """
+    (rows, loci) of a STRUCTURE .str file. Read from the header of its .gst store
+    when that is at least as new as the .str, else counted by streaming the file.
+    """
+    gst = store_path_for(str_path)
+    if os.path.exists(gst) and os.path.getmtime(gst) >= os.path.getmtime(str_path):
+        I, L, ploidy = read_shape(gst)
+        return I * ploidy, L
+    n_rows = n_loci = 0
+    with open(str_path) as fh:
+        for line in fh:
+            parts = line.split()
+            if parts:
+                if not n_rows:
+                    n_loci = len(parts) - 1
+                n_rows += 1
+    return n_rows, n_loci
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convert to / inspect packed genotype stores (.gst).")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    conv = sub.add_parser("convert", help="Convert .str, PLINK .bed (prefix or .bed path) or IMa3 .u")
+    conv.add_argument("input")
+    conv.add_argument("output", nargs="?", help="Output .gst (default: input stem + .gst)")
+    conv.add_argument("--ploidy", type=int, default=1, choices=[1, 2], help=".str rows per individual")
+    info = sub.add_parser("info", help="Print I, L and ploidy")
+    info.add_argument("store")
+    args = parser.parse_args(argv)
+
+    if args.cmd == "info":
+        I, L, ploidy = read_shape(args.store)
+        print(f"individuals\t{I}\nloci\t{L}\nploidy\t{ploidy}")
+        return 0
+
+    stem, ext = os.path.splitext(args.input)
+    out = args.output or stem + ".gst"
+    if ext == ".str":
+        from_str(args.input, out, ploidy=args.ploidy)
+    elif ext == ".u":
+        from_ima3_u(args.input, out)
+    elif ext == ".bed" or os.path.exists(args.input + ".bed"):
+        from_bed(stem if ext == ".bed" else args.input, out)
+    else:
+        parser.error(f"Cannot tell the format of {args.input}")
+    I, L, ploidy = read_shape(out)
+    print(f"Wrote {out}: {I} individuals x {L} loci (ploidy {ploidy})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
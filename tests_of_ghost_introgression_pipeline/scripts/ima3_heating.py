@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+"""
+Pilot-run calibration of IMa3 Metropolis coupling (-hn, -ha, -hb) per input file.
+
+For every .u file, short IMa3 pilot runs are made over a grid of heating settings
+(--hn x --ha x --hb, plus the --reference setting currently used in production),
+several at a time within --cores. The chain swap table of each pilot output is
+parsed into adjacent-pair acceptance rates and chain betas:
+
+    <IMa3's chain swapping section header, --swap_header>
+    (column headers / rules)
+    <chain i> ... <beta_i> ... <rate of swaps between i and i+1>
+    (one row per adjacent pair; the first value in (0, 1] after the chain index is
+    read as beta, the last value in [0, 1] as the rate; the rows must follow the
+    header directly and end at the first other line; if the section is printed
+    more than once, the last one is used)
+
+A pilot's table must have exactly procs * hn - 1 rows (IMa3's -hn is per MPI
+process); otherwise it is reported and treated as missing, and a file whose
+reference pilot has no valid table keeps the reference setting.
+
+A setting is feasible for a file when
+  - its smallest adjacent swap rate is at least --target (the weakest pair limits
+    how far information travels down the ladder), and
+  - its hottest chain is at least as hot as the reference setting's
+    (beta_hot <= reference beta_hot + --beta_tol), so fewer chains are not bought by
+    simply heating less.
+The chosen setting is the feasible one with the fewest chains (ties: higher minimum
+swap rate); files without a feasible setting keep the reference and are flagged.
+
+From the reference pilot the thermodynamic length of the ladder is also estimated
+(Predescu et al. 2004: an adjacent pair with acceptance r spans
+2 * sqrt(2) * erfcinv(r) units, independent of how it is heated). The number of
+chains whose equal-length steps would each reach --target is reported as hn_estimate,
+a check on the grid.
+
+Outputs
+  OUTDIR/pilots/<name>.hn<hn>_ha<ha>_hb<hb>.out   pilot IMa3 outputs (+ .log); reused
+  OUTDIR/heating_pilots.tsv    name, hn, ha, hb, pairs, min_swap, mean_swap, beta_hot,
+                               feasible, reference
+  --config (YAML)              ima3_heating: {SET: {name: {hn, ha, hb, min_swap,
+                               beta_hot, hn_estimate, status}}}; other sets and names
+                               already in the file are kept (the Snakefile gives
+                               each set its own file)
+
+--lookup NAME prints "hn ha hb" of one sample of --set from --config, or the
+--reference setting if the file or the sample is missing (used by generate_ti_* and
+the top-level Snakefile's run_ima3).
+
+Usage:
+    python scripts/ima3_heating.py data/ima3_inputs_2pop/*.u --set 2pop \\
+        --ima3 ../IMa3/IMa3 --cores 8 --outdir results/ima3/heating \\
+        --config results/ima3/heating/2pop/ima3_heating.yaml -- -q 100 -m 5.5 -t 5.5 -b 2000 -L 200 -p 1
+    python scripts/ima3_heating.py --lookup model1_replicate0 --set 2pop \
+        --config results/ima3/heating/2pop/ima3_heating.yaml --reference 20 0.95 0.85
+"""
+import argparse
+import math
+import os
+import re
+import shlex
+import subprocess
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import yaml
+from scipy.special import erfcinv
+
+_NUM = re.compile(r"(?<![\w.])-?\d*\.?\d+(?:[eE][-+]?\d+)?")
+SWAP_HEADER = r"(?i)^\s*(?:heated\s+)?chain\s+swap"
+
+
+def _swap_row(line):
+    """(beta, rate) of a swap table row, or None."""
+    values = [float(v) for v in _NUM.findall(line)]
+    if len(values) < 3 or values[0] != int(values[0]) or values[0] < 0:
+        return None
+    beta = next((v for v in values[1:] if 0 < v <= 1), None)
+    rate = next((v for v in reversed(values[1:]) if 0 <= v <= 1), None)
+    return None if beta is None or rate is None else (beta, rate)
+
+
+def parse_swap_rates(path, header=SWAP_HEADER):
+    """(betas, rates) of the last chain swap table in an IMa3 output, or None if absent."""
+    head = re.compile(header)
+    last, rows = [], None      # rows is None outside a swap section
+    with open(path, errors="replace") as fh:
+        for line in fh:
+            if head.search(line):
+                rows = []
+                continue
+            if rows is None:
+                continue
+            row = _swap_row(line)
+            if row is not None:
+                rows.append(row)
+            elif rows or _NUM.search(line) and not set(line.strip()) <= set("=-_*"):
+                # end of the table; before its first row only text headers and rules
+                last = rows or last
+                rows = None
+    if rows:
+        last = rows
+    if not last:
+        return None
+    betas, rates = np.array(last).T
+    return betas, rates
+
+
+def hn_estimate(rates, target):
+    """Chains needed for equal thermodynamic-length steps with acceptance target each."""
+    rates = np.clip(np.asarray(rates, dtype=float), 1e-12, 1 - 1e-12)
+    length = (2 * math.sqrt(2) * erfcinv(rates)).sum()
+    step = 2 * math.sqrt(2) * erfcinv(target)
+    return int(math.ceil(length / step)) + 1
+
+
+def pilot_path(outdir, name, hn, ha, hb):
+    return os.path.join(outdir, "pilots", f"{name}.hn{hn}_ha{ha:g}_hb{hb:g}.out")
+
+
+def valid_table(cfg, out, hn):
+    """Parsed swap table of out if it has the procs * hn - 1 pairs of the pilot, else None."""
+    parsed = parse_swap_rates(out, cfg.swap_header) if os.path.exists(out) else None
+    if parsed is not None and len(parsed[1]) != cfg.procs * hn - 1:
+        print(f"⚠ {out}: swap table has {len(parsed[1])} pairs, expected {cfg.procs * hn - 1}; ignored")
+        return None
+    return parsed
+
+
+def run_pilot(cfg, ufile, out, hn, ha, hb):
+    """Runs one pilot unless its output already holds a valid swap table. Returns the parse result."""
+    parsed = parse_swap_rates(out, cfg.swap_header) if os.path.exists(out) else None
+    if parsed is not None and len(parsed[1]) == cfg.procs * hn - 1:
+        return parsed
+    launcher = shlex.split(cfg.launcher.format(procs=cfg.procs)) if cfg.launcher else []
+    cmd = launcher + [cfg.ima3, "-i", ufile, "-o", out, "-hn", str(hn), "-ha", str(ha), "-hb", str(hb)]
+    with open(f"{out}.log", "w") as log:
+        subprocess.run(cmd + cfg.ima3_args, stdout=log, stderr=subprocess.STDOUT)
+    return valid_table(cfg, out, hn)
+
+
+def choose(rows, target, beta_tol):
+    """Chosen row of one file's pilots (see module docstring) and its status."""
+    ref = next((r for r in rows if r["reference"]), None)
+    if not ref["pairs"]:
+        return ref, "reference kept: no valid reference swap table"
+    for r in rows:
+        r["feasible"] = bool(r["pairs"]) and r["min_swap"] >= target and r["beta_hot"] <= ref["beta_hot"] + beta_tol
+    feasible = [r for r in rows if r["feasible"]]
+    if not feasible:
+        return ref, "reference kept: no setting reached the target"
+    best = min(feasible, key=lambda r: (r["hn"], -r["min_swap"]))
+    return best, "calibrated"
+
+
+def update_config(path, set_name, chosen):
+    data = {}
+    if os.path.exists(path):
+        with open(path) as fh:
+            data = yaml.safe_load(fh) or {}
+    data.setdefault("ima3_heating", {}).setdefault(set_name, {}).update(chosen)
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as fh:
+        fh.write("# Written by scripts/ima3_heating.py (pilot swap-rate calibration)\n")
+        yaml.safe_dump(data, fh, sort_keys=True, default_flow_style=False)
+    os.replace(tmp, path)
+
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description="Calibrate IMa3 heating (-hn/-ha/-hb) from pilot swap rates",
+                                epilog="Arguments after -- are passed to every pilot IMa3 run.")
+    p.add_argument("inputs", nargs="*", help=".u input files")
+    p.add_argument("--set", required=True, help="Name of the input set in the config (e.g. 2pop, 3pop)")
+    p.add_argument("--ima3", default=None)
+    p.add_argument("--lookup", default=None, metavar="NAME", help="Print hn ha hb of one sample and exit")
+    p.add_argument("--hn", type=int, nargs="+", default=[10, 20, 30, 40, 60, 80, 120])
+    p.add_argument("--ha", type=float, nargs="+", default=[0.96, 0.99])
+    p.add_argument("--hb", type=float, nargs="+", default=[0.8, 0.9])
+    p.add_argument("--reference", nargs=3, type=float, default=[120, 0.99, 0.9], metavar=("HN", "HA", "HB"),
+                   help="Production setting the calibration must not heat less than")
+    p.add_argument("--target", type=float, default=0.3, help="Minimum adjacent swap rate")
+    p.add_argument("--beta_tol", type=float, default=0.0)
+    p.add_argument("--cores", type=int, default=os.cpu_count() or 1)
+    p.add_argument("--procs", type=int, default=1, help="MPI processes per pilot")
+    p.add_argument("--launcher", default="mpirun -np {procs}", help="Empty runs IMa3 directly")
+    p.add_argument("--swap_header", default=SWAP_HEADER, help="Regex of the chain swapping section header")
+    p.add_argument("--outdir", default="results/ima3/heating")
+    p.add_argument("--config", default="config/ima3_heating.yaml")
+    argv = sys.argv[1:] if argv is None else argv
+    extra = []
+    if "--" in argv:
+        i = argv.index("--")
+        argv, extra = argv[:i], argv[i + 1:]
+    cfg = p.parse_args(argv)
+    cfg.ima3_args = extra
+    if cfg.lookup is None and (not cfg.inputs or cfg.ima3 is None):
+        p.error("calibration needs .u inputs and --ima3")
+    return cfg
+
+
+def lookup(path, set_name, name, reference):
+    """(hn, ha, hb) of one sample from a heating YAML, or the reference setting."""
+    sample = {}
+    if os.path.exists(path):
+        with open(path) as fh:
+            sample = ((yaml.safe_load(fh) or {}).get("ima3_heating", {}).get(set_name) or {}).get(name) or {}
+    return (int(sample.get("hn", reference[0])), float(sample.get("ha", reference[1])),
+            float(sample.get("hb", reference[2])))
+
+
+def main():
+    cfg = parse_args()
+    if cfg.lookup is not None:
+        print("{} {:g} {:g}".format(*lookup(cfg.config, cfg.set, cfg.lookup, cfg.reference)))
+        return
+    os.makedirs(os.path.join(cfg.outdir, "pilots"), exist_ok=True)
+    ref = (int(cfg.reference[0]), cfg.reference[1], cfg.reference[2])
+    grid = sorted({(hn, ha, hb) for hn in cfg.hn for ha in cfg.ha for hb in cfg.hb} | {ref})
+
+    names = {u: os.path.basename(u)[:-2] if u.endswith(".u") else os.path.basename(u) for u in cfg.inputs}
+    names = {u: n.split(".", 1)[0] for u, n in names.items()}
+    pilots = [(u, hn, ha, hb) for u in cfg.inputs for hn, ha, hb in grid]
+    slots = max(1, cfg.cores // cfg.procs)
+    print(f"[heating] {len(pilots)} pilots ({len(grid)} settings x {len(cfg.inputs)} files), {slots} at a time")
+    with ThreadPoolExecutor(max_workers=slots) as pool:
+        futures = [pool.submit(run_pilot, cfg, u, pilot_path(cfg.outdir, names[u], hn, ha, hb), hn, ha, hb)
+                   for u, hn, ha, hb in pilots]
+        results = [f.result() for f in futures]
+
+    by_file = {}
+    for (u, hn, ha, hb), parsed in zip(pilots, results):
+        row = {"name": names[u], "hn": hn, "ha": ha, "hb": hb, "pairs": 0, "min_swap": float("nan"),
+               "mean_swap": float("nan"), "beta_hot": float("nan"), "feasible": False,
+               "reference": (hn, ha, hb) == ref, "rates": None}
+        if parsed is not None:
+            betas, rates = parsed
+            row.update(pairs=len(rates), min_swap=float(rates.min()), mean_swap=float(rates.mean()),
+                       beta_hot=float(betas.min()), rates=rates)
+        else:
+            print(f"⚠ No valid swap table in {pilot_path(cfg.outdir, names[u], hn, ha, hb)}")
+        by_file.setdefault(names[u], []).append(row)
+
+    chosen = {}
+    for name, rows in by_file.items():
+        best, status = choose(rows, cfg.target, cfg.beta_tol)
+        ref_row = next(r for r in rows if r["reference"])
+        estimate = hn_estimate(ref_row["rates"], cfg.target) if ref_row["rates"] is not None else None
+        chosen[name] = {"hn": best["hn"], "ha": best["ha"], "hb": best["hb"],
+                        "min_swap": round(best["min_swap"], 4), "beta_hot": round(best["beta_hot"], 4),
+                        "hn_estimate": estimate, "status": status}
+        print(f"{name}: -hn {best['hn']} -ha {best['ha']:g} -hb {best['hb']:g} "
+              f"(min swap {best['min_swap']:.3f}; reference -hn {ref[0]}, estimate {chosen[name]['hn_estimate']}) "
+              f"[{status}]")
+
+    with open(os.path.join(cfg.outdir, "heating_pilots.tsv"), "w") as fh:
+        cols = ["name", "hn", "ha", "hb", "pairs", "min_swap", "mean_swap", "beta_hot", "feasible", "reference"]
+        fh.write("\t".join(cols) + "\n")
+        for rows in by_file.values():
+            for r in rows:
+                fh.write("\t".join(str(int(r[c]) if isinstance(r[c], bool) else r[c]) for c in cols) + "\n")
+    if chosen:
+        update_config(cfg.config, cfg.set, chosen)
+        print(f"✔ Heating for {len(chosen)} {cfg.set} files written to {cfg.config}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+Parse IMa3 nested-model LRT outputs (.LRT.out) and compute their p-values.
+
+Rows of IMa3's nested model table,
+    <model#>  <log(P)>  <#terms>  <df>[*]  <2LLR>
+are collected from all files of the requested sets, in parallel, into arrays
+(file, nested model, 2LLR, df, boundary flag); all p-values are then computed in
+one vectorized call. A "*" after df marks a test with parameters on the boundary of
+the parameter space (e.g. migration rates fixed at 0). Rows with df <= 0 (the full
+model itself) are not tests and are dropped.
+
+Rows kept per file (--nested):
+  - default: the row the old per-set parsers reported, nested model 2 for 2pop and
+    the first test row for 3pop
+  - N:       nested model N
+  - first:   the first test row
+  - all:     every test row (the Nested column then tells the hypotheses apart)
+
+p-values:
+  - default:          chi2.sf(2LLR, df), as the old shell parsers computed one by one
+  - --mixture starred: rows marked "*" use the chi-bar-square mixture for df
+                       boundary parameters (Self & Liang 1987),
+                           p = sum_{i=1..df} C(df, i) 2^-df chi2.sf(2LLR, i),
+                       i.e. the binomial(df, 1/2) mixture of chi2_0 .. chi2_df
+  - --mixture all:     the mixture for every row
+
+Outputs, per set S (2pop, 3pop) with files under RESULTS_DIR/LRT_outfiles_S/:
+  RESULTS_DIR/All_LRT_results_S.csv
+    Model,Replicate,Filename,2LLR,DF,p-value,Nested,Boundary
+  (Model/Replicate are the modelN/replicateN tags of the file name; the first six
+  columns are the ones plot_ima3_lrt_summary.py reads.)
+--combined FILE also writes the tab-separated table of Models/Model1/extract_LRT_values.sh
+  (Filename, 2LLR, df, p-value) over all sets.
+
+Usage:
+    python scripts/ima3_lrt.py --results_dir results/ima3 --sets 2pop 3pop [--mixture starred]
+"""
+import argparse
+import glob
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+from scipy.special import comb
+
+ROW = re.compile(r"^\s*(\d+)\s+(-?\d+\.\d+(?:[eE][-+]?\d+)?)\s+(\d+)\s+(\d+)(\*?)\s+(-?\d+\.\d+(?:[eE][-+]?\d+)?)")
+MIXTURES = ("none", "starred", "all")
+NESTED_DEFAULT = {"2pop": "2", "3pop": "first"}
+
+
+def parse_file(path, nested="all"):
+    """
+    [(nested model, 2LLR, df, boundary)] of the test rows (df > 0) of the nested model
+    table of one .LRT.out file, selected by nested (see module docstring).
+    """
+    rows = []
+    with open(path, errors="replace") as fh:
+        for line in fh:
+            m = ROW.match(line)
+            if m and int(m.group(4)) > 0:
+                rows.append((int(m.group(1)), float(m.group(6)), int(m.group(4)), m.group(5) == "*"))
+    if nested == "first":
+        return rows[:1]
+    if nested != "all":
+        return [r for r in rows if r[0] == int(nested)][:1]
+    return rows
+
+
+def parse_files(paths, jobs=None, nested="all"):
+    """
+    Parses paths on jobs processes. Returns arrays (file index, nested, llr, df, boundary),
+    one entry per selected table row, file index pointing into paths. nested is one
+    selection for all paths or a list with one per path.
+    """
+    selections = nested if isinstance(nested, list) else [nested] * len(paths)
+    if jobs == 1 or len(paths) < 2:
+        parsed = [parse_file(p, n) for p, n in zip(paths, selections)]
+    else:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            parsed = list(pool.map(parse_file, paths, selections, chunksize=16))
+    file_idx = np.array([i for i, rows in enumerate(parsed) for _ in rows], dtype=np.int64)
+    flat = [row for rows in parsed for row in rows]
+    nested, llr, df, boundary = (np.array(col) for col in zip(*flat)) if flat else (np.zeros(0, int),) * 4
+    return (file_idx, nested.astype(np.int64), llr.astype(float), df.astype(np.int64),
+            boundary.astype(bool))
+
+
+def lrt_pvalues(llr, df, boundary=None, mixture="none"):
+    """Vectorized p-values of 2LLR statistics (see module docstring for the mixture)."""
+    if mixture not in MIXTURES:
+        raise ValueError(f"Unknown mixture {mixture!r} (use one of {MIXTURES})")
+    llr = np.asarray(llr, dtype=float)
+    df = np.asarray(df, dtype=np.int64)
+    p = stats.chi2.sf(llr, df)
+    if mixture == "none" or llr.size == 0:
+        return p
+    mix = np.ones(llr.shape, dtype=bool) if mixture == "all" else np.asarray(boundary, dtype=bool)
+    if not mix.any():
+        return p
+    x, k = llr[mix], df[mix]
+    i = np.arange(1, max(int(k.max()), 1) + 1)
+    weights = comb(k[:, None], i[None, :]) / 2.0 ** k[:, None]      # 0 for i > df
+    p_mix = (weights * stats.chi2.sf(x[:, None], i[None, :])).sum(axis=1)
+    p_mix += (x <= 0) / 2.0 ** k                                     # chi2_0 point mass
+    p[mix] = np.minimum(p_mix, 1.0)
+    return p
+
+
+def tag(name, prefix):
+    m = re.search(rf"{prefix}\d+", name)
+    return m.group() if m else "NA"
+
+
+def results_table(paths, file_idx, nested, llr, df, boundary, pvals):
+    names = [os.path.basename(p) for p in paths]
+    return pd.DataFrame({
+        "Model": [tag(names[i], "model") for i in file_idx],
+        "Replicate": [tag(names[i], "replicate") for i in file_idx],
+        "Filename": [names[i] for i in file_idx],
+        "2LLR": llr,
+        "DF": df,
+        "p-value": pvals,
+        "Nested": nested,
+        "Boundary": boundary.astype(int),
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Parse IMa3 .LRT.out files and compute LRT p-values")
+    parser.add_argument("--results_dir", default="results/ima3",
+                        help="Holds LRT_outfiles_<set>/ and receives All_LRT_results_<set>.csv")
+    parser.add_argument("--sets", nargs="+", default=["2pop", "3pop"])
+    parser.add_argument("--mixture", choices=MIXTURES, default="none",
+                        help="Chi-bar-square boundary p-values for starred rows, all rows, or none")
+    parser.add_argument("--nested", default=None,
+                        help="Nested model row per file: a model number, 'first' or 'all' "
+                             "(default: 2 for 2pop, first for 3pop)")
+    parser.add_argument("--jobs", type=int, default=None, help="Parsing processes (default: all cores)")
+    parser.add_argument("--combined", default=None,
+                        help="Also write the tab-separated Filename/2LLR/df/p-value table here")
+    args = parser.parse_args()
+    if args.nested not in (None, "first", "all") and not args.nested.isdigit():
+        parser.error(f"--nested must be a model number, 'first' or 'all', not {args.nested!r}")
+
+    paths, set_of = [], []
+    for s in args.sets:
+        found = sorted(glob.glob(os.path.join(args.results_dir, f"LRT_outfiles_{s}", "*.LRT.out")))
+        paths += found
+        set_of += [s] * len(found)
+    selections = [args.nested or NESTED_DEFAULT.get(s, "all") for s in set_of]
+    file_idx, nested, llr, df, boundary = parse_files(paths, args.jobs, selections)
+    pvals = lrt_pvalues(llr, df, boundary, args.mixture)
+
+    for i in sorted(set(range(len(paths))) - set(file_idx.tolist())):
+        print(f"⚠ No valid LRT test row (nested {selections[i]}, df > 0) found in {paths[i]}")
+
+    row_set = np.array(set_of, dtype=object)[file_idx] if len(file_idx) else np.zeros(0, dtype=object)
+    for s in args.sets:
+        sel = row_set == s
+        table = results_table(paths, file_idx[sel], nested[sel], llr[sel], df[sel], boundary[sel], pvals[sel])
+        out = os.path.join(args.results_dir, f"All_LRT_results_{s}.csv")
+        table.to_csv(out, index=False, float_format="%.6g")
+        print(f"✔ Parsed {s} LRT results ({len(table)} rows from {set_of.count(s)} files) saved to {out}")
+
+    if args.combined:
+        with open(args.combined, "w") as fh:
+            fh.write("Filename\t2LLR\t df\t p-value\n")
+            for i, x, d, p in zip(file_idx, llr, df, pvals):
+                fh.write(f"{paths[i]}\t{x}\t {d}\t {p}\n")
+        print(f"Results saved to {args.combined}")
+
+
+if __name__ == "__main__":
+    main()
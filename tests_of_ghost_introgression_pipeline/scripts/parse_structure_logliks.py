@@ -4,6 +4,8 @@ import re
 import pandas as pd
 import argparse
 
+from structure_output import load_structure_f
+
 parser = argparse.ArgumentParser()
 parser.add_argument("--indir", required=True)
 parser.add_argument("--outfile", default="structure_loglik_summary.csv")
@@ -27,17 +29,12 @@ for root, dirs, files in os.walk(args.indir):
             replicate = f"replicate{match.group(2)}"
             K = int(match.group(3))
 
-            with open(full_path, 'r') as f:
-                lines = f.readlines()
-
-            logL = None
-            for line in lines:
-                if "Estimated Ln Prob of Data" in line:
-                    try:
-                        logL = float(line.strip().split("=")[-1])
-                    except ValueError:
-                        print(f"Could not parse likelihood in: {full_path}")
-                    break
+            try:
+                logL = load_structure_f(full_path)["lnprob"]
+            except ValueError:
+                logL = None
+            if logL is None:
+                print(f"Could not parse likelihood in: {full_path}")
 
             if logL is not None:
                 output_rows.append({
@@ -18,6 +18,10 @@ lrt_2pop["Test"] = "Ghost Population"
 lrt_3pop["Test"] = "Ghost Gene Flow"
 
 lrt_all = pd.concat([lrt_2pop, lrt_3pop], ignore_index=True)
+# ima3_lrt.py --nested all keeps several hypotheses per file; plot one per file and test
+if "Nested" in lrt_all.columns and lrt_all.duplicated(["Test", "Filename"]).any():
+    print("Several nested models per file; plotting the first test row of each file.")
+    lrt_all = lrt_all.drop_duplicates(["Test", "Filename"], keep="first").reset_index(drop=True)
 lrt_all["Model"] = pd.Categorical(
     lrt_all["Model"], categories=sorted(lrt_all["Model"].unique()), ordered=True
 )
@@ -5,6 +5,7 @@ set -euo pipefail
 
 FASTA=$1
 OUTFILE=$2
+SMC_TMRCA="${SMC_TMRCA:-$(dirname "$0")/../../scripts/smc_tmrca.py}"
 
 # Remove existing stats file if any
 rm -f "${FASTA}.arg.stats"
@@ -12,6 +13,6 @@ rm -f "${FASTA}.arg.stats"
 # Run Argweaver sampling
 arg-sample --fasta "$FASTA" --output "${FASTA}.arg" --sample-step 100 --verbose 0 --overwrite
 
-# Extract TMRCA
-arg-extract-tmrca "${FASTA}.arg.%d.smc.gz" > "$OUTFILE"
+# Extract TMRCA (Python 3 SMC reader; column 5 is the median TMRCA)
+python3 "$SMC_TMRCA" "${FASTA}.arg.%d.smc.gz" --out "$OUTFILE"
 
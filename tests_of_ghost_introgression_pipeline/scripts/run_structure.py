@@ -1,6 +1,15 @@
 import os
+import time
 import argparse
+import threading
 import subprocess
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from genotype_store import ensure_store, structure_dimensions
+from structure_output import parse_structure_f
+import structure_convergence
+
+MANIFEST_COLUMNS = ["K", "rep", "seed", "status", "wall_seconds", "lnprob", "f_file"]
 
 def build_mainparams(path, num_inds, num_loci, burnin, numreps):
     with open(path, "w") as f:
@@ -29,30 +38,208 @@ def build_mainparams(path, num_inds, num_loci, burnin, numreps):
 #define NUMREPS {numreps}
 """)
 
-def build_extraparams(path):
+def build_extraparams(path, randomize=True, updatefreq=None):
+    # STRUCTURE only reads '#define KEY VALUE' lines. RANDOMIZE 0 makes it use
+    # the -D seed instead of the clock; UPDATEFREQ prints Ln Like every
+    # updatefreq iterations for --monitor
     with open(path, "w") as f:
-        f.write("""INFERALPHA 1
-ALPHA 1.0
-POPALPHAS 0
-ALPHAMAX 10.0
-FREQSCORR 1
-ONEFST 0
-USEPOPINFO 0
-LOCPRIOR 0
-PRINTLIKES 0
-PRINTKLD 0
+        if not randomize:
+            f.write("#define RANDOMIZE 0\n")
+        if updatefreq:
+            f.write(f"#define UPDATEFREQ {updatefreq}\n")
+        f.write("""#define INFERALPHA 1
+#define ALPHA 1.0
+#define POPALPHAS 0
+#define ALPHAMAX 10.0
+#define FREQSCORR 1
+#define ONEFST 0
+#define USEPOPINFO 0
+#define LOCPRIOR 0
+#define PRINTLIKES 0
+#define PRINTKLD 0
 """)
 
+def monitor_updatefreq(burnin, numreps, points):
+    """UPDATEFREQ giving about `points` Ln Like rows over the whole chain."""
+    return max(1, (burnin + numreps) // max(points, 1))
+
+# Grid mode
+
+def chain_seed(seed_base, K, rep):
+    """Seed of chain rep at K; same scheme as run_structure_ppp_sampled.pbs."""
+    return seed_base + K * 1000 + rep
+
+def chain_complete(f_file, num_loci):
+    """
+    lnP(D) of a finished STRUCTURE _f file (one with lnP(D) and every locus's
+    frequencies), or None if the file is missing or incomplete.
+    """
+    if not os.path.exists(f_file):
+        return None
+    try:
+        parsed = parse_structure_f(f_file)
+    except (OSError, ValueError, IndexError):
+        return None
+    if parsed["lnprob"] is None or parsed["freqs"].shape[1] != num_loci:
+        return None
+    return parsed["lnprob"]
+
+def run_chain(structure_exec, input_file, mainparams, extraparams, outdir, K, rep, seed):
+    """Runs one STRUCTURE chain. Returns (wall seconds, lnP(D) or None)."""
+    chain_dir = os.path.join(outdir, f"K{K}", f"rep{rep}")
+    os.makedirs(chain_dir, exist_ok=True)
+    prefix = os.path.join(chain_dir, f"structure_run_K{K}")
+    cmd = [structure_exec, "-K", str(K), "-D", str(seed), "-m", mainparams, "-e", extraparams,
+           "-i", input_file, "-o", prefix]
+    start = time.time()
+    with open(os.path.join(chain_dir, "structure.stdout"), "w") as log:
+        subprocess.run(cmd, stdout=log, stderr=subprocess.STDOUT, check=True)
+    wall = time.time() - start
+    f_file = f"{prefix}_f"
+    return wall, parse_structure_f(f_file)["lnprob"] if os.path.exists(f_file) else None
+
+def monitor_grid(args, outdir, chains, stop):
+    """
+    Polls the chains' structure.stdout every --monitor_interval seconds until stop is
+    set, appending per-K R-hat/ESS rows to <outdir>/convergence.tsv, then writes the
+    final BURNIN/NUMREPS recommendation to <outdir>/recommended_params.env.
+    """
+    paths = [os.path.join(outdir, f"K{K}", f"rep{rep}", "structure.stdout") for K, rep in chains]
+    out = os.path.join(outdir, "convergence.tsv")
+    follower = structure_convergence.TraceFollower()
+
+    def poll():
+        rows = structure_convergence.summarize(follower, [p for p in paths if os.path.exists(p)],
+                                               target_ess=args.target_ess)
+        structure_convergence.write_summary(rows, out)
+        return rows
+
+    while not stop.wait(args.monitor_interval):
+        poll()
+    rows = poll()
+    env = os.path.join(outdir, "recommended_params.env")
+    if structure_convergence.write_env(rows, env):
+        for K, diag, rec in rows:
+            if diag is not None:
+                print(f"Convergence K={K}: R-hat={diag['rhat']:.3f} ESS={diag['ess']:.0f} -> "
+                      f"BURNIN={rec[0]} NUMREPS={rec[1]} ({rec[2]})")
+        print(f"Recommended settings for future runs: {env}")
+    else:
+        print(f"Convergence: not enough post-burnin samples for a recommendation; see {out}")
+
+def read_manifest(path):
+    rows = {}
+    if os.path.exists(path):
+        with open(path) as fh:
+            header = fh.readline().rstrip("\n").split("\t")
+            for line in fh:
+                row = dict(zip(header, line.rstrip("\n").split("\t")))
+                if "K" in row and "rep" in row:
+                    rows[(int(row["K"]), int(row["rep"]))] = row
+    return rows
+
+def run_grid(args, input_file, num_inds, num_loci):
+    """
+    Runs every (K, rep) chain for K_MIN..K_MAX on --cores worker slots, largest K
+    first so the slowest chains never start last. Chains whose _f file is complete are
+    skipped. Every chain gets a row in <outdir>/manifest.tsv as it finishes. With
+    --monitor the running chains are diagnosed as they go (see monitor_grid).
+    """
+    outdir = args.outdir
+    os.makedirs(outdir, exist_ok=True)
+    mainparams = os.path.join(outdir, "mainparams.txt")
+    extraparams = os.path.join(outdir, "extraparams.txt")
+    build_mainparams(mainparams, num_inds, num_loci, args.burnin, args.numreps)
+    updatefreq = monitor_updatefreq(args.burnin, args.numreps, args.monitor_points) if args.monitor else None
+    build_extraparams(extraparams, randomize=False, updatefreq=updatefreq)
+
+    manifest = args.manifest or os.path.join(outdir, "manifest.tsv")
+    previous = read_manifest(manifest)
+
+    chains = [(K, rep) for K in range(args.k_max, args.k_min - 1, -1)
+              for rep in range(1, args.reps + 1)]
+    with open(manifest, "w") as mf:
+        mf.write("\t".join(MANIFEST_COLUMNS) + "\n")
+
+        def record(K, rep, status, wall, lnprob):
+            f_file = os.path.join(outdir, f"K{K}", f"rep{rep}", f"structure_run_K{K}_f")
+            mf.write(f"{K}\t{rep}\t{chain_seed(args.seed, K, rep)}\t{status}\t{wall}\t{lnprob}\t{f_file}\n")
+            mf.flush()
+
+        pending = []
+        for K, rep in chains:
+            f_file = os.path.join(outdir, f"K{K}", f"rep{rep}", f"structure_run_K{K}_f")
+            lnprob = chain_complete(f_file, num_loci)
+            if lnprob is not None:
+                wall = previous.get((K, rep), {}).get("wall_seconds", "NA")
+                record(K, rep, "skipped", wall, lnprob)
+            else:
+                pending.append((K, rep))
+        print(f"🔧 STRUCTURE grid K={args.k_min}..{args.k_max} x {args.reps} reps: "
+              f"{len(chains) - len(pending)} complete, {len(pending)} to run on {args.cores} cores")
+
+        stop = threading.Event()
+        monitor = None
+        if args.monitor:
+            monitor = threading.Thread(target=monitor_grid, args=(args, outdir, chains, stop), daemon=True)
+            monitor.start()
+
+        failed = 0
+        with ThreadPoolExecutor(max_workers=max(1, args.cores)) as pool:
+            futures = {pool.submit(run_chain, args.structure_exec, input_file, mainparams, extraparams,
+                                   outdir, K, rep, chain_seed(args.seed, K, rep)): (K, rep)
+                       for K, rep in pending}
+            for fut in as_completed(futures):
+                K, rep = futures[fut]
+                try:
+                    wall, lnprob = fut.result()
+                except Exception as e:
+                    print(f"Chain K={K} rep={rep} failed: {e}")
+                    record(K, rep, "failed", "NA", "NA")
+                    failed += 1
+                    continue
+                record(K, rep, "done", f"{wall:.1f}", lnprob)
+                print(f"Chain K={K} rep={rep}: lnP(D)={lnprob} in {wall:.0f}s")
+
+        if monitor is not None:
+            stop.set()
+            monitor.join()
+
+    print(f"STRUCTURE grid complete: manifest {manifest}")
+    return failed
+
 def main():
-    parser = argparse.ArgumentParser(description="Run STRUCTURE for a given replicate and K.")
+    parser = argparse.ArgumentParser(description="Run STRUCTURE for a given replicate and K, "
+                                                 "or a K x replicate grid with --grid.")
     parser.add_argument("--input", required=True, help="Input .str file")
     parser.add_argument("--outdir", required=True, help="Output directory for this STRUCTURE run")
     parser.add_argument("--structure_exec", required=True, help="Path to STRUCTURE executable")
-    parser.add_argument("--K", type=int, required=True, help="Number of clusters (K)")
+    parser.add_argument("--K", type=int, help="Number of clusters (K); single-run mode")
     parser.add_argument("--burnin", type=int, default=100000)
     parser.add_argument("--numreps", type=int, default=500000)
+    parser.add_argument("--grid", action="store_true",
+                        help="Run chains for K_MIN..K_MAX x REPS under <outdir>/K{K}/rep{rep}/")
+    parser.add_argument("--k_min", type=int, default=1)
+    parser.add_argument("--k_max", type=int, default=6)
+    parser.add_argument("--reps", type=int, default=5, help="Chains per K in --grid mode")
+    parser.add_argument("--cores", type=int, default=os.cpu_count() or 1,
+                        help="Concurrent STRUCTURE chains in --grid mode")
+    parser.add_argument("--seed", type=int, default=12345,
+                        help="Seed base; chain seed = seed + 1000*K + rep")
+    parser.add_argument("--manifest", default=None, help="Grid manifest (default <outdir>/manifest.tsv)")
+    parser.add_argument("--monitor", action="store_true",
+                        help="Print Ln Like periodically (UPDATEFREQ); in --grid mode also track "
+                             "R-hat/ESS per K and recommend BURNIN/NUMREPS")
+    parser.add_argument("--monitor_points", type=int, default=2000,
+                        help="Ln Like rows per chain with --monitor")
+    parser.add_argument("--monitor_interval", type=float, default=300,
+                        help="Seconds between convergence polls in --grid mode")
+    parser.add_argument("--target_ess", type=float, default=400,
+                        help="Effective sample size the NUMREPS recommendation aims for")
 
     args = parser.parse_args()
+    if not args.grid and args.K is None:
+        parser.error("--K is required unless --grid is given")
 
     input_file = args.input
     K = args.K
@@ -63,17 +250,19 @@ def main():
 
     os.makedirs(outdir, exist_ok=True)
 
-    with open(input_file) as f:
-        lines = [l.strip() for l in f if l.strip()]
-        num_inds = len(lines)
-        num_loci = len(lines[0].split()) - 1
+    ensure_store(input_file)
+    num_inds, num_loci = structure_dimensions(input_file)
+
+    if args.grid:
+        raise SystemExit(1 if run_grid(args, input_file, num_inds, num_loci) else 0)
 
     mainparams = os.path.join(outdir, "mainparams.txt")
     extraparams = os.path.join(outdir, "extraparams.txt")
     output_prefix = os.path.join(outdir, f"structure_run_K{K}")  # STRUCTURE appends _f
 
     build_mainparams(mainparams, num_inds, num_loci, burnin, numreps)
-    build_extraparams(extraparams)
+    build_extraparams(extraparams, updatefreq=monitor_updatefreq(burnin, numreps, args.monitor_points)
+                      if args.monitor else None)
 
     cmd = [
         structure_exec,
@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+"""
+Online convergence monitoring for STRUCTURE chains.
+
+With UPDATEFREQ set (see run_structure.py --monitor), STRUCTURE prints a row every
+UPDATEFREQ iterations under a header such as
+
+     Rep#:    Alpha     Ln Like  Est Ln P(D)
+     1000:    0.043    -8123     --
+    ...
+    BURNIN completed
+    50000:    0.031    -7950     -8012
+
+TraceFollower reads the chains' stdout files incrementally while they run (it keeps a
+byte offset per file) and collects (iteration, Ln Like) pairs, split at "BURNIN
+completed". For the chains at the same K, diagnose() computes
+  - split R-hat (Gelman et al. 2013) of the post-burnin Ln Like traces, and
+  - the multi-chain effective sample size, with autocorrelations combined across
+    chains and truncated by Geyer's initial positive sequence,
+on the samples every chain has reached so far. recommend() turns that into
+BURNIN/NUMREPS settings for future runs: NUMREPS long enough for target_ess
+effective samples, and BURNIN a safety factor past the point where every chain's
+Ln Like first reaches the bulk of the pooled post-burnin distribution. If R-hat is
+still above its threshold the chains have not mixed and NUMREPS is doubled instead.
+
+Command line (also used by run_structure_ppp_sampled.pbs):
+    python structure_convergence.py --chains 'results/K*/rep*/structure.stdout' \\
+        --out convergence.tsv [--watch --interval 300] [--env_out next_run.env]
+"""
+import argparse
+import glob
+import math
+import os
+import re
+import sys
+import time
+
+import numpy as np
+
+_ROW = re.compile(r"^\s*(\d+):\s+(.*)$")
+_K_DIR = re.compile(r"K(\d+)")
+
+
+class ChainTrace:
+    """Ln Like trace of one chain, filled incrementally from its stdout."""
+
+    def __init__(self):
+        self.burnin = []        # (iteration, lnlike) before "BURNIN completed"
+        self.sampling = []      # (iteration, lnlike) after
+        self.trailing = None    # columns after "Ln Like" in the current header
+        self.in_burnin = True
+
+    def feed(self, line):
+        stripped = line.strip()
+        if "BURNIN completed" in stripped:
+            self.in_burnin = False
+            return
+        if stripped.startswith("Rep#:"):
+            # Count from the right: the columns before Ln Like (Alpha, F1..FK, ...)
+            # vary with the model, the ones after it (Est Ln P(D)) do not
+            if "Ln Like" not in stripped:
+                self.trailing = None
+            else:
+                after = stripped.split("Ln Like", 1)[1].strip()
+                self.trailing = len(re.split(r"\s{2,}", after)) if after else 0
+            return
+        m = _ROW.match(line)
+        if not m or self.trailing is None:
+            return
+        values = m.group(2).split()
+        if len(values) <= self.trailing:
+            return
+        try:
+            ll = float(values[-1 - self.trailing])
+        except ValueError:
+            return
+        (self.burnin if self.in_burnin else self.sampling).append((int(m.group(1)), ll))
+
+
+class TraceFollower:
+    """Reads growing stdout files from where the last poll stopped."""
+
+    def __init__(self):
+        self.traces = {}
+        self._offsets = {}
+        self._partial = {}
+
+    def poll(self, paths):
+        for path in paths:
+            trace = self.traces.setdefault(path, ChainTrace())
+            try:
+                if os.path.getsize(path) < self._offsets.get(path, 0):
+                    # Truncated: the chain was restarted
+                    trace = self.traces[path] = ChainTrace()
+                    self._offsets[path] = 0
+                    self._partial.pop(path, None)
+                with open(path) as fh:
+                    fh.seek(self._offsets.get(path, 0))
+                    chunk = fh.read()
+                    self._offsets[path] = fh.tell()
+            except OSError:
+                continue
+            text = self._partial.pop(path, "") + chunk
+            lines = text.split("\n")
+            # Keep an unfinished last line for the next poll
+            if lines and not text.endswith("\n"):
+                self._partial[path] = lines.pop()
+            for line in lines:
+                trace.feed(line)
+        return self.traces
+
+
+def chain_k(path):
+    """K of a chain from a .../K{K}/rep{rep}/structure.stdout path."""
+    for part in reversed(os.path.normpath(path).split(os.sep)):
+        m = _K_DIR.fullmatch(part)
+        if m:
+            return int(m.group(1))
+    return None
+
+
+# Diagnostics
+
+def _autocov(x):
+    n = len(x)
+    x = x - x.mean()
+    f = np.fft.rfft(x, n=2 * n)
+    acov = np.fft.irfft(f * np.conj(f))[:n] / n
+    return acov
+
+
+def split_rhat(chains):
+    """Split R-hat of an (m, n) array of equal-length traces."""
+    chains = np.asarray(chains, dtype=float)
+    half = chains.shape[1] // 2
+    split = np.concatenate([chains[:, :half], chains[:, half:2 * half]])
+    n = split.shape[1]
+    W = split.var(axis=1, ddof=1).mean()
+    B = n * split.mean(axis=1).var(ddof=1)
+    if W == 0:
+        return float("nan")
+    var_hat = (n - 1) / n * W + B / n
+    return float(np.sqrt(var_hat / W))
+
+
+def ess(chains):
+    """Multi-chain effective sample size of an (m, n) array of traces."""
+    chains = np.asarray(chains, dtype=float)
+    m, n = chains.shape
+    acov = np.array([_autocov(c) for c in chains])
+    W = acov[:, 0].mean() * n / (n - 1)
+    var_hat = W * (n - 1) / n + (chains.mean(axis=1).var(ddof=1) if m > 1 else 0)
+    if var_hat <= 0:
+        return float("nan")
+    rho = 1 - (W - acov.mean(axis=0)) / var_hat
+    rho[0] = 1.0
+    # Geyer: sum pairs rho[2t] + rho[2t+1] while positive
+    total = 0.0
+    for t in range(0, n - 1, 2):
+        pair = rho[t] + rho[t + 1]
+        if pair <= 0:
+            break
+        total += pair
+    tau = max(2 * total - 1, 1e-12)
+    return float(min(m * n / tau, m * n * math.log10(max(m * n, 10))))
+
+
+def diagnose(traces, min_samples=20):
+    """
+    Diagnostics for chains of one K. traces: list of ChainTrace.
+    Returns a dict (n_chains, n_samples, spacing, rhat, ess, ...) or None when fewer
+    than two chains have min_samples post-burnin samples.
+    """
+    ready = [t for t in traces if len(t.sampling) >= min_samples]
+    if len(ready) < 2:
+        return None
+    n = min(len(t.sampling) for t in ready)
+    arr = np.array([[ll for _, ll in t.sampling[:n]] for t in ready])
+    iters = np.array([it for it, _ in ready[0].sampling[:n]])
+    spacing = int(np.median(np.diff(iters))) if n > 1 else 1
+    return {
+        "n_chains": len(ready),
+        "n_samples": n,
+        "spacing": max(spacing, 1),
+        "sampled_iterations": int(iters[-1] - iters[0] + spacing),
+        "rhat": split_rhat(arr),
+        "ess": ess(arr),
+        "mean_lnlike": float(arr.mean()),
+        "pooled_q05": float(np.quantile(arr, 0.05)),
+        "chains": ready,
+    }
+
+
+def recommend(diag, target_ess=400, rhat_max=1.05, burnin_safety=2.0):
+    """
+    BURNIN/NUMREPS for future runs at this K from diagnose() output.
+    Returns (burnin, numreps, note).
+    """
+    spacing = diag["spacing"]
+    # Burn-in: latest first-entry into the pooled post-burnin bulk, times a safety factor
+    entry = 0
+    for t in diag["chains"]:
+        trace = t.burnin + t.sampling
+        hit = next((it for it, ll in trace if ll >= diag["pooled_q05"]), trace[-1][0])
+        entry = max(entry, hit)
+    burnin = int(math.ceil(burnin_safety * entry / spacing) * spacing)
+
+    per_sample = diag["ess"] / (diag["n_chains"] * diag["n_samples"])
+    if not diag["rhat"] < rhat_max:
+        return burnin, 2 * diag["sampled_iterations"], \
+            f"R-hat {diag['rhat']:.3f} >= {rhat_max}: chains not mixed, run longer"
+    samples = math.ceil(target_ess / max(per_sample, 1e-12) / diag["n_chains"])
+    numreps = int(samples * spacing)
+    return burnin, numreps, f"ESS {diag['ess']:.0f} from {diag['n_chains']} chains"
+
+
+def summarize(follower, paths, min_samples=20, target_ess=400, rhat_max=1.05):
+    """Polls paths and returns [(K, diag or None, recommendation or None)] sorted by K."""
+    traces = follower.poll(paths)
+    by_k = {}
+    for path in paths:
+        by_k.setdefault(chain_k(path), []).append(traces[path])
+    rows = []
+    for K in sorted(k for k in by_k if k is not None):
+        diag = diagnose(by_k[K], min_samples)
+        rec = recommend(diag, target_ess, rhat_max) if diag else None
+        rows.append((K, diag, rec))
+    return rows
+
+
+SUMMARY_COLUMNS = ["time", "K", "n_chains", "n_samples", "rhat", "ess", "rec_burnin", "rec_numreps", "note"]
+
+
+def write_summary(rows, out, append=True):
+    new = not os.path.exists(out) or not append
+    with open(out, "a" if append else "w") as fh:
+        if new:
+            fh.write("\t".join(SUMMARY_COLUMNS) + "\n")
+        stamp = time.strftime("%Y-%m-%dT%H:%M:%S")
+        for K, diag, rec in rows:
+            if diag is None:
+                fh.write(f"{stamp}\t{K}\tNA\tNA\tNA\tNA\tNA\tNA\twaiting for samples\n")
+                continue
+            burnin, numreps, note = rec
+            fh.write(f"{stamp}\t{K}\t{diag['n_chains']}\t{diag['n_samples']}\t{diag['rhat']:.4f}\t"
+                     f"{diag['ess']:.1f}\t{burnin}\t{numreps}\t{note}\n")
+
+
+def write_env(rows, path):
+    """
+    BURNIN/NUMREPS covering every K (the largest recommendation), as KEY=VALUE lines
+    that the PBS script or qsub -v can reuse for the next run.
+    """
+    recs = [rec for _, diag, rec in rows if rec is not None]
+    if not recs:
+        return False
+    with open(path, "w") as fh:
+        fh.write(f"BURNIN={max(r[0] for r in recs)}\nNUMREPS={max(r[1] for r in recs)}\n")
+    return True
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="R-hat/ESS monitoring of STRUCTURE chains.")
+    parser.add_argument("--chains", nargs="+", required=True,
+                        help="stdout files or glob patterns (.../K{K}/rep{rep}/structure.stdout)")
+    parser.add_argument("--out", default="convergence.tsv")
+    parser.add_argument("--watch", action="store_true", help="Keep polling until interrupted")
+    parser.add_argument("--interval", type=float, default=300, help="Seconds between polls with --watch")
+    parser.add_argument("--min_samples", type=int, default=20)
+    parser.add_argument("--target_ess", type=float, default=400)
+    parser.add_argument("--rhat_max", type=float, default=1.05)
+    parser.add_argument("--env_out", default=None, help="Write recommended BURNIN/NUMREPS here")
+    args = parser.parse_args(argv)
+
+    follower = TraceFollower()
+
+    def poll():
+        paths = sorted({p for pattern in args.chains for p in (glob.glob(pattern) or [pattern])
+                        if os.path.exists(p)})
+        rows = summarize(follower, paths, args.min_samples, args.target_ess, args.rhat_max)
+        write_summary(rows, args.out)
+        if args.env_out:
+            write_env(rows, args.env_out)
+        return rows
+
+    try:
+        rows = poll()
+        while args.watch:
+            time.sleep(args.interval)
+            rows = poll()
+    except KeyboardInterrupt:
+        pass
+
+    for K, diag, rec in rows:
+        if diag is None:
+            print(f"K={K}: not enough post-burnin samples yet")
+        else:
+            print(f"K={K}: R-hat={diag['rhat']:.3f} ESS={diag['ess']:.0f} -> "
+                  f"BURNIN={rec[0]} NUMREPS={rec[1]} ({rec[2]})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+"""
+Single-pass parser for STRUCTURE `_f` output files, with an on-disk parse cache.
+
+parse_structure_f() streams the file once and fills NumPy arrays in place:
+  - q:        (I, K) inferred ancestry of individuals
+  - freqs:    (K, L, A) estimated allele frequencies per cluster; alleles of each
+              locus are ordered by allele code, missing alleles are 0
+  - allele_labels: (L, A) allele codes matching freqs, -1 where a locus has fewer alleles
+  - lnprob, mean_lnlik, var_lnlik: the likelihood summary lines
+  - params:   run parameters ("Run parameters:" block and the trailing
+              "Values of parameters used in structure:" KEY=VALUE list)
+
+load_structure_f() wraps the parser with a compressed .npz cache stored next to the
+`_f` file (`.<name>.cache.npz`). The cache records the source path, size and mtime and
+is only reused when all three still match, so every consumer in a pipeline run
+(log-likelihood summary, AIC/BIC, bootstrap LRT) parses each file once.
+"""
+import json
+import os
+
+import numpy as np
+
+CACHE_VERSION = 1
+
+# Lines inside "Run parameters:" look like "   100 individuals"
+_RUN_PARAM_KEYS = {
+    "individuals": "NUMINDS",
+    "loci": "NUMLOCI",
+    "populations assumed": "MAXPOPS",
+    "Burn-in period": "BURNIN",
+    "Reps": "NUMREPS",
+}
+
+
+def _number(text):
+    try:
+        value = float(text)
+    except ValueError:
+        return text
+    return int(value) if value.is_integer() and "." not in text else value
+
+
+def _grow(arr, axis, size):
+    """Return arr padded with zeros along axis so it has at least `size` entries."""
+    if arr.shape[axis] >= size:
+        return arr
+    new_size = max(size, 2 * arr.shape[axis])
+    pad = [(0, 0)] * arr.ndim
+    pad[axis] = (0, new_size - arr.shape[axis])
+    fill = -1 if arr.dtype.kind == "i" else 0
+    return np.pad(arr, pad, constant_values=fill)
+
+
+def parse_structure_f(path):
+    """Parse a STRUCTURE `_f` file in one pass. Returns a dict (see module docstring)."""
+    params = {}
+    lnprob = mean_lnlik = var_lnlik = None
+    q_rows = []
+    freqs = labels = None
+    locus = -1
+    slot = 0
+    section = None
+
+    with open(path) as fh:
+        for line in fh:
+            stripped = line.strip()
+
+            if section == "freqs":
+                if stripped.startswith("Locus"):
+                    locus += 1
+                    slot = 0
+                    continue
+                if stripped.startswith("Values of parameters used"):
+                    section = "values"
+                    continue
+                parts = stripped.split()
+                if len(parts) >= 3 and parts[0].lstrip("-").isdigit():
+                    if freqs is None:
+                        # Cluster count from the Q matrix; the optional "(p)" column
+                        # holds ancestral frequencies and is not a cluster
+                        K = len(q_rows[0]) if q_rows else len(parts) - 1 - parts[1].startswith("(")
+                        L = int(params.get("NUMLOCI", 0)) or 1024
+                        freqs = np.zeros((K, L, 2))
+                        labels = np.full((L, 2), -1, dtype=np.int64)
+                    K = freqs.shape[0]
+                    if locus >= freqs.shape[1]:
+                        freqs = _grow(freqs, 1, locus + 1)
+                        labels = _grow(labels, 0, locus + 1)
+                    if slot >= freqs.shape[2]:
+                        freqs = _grow(freqs, 2, slot + 1)
+                        labels = _grow(labels, 1, slot + 1)
+                    try:
+                        freqs[:, locus, slot] = [float(x) for x in parts[-K:]]
+                        labels[locus, slot] = int(parts[0])
+                    except ValueError:
+                        continue
+                    slot += 1
+                continue
+
+            if section == "q":
+                if "Estimated Allele Frequencies in each cluster" in stripped:
+                    section = "freqs"
+                    continue
+                if not stripped or "Label" in stripped or ":" not in stripped:
+                    continue
+                try:
+                    q_rows.append([float(x) for x in stripped.split(":")[-1].split()])
+                except ValueError:
+                    continue
+                continue
+
+            if section == "values":
+                for item in stripped.split(","):
+                    key, sep, value = item.strip().partition("=")
+                    if sep:
+                        params[key.strip()] = _number(value.strip())
+                continue
+
+            if "Inferred ancestry of individuals" in stripped:
+                section = "q"
+            elif stripped.startswith("Run parameters"):
+                section = "run"
+            elif stripped.startswith("Estimated Ln Prob of Data"):
+                lnprob = float(stripped.split("=")[-1])
+            elif stripped.startswith("Mean value of ln likelihood"):
+                mean_lnlik = float(stripped.split("=")[-1])
+            elif stripped.startswith("Variance of ln likelihood"):
+                var_lnlik = float(stripped.split("=")[-1])
+            elif section == "run" and stripped:
+                value, _, name = stripped.partition(" ")
+                if name.strip() in _RUN_PARAM_KEYS:
+                    params[_RUN_PARAM_KEYS[name.strip()]] = _number(value)
+
+    q = np.array(q_rows, dtype=float)
+    if freqs is None:
+        freqs = np.zeros((q.shape[1] if q.ndim == 2 else 0, 0, 2))
+        labels = np.full((0, 2), -1, dtype=np.int64)
+    n_loci = locus + 1
+    freqs = freqs[:, :n_loci]
+    labels = labels[:n_loci]
+
+    # Order each locus's alleles by allele code, keeping unused slots last
+    order = np.argsort(np.where(labels < 0, np.iinfo(np.int64).max, labels), axis=1, kind="stable")
+    labels = np.take_along_axis(labels, order, axis=1)
+    freqs = np.take_along_axis(freqs, order[None, :, :], axis=2)
+
+    return {
+        "q": q,
+        "freqs": freqs,
+        "allele_labels": labels,
+        "lnprob": lnprob,
+        "mean_lnlik": mean_lnlik,
+        "var_lnlik": var_lnlik,
+        "params": params,
+    }
+
+
+def cache_path(path):
+    """Location of the parse cache for a STRUCTURE `_f` file."""
+    dirname, basename = os.path.split(path)
+    return os.path.join(dirname, f".{basename}.cache.npz")
+
+
+def _cache_key(path):
+    st = os.stat(path)
+    return os.path.abspath(path), st.st_size, st.st_mtime_ns
+
+
+def _read_cache(path, key):
+    try:
+        with np.load(cache_path(path), allow_pickle=False) as z:
+            if (int(z["version"]) != CACHE_VERSION or str(z["source"]) != key[0]
+                    or int(z["size"]) != key[1] or int(z["mtime_ns"]) != key[2]):
+                return None
+            meta = json.loads(str(z["meta"]))
+            return {
+                "q": z["q"],
+                "freqs": z["freqs"],
+                "allele_labels": z["allele_labels"],
+                **meta,
+            }
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+def _write_cache(path, key, parsed):
+    meta = {k: parsed[k] for k in ("lnprob", "mean_lnlik", "var_lnlik", "params")}
+    target = cache_path(path)
+    tmp = f"{target}.{os.getpid()}.tmp"
+    try:
+        with open(tmp, "wb") as fh:
+            np.savez_compressed(
+                fh,
+                version=CACHE_VERSION,
+                source=key[0],
+                size=key[1],
+                mtime_ns=key[2],
+                meta=json.dumps(meta),
+                q=parsed["q"],
+                freqs=parsed["freqs"],
+                allele_labels=parsed["allele_labels"],
+            )
+        os.replace(tmp, target)
+    except OSError:
+        # A read-only output directory just means no cache
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def load_structure_f(path, use_cache=True):
+    """Parse a STRUCTURE `_f` file, reusing the on-disk cache when it is current."""
+    if not use_cache:
+        return parse_structure_f(path)
+    key = _cache_key(path)
+    parsed = _read_cache(path, key)
+    if parsed is None:
+        parsed = parse_structure_f(path)
+        _write_cache(path, key, parsed)
+    return parsed